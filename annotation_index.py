@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+annotation_index.py
+--------------------
+Sidecar index cho file COCO (<split>.json) + rel.json, kiểu index của pycocotools COCO nhưng lưu sẵn ra đĩa:
+- mỗi ảnh: file_name, width, height, category_ids, dải annotation và vị trí byte của các annotation
+  trong file COCO, vị trí byte của danh sách quan hệ trong rel.json;
+- AnnotationIndex đọc sidecar (nhỏ) rồi truy cập O(1) annotation / quan hệ của 1 ảnh bằng seek + parse
+  đúng đoạn JSON của ảnh đó, không cần nạp và dựng lại index cho cả file.
+
+Vị trí byte được tìm bằng bộ quét token JSON (chuỗi + ký tự cấu trúc) nên dùng được với file
+ghi bằng json.dump bất kỳ kiểu indent / xuống dòng (kể cả CRLF).
+
+Sử dụng:
+  python annotation_index.py --coco datasets/val.json --rel datasets/rel.json --split val
+  -> datasets/val.index.json
+"""
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+FORMAT_VERSION = 1
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}:,]')
+_WS = b" \t\r\n"
+
+Span = Tuple[int, int]
+
+
+def _strip(data: bytes, s: int, e: int) -> Span:
+    while s < e and data[s] in _WS:
+        s += 1
+    while e > s and data[e - 1] in _WS:
+        e -= 1
+    return s, e
+
+
+def child_spans(data: bytes, path: Sequence[str]) -> Union[List[Span], Dict[str, Span], None]:
+    """
+    Vị trí byte [start, end) của từng phần tử con của container tại `path` (dãy key từ gốc).
+    Container là list -> list span; là dict -> {key: span của value}. None nếu không có path.
+    """
+    path = list(path)
+    stack: List[Dict[str, Any]] = []
+    result: Union[List[Span], Dict[str, Span], None] = None
+    for m in _TOKEN.finditer(data):
+        tok = m.group()
+        c = tok[0]
+        top = stack[-1] if stack else None
+        if c == 0x22:  # chuỗi: là key nếu đang chờ key của dict
+            if top is not None and top["expect_key"]:
+                top["key"] = json.loads(tok)
+                top["expect_key"] = False
+            continue
+        if c in (0x7B, 0x5B):  # { [
+            depth = len(stack)
+            on_path = top is None or (
+                top["on_path"] and top["kind"] == 0x7B and depth <= len(path) and top["key"] == path[depth - 1]
+            )
+            frame = {"kind": c, "on_path": on_path, "key": None, "expect_key": c == 0x7B,
+                     "start": m.end(), "target": on_path and depth == len(path)}
+            if frame["target"]:
+                result = {} if c == 0x7B else []
+            stack.append(frame)
+            continue
+        if top is None:
+            continue
+        if c == 0x3A:  # ':' -> bắt đầu value
+            top["start"] = m.end()
+            continue
+        # ',' '}' ']' -> kết thúc 1 phần tử con của top
+        if top["target"]:
+            s, e = _strip(data, top["start"], m.start())
+            if e > s:
+                if top["kind"] == 0x7B:
+                    result[top["key"]] = (s, e)
+                else:
+                    result.append((s, e))
+        if c == 0x2C:
+            if top["kind"] == 0x7B:
+                top["expect_key"] = True
+            else:
+                top["start"] = m.end()
+        else:
+            frame = stack.pop()
+            if frame["target"]:
+                return result
+    return result
+
+
+def _runs(indices: List[int]) -> List[Tuple[int, int]]:
+    """[3,4,5,9] -> [(3,6), (9,10)]: gom chỉ số liên tiếp thành dải."""
+    runs: List[Tuple[int, int]] = []
+    for i in indices:
+        if runs and runs[-1][1] == i:
+            runs[-1] = (runs[-1][0], i + 1)
+        else:
+            runs.append((i, i + 1))
+    return runs
+
+
+def _file_sig(path: Path) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def default_index_path(coco_path: Union[str, Path]) -> Path:
+    p = Path(coco_path)
+    return p.with_name(p.stem + ".index.json")
+
+
+def build_index(coco_path: Union[str, Path], rel_path: Optional[Union[str, Path]] = None,
+                split: Optional[str] = None, index_path: Optional[Union[str, Path]] = None) -> Path:
+    """Dựng sidecar index cho 1 file COCO (và phần `split` của rel.json nếu có); trả về đường dẫn sidecar."""
+    coco_path = Path(coco_path)
+    index_path = Path(index_path) if index_path else default_index_path(coco_path)
+    data = coco_path.read_bytes()
+    coco = json.loads(data)
+    ann_spans = child_spans(data, ["annotations"]) or []
+    if len(ann_spans) != len(coco.get("annotations", [])):
+        raise ValueError(f"Cannot locate annotations in {coco_path}")
+
+    images = coco.get("images", [])
+    id2idx = {img["id"]: i for i, img in enumerate(images)}
+    anns_of: List[List[int]] = [[] for _ in images]
+    for k, a in enumerate(coco.get("annotations", [])):
+        i = id2idx.get(a["image_id"])
+        if i is not None:
+            anns_of[i].append(k)
+
+    rel_spans: Dict[str, Span] = {}
+    if rel_path is not None and split is not None:
+        rel_spans = child_spans(Path(rel_path).read_bytes(), [split]) or {}
+
+    anns = coco.get("annotations", [])
+    index: Dict[str, Any] = {
+        "format_version": FORMAT_VERSION,
+        "coco_file": os.path.relpath(coco_path, index_path.parent),
+        "coco_sig": _file_sig(coco_path),
+        "rel_file": os.path.relpath(rel_path, index_path.parent) if rel_path is not None else None,
+        "rel_sig": _file_sig(Path(rel_path)) if rel_path is not None else None,
+        "split": split,
+        "categories": coco.get("categories", []),
+        "image_ids": [img["id"] for img in images],
+        "file_names": [img.get("file_name") for img in images],
+        "widths": [img.get("width") for img in images],
+        "heights": [img.get("height") for img in images],
+        "category_ids": [[anns[k]["category_id"] for k in ks] for ks in anns_of],
+        # dải chỉ số annotation + dải byte tương ứng (file do converter ghi: 1 dải / ảnh)
+        "ann_ranges": [[list(r) for r in _runs(ks)] for ks in anns_of],
+        "ann_bytes": [[[ann_spans[r0][0], ann_spans[r1 - 1][1]] for r0, r1 in _runs(ks)] for ks in anns_of],
+        "rel_bytes": [list(rel_spans[str(img["id"])]) if str(img["id"]) in rel_spans else None for img in images],
+    }
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    return index_path
+
+
+class AnnotationIndex:
+    """
+    Reader cho sidecar: thông tin ảnh / category_ids lấy thẳng từ sidecar; annotation và quan hệ của 1 ảnh
+    đọc bằng seek + parse đúng đoạn byte của ảnh đó. check=True: báo lỗi nếu file COCO / rel.json đã đổi sau khi
+    dựng index.
+    """
+
+    def __init__(self, index_path: Union[str, Path], check: bool = True):
+        self.index_path = Path(index_path)
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            self.idx = json.load(f)
+        base = self.index_path.parent
+        self.coco_path = base / self.idx["coco_file"]
+        self.rel_path = base / self.idx["rel_file"] if self.idx.get("rel_file") else None
+        if check:
+            if _file_sig(self.coco_path) != self.idx["coco_sig"]:
+                raise ValueError(f"Stale index {self.index_path}: {self.coco_path} changed, rebuild it")
+            if self.rel_path is not None and _file_sig(self.rel_path) != self.idx["rel_sig"]:
+                raise ValueError(f"Stale index {self.index_path}: {self.rel_path} changed, rebuild it")
+        self.image_ids: List[int] = self.idx["image_ids"]
+        self._pos = {iid: i for i, iid in enumerate(self.image_ids)}
+        self.categories = {c["id"]: c for c in self.idx.get("categories", [])}
+        self._coco_f = None
+        self._rel_f = None
+
+    def __len__(self) -> int:
+        return len(self.image_ids)
+
+    def __contains__(self, image_id) -> bool:
+        return image_id in self._pos
+
+    def _i(self, image_id) -> int:
+        return self._pos[image_id]
+
+    def image_info(self, image_id) -> Dict[str, Any]:
+        i = self._i(image_id)
+        return {"id": image_id, "file_name": self.idx["file_names"][i],
+                "width": self.idx["widths"][i], "height": self.idx["heights"][i]}
+
+    def category_ids(self, image_id) -> List[int]:
+        return self.idx["category_ids"][self._i(image_id)]
+
+    def ann_ids(self, image_id) -> List[int]:
+        """Chỉ số annotation (vị trí trong mảng annotations của file COCO)."""
+        return [k for r0, r1 in self.idx["ann_ranges"][self._i(image_id)] for k in range(r0, r1)]
+
+    @staticmethod
+    def _read(f, start: int, end: int) -> bytes:
+        f.seek(start)
+        return f.read(end - start)
+
+    def annotations(self, image_id) -> List[Dict[str, Any]]:
+        if self._coco_f is None:
+            self._coco_f = open(self.coco_path, "rb")
+        out: List[Dict[str, Any]] = []
+        for s, e in self.idx["ann_bytes"][self._i(image_id)]:
+            out.extend(json.loads(b"[" + self._read(self._coco_f, s, e) + b"]"))
+        return out
+
+    def relations(self, image_id) -> List[List[int]]:
+        span = self.idx["rel_bytes"][self._i(image_id)]
+        if span is None or self.rel_path is None:
+            return []
+        if self._rel_f is None:
+            self._rel_f = open(self.rel_path, "rb")
+        return json.loads(self._read(self._rel_f, *span))
+
+    def close(self):
+        for f in (self._coco_f, self._rel_f):
+            if f is not None:
+                f.close()
+        self._coco_f = self._rel_f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build a persisted annotation index sidecar for a COCO-format file.")
+    ap.add_argument("--coco", required=True, help="File COCO (<split>.json)")
+    ap.add_argument("--rel", default=None, help="rel.json gộp (tuỳ chọn)")
+    ap.add_argument("--split", default=None, help="Tên split trong rel.json (bắt buộc nếu có --rel)")
+    ap.add_argument("--out", default=None, help="Đường dẫn sidecar (mặc định <coco>.index.json)")
+    args = ap.parse_args()
+    if args.rel and not args.split:
+        ap.error("--split is required with --rel")
+    path = build_index(args.coco, args.rel, args.split, args.out)
+    print(f"✅ Đã lưu index: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+bench_dataset.py
+--------------------
+Đo thông lượng (sample/giây) của VietSGGDataset qua torch DataLoader với 0..N worker.
+Mỗi cấu hình chạy --epochs epoch với worker giữ nguyên (persistent_workers) -> epoch đầu là decode lạnh,
+các epoch sau cho thấy tác dụng của LRU (--cache-size) khi cache đủ chứa phần dataset của mỗi worker.
+
+Không truyền --coco thì sinh dataset tổng hợp (synth_dataset.py) kèm ảnh placeholder vào thư mục tạm.
+
+Sử dụng:
+  python benchmarks/bench_dataset.py --images 500 --workers 0,2,4 --cache-size 0
+  python benchmarks/bench_dataset.py --coco datasets/val.json --rel datasets/rel.json --split val \
+      --images-dir coco_uitvic_test --workers 0,4,8 --max-size 800 --cache-size 512 --epochs 2
+"""
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from vietsgg_dataset import VietSGGDataset, collate_list  # noqa: E402
+
+
+def make_fixture(n: int, work_dir: str, seed: int) -> Dict[str, str]:
+    import synth_dataset
+
+    images_dir = str(Path(work_dir) / "images")
+    meta = synth_dataset.generate(synth_dataset.fit(seed=seed), n, work_dir, ["coco"], seed=seed,
+                                  split="train", images_dir=images_dir, prefix="bench")
+    return {"coco": meta["outputs"]["coco"], "rel": meta["outputs"]["rel"], "split": "train",
+            "images_dir": images_dir}
+
+
+def run_config(ds: VietSGGDataset, workers: int, batch_size: int, epochs: int) -> Dict[str, Any]:
+    """Thời gian + sample/giây từng epoch cho 1 số worker (LRU xoá trước mỗi cấu hình -> worker không thừa hưởng cache)."""
+    ds.clear_cache()
+    epoch_stats = []
+    try:
+        from torch.utils.data import DataLoader
+    except ImportError:
+        if workers:
+            raise
+        DataLoader = None
+
+    if DataLoader is not None:
+        loader = DataLoader(ds, batch_size=batch_size, num_workers=workers, collate_fn=collate_list,
+                            persistent_workers=workers > 0, shuffle=False)
+        batches = lambda: iter(loader)
+    else:  # không có torch: duyệt tuần tự (tương đương num_workers=0)
+        batches = lambda: ([ds[j] for j in range(i, min(i + batch_size, len(ds)))]
+                           for i in range(0, len(ds), batch_size))
+
+    for _ in range(epochs):
+        n = 0
+        t0 = time.perf_counter()
+        for batch in batches():
+            n += len(batch)
+        dt = time.perf_counter() - t0
+        epoch_stats.append({"seconds": round(dt, 4), "samples_per_sec": round(n / dt, 1) if dt else None})
+    return {"workers": workers, "epochs": epoch_stats}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark VietSGGDataset throughput over DataLoader workers.")
+    ap.add_argument("--coco", default=None, help="COCO <split>.json (mặc định: sinh dataset tổng hợp)")
+    ap.add_argument("--rel", default=None, help="rel.json")
+    ap.add_argument("--split", default=None, help="Tên split trong rel.json")
+    ap.add_argument("--images-dir", default=None, help="Thư mục ảnh")
+    ap.add_argument("--images", type=int, default=500, help="Số ảnh tổng hợp khi không có --coco")
+    ap.add_argument("--workers", default="0,2,4", help="Danh sách số worker, vd. 0,2,4,8")
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--epochs", type=int, default=2)
+    ap.add_argument("--cache-size", type=int, default=0, help="Số ảnh tối đa trong LRU mỗi worker (0 = tắt)")
+    ap.add_argument("--max-size", type=int, default=None, help="Trả ảnh đã resize (cạnh dài <= max-size)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="benchmarks/dataset_results.json", help="File JSON kết quả")
+    args = ap.parse_args()
+
+    work_dir = None
+    if args.coco:
+        src = {"coco": args.coco, "rel": args.rel, "split": args.split, "images_dir": args.images_dir}
+    else:
+        work_dir = tempfile.mkdtemp(prefix="vietsgg_bench_dataset_")
+        print(f"• Sinh {args.images} ảnh tổng hợp vào {work_dir}")
+        src = make_fixture(args.images, work_dir, args.seed)
+
+    results: List[Dict[str, Any]] = []
+    try:
+        t0 = time.perf_counter()
+        ds = VietSGGDataset(src["coco"], src["rel"], src["split"], images_dir=src["images_dir"],
+                            cache_size=args.cache_size, max_size=args.max_size)
+        index_s = time.perf_counter() - t0
+        print(f"• Index {len(ds)} ảnh trong {index_s:.3f}s")
+        for w in [int(x) for x in args.workers.split(",") if x.strip()]:
+            r = run_config(ds, w, args.batch_size, args.epochs)
+            results.append(r)
+            rates = ", ".join(f"{e['samples_per_sec']}" for e in r["epochs"])
+            print(f"  workers={w:<3d} sample/s theo epoch: {rates}")
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "num_images": len(ds),
+            "index_seconds": round(index_s, 4),
+            "batch_size": args.batch_size,
+            "cache_size": args.cache_size,
+            "max_size": args.max_size,
+            "source": "synthetic" if work_dir else args.coco,
+        },
+        "results": results,
+    }
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ Đã lưu kết quả: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
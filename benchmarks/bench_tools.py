@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+bench_tools.py
+--------------------
+Benchmark các công cụ làm sạch / chuyển đổi / vẽ trên dữ liệu VG-like tổng hợp cố định:
+- standardize_relationships_vi.process_vg_like
+- harmonize_sport_context.harmonize
+- drop_extra_fields.process_data
+- filter_mislabel_soccer_in_baseball.process
+- convert_vg_to_coco.convert_vg_to_coco_sgg   (gồm đọc/ghi JSON + dò ảnh)
+- draw_vi_coco_relations.visualize           (vẽ thật lên ảnh placeholder, giới hạn bởi --draw-max)
+
+Mỗi (tool, scale) đo thời gian (tốt nhất trong --repeat lần) và bộ nhớ đỉnh (tracemalloc, 1 lần chạy riêng).
+Kết quả ghi JSON; --baseline để so sánh và báo hồi quy (exit code 1), --save-baseline để cập nhật baseline.
+
+Sử dụng:
+  python benchmarks/bench_tools.py --scales 1k,10k --out benchmarks/results.json
+  python benchmarks/bench_tools.py --scales 1k,10k,100k,1M --tools standardize,convert --no-memory
+  python benchmarks/bench_tools.py --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))  # các tool import module dùng chung ở gốc repo (image_index.py)
+
+# Từ vựng mặc định (dùng khi không đọc được datasets/val.json, datasets/rel.json)
+DEFAULT_NAMES = [
+    "vận động viên", "trọng tài", "khán giả", "quả bóng đá", "quả bóng chày", "quả bóng tennis",
+    "gậy bóng chày", "găng bóng chày", "vợt tennis", "sân bóng đá", "sân bóng chày", "sân tennis",
+    "khung thành", "lưới", "đồng phục", "giày",
+]
+DEFAULT_PREDICATES = ["đeo", "mặc", "mang", "cầm", "đá", "đứng trên", "trên", "gần", "bên cạnh", "vung"]
+
+
+def load_module(name: str, rel_path: str):
+    """Nạp module từ đường dẫn file (thư mục data-cleaning không phải package)."""
+    spec = importlib.util.spec_from_file_location(name, ROOT / rel_path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def parse_scale(s: str) -> int:
+    """'1k' -> 1000, '1M' -> 1000000, '2500' -> 2500."""
+    s = s.strip()
+    mult = {"k": 1_000, "K": 1_000, "m": 1_000_000, "M": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+
+def load_vocab() -> Tuple[List[str], List[str]]:
+    """Lấy danh sách nhãn + vị từ từ datasets/ (nếu có) để input giống dữ liệu thật."""
+    try:
+        coco = json.loads((ROOT / "datasets" / "val.json").read_text(encoding="utf-8"))
+        rel = json.loads((ROOT / "datasets" / "rel.json").read_text(encoding="utf-8"))
+        names = [c["name"] for c in coco["categories"]]
+        preds = [p for p in rel["rel_categories"] if p != "__background__"]
+        # thêm các nhãn/vị từ mà các tool xử lý riêng
+        names += [n for n in DEFAULT_NAMES if n not in names]
+        preds += [p for p in DEFAULT_PREDICATES if p not in preds]
+        return names, preds
+    except (OSError, KeyError, ValueError):
+        return list(DEFAULT_NAMES), list(DEFAULT_PREDICATES)
+
+
+def make_vg_data(n_images: int, seed: int = 0, fixture: str = "uniform") -> List[Dict[str, Any]]:
+    """
+    Sinh n_images bản ghi VG-like cố định theo seed (objects + relationships).
+    fixture="learned": dùng synth_dataset (phân phối học từ datasets/) thay cho phân phối đều.
+    """
+    if fixture == "learned":
+        synth = load_module("synth_dataset", "benchmarks/synth_dataset.py")
+        return list(synth.SyntheticGenerator(synth.fit(seed=seed), seed).iter_images(n_images))
+    names, preds = load_vocab()
+    rng = random.Random(seed)
+    data = []
+    for i in range(n_images):
+        w, h = rng.choice([(640, 480), (500, 375), (480, 640), (640, 427)])
+        objects = []
+        for oid in range(1, rng.randint(2, 12) + 1):
+            bw, bh = rng.randint(10, w // 2), rng.randint(10, h // 2)
+            objects.append({
+                "object_id": oid, "names": [rng.choice(names)],
+                "x": rng.randint(0, w - bw), "y": rng.randint(0, h - bh), "w": bw, "h": bh,
+            })
+        rels = []
+        for _ in range(rng.randint(0, min(6, len(objects)))):
+            s, o = rng.sample(range(1, len(objects) + 1), 2)
+            rels.append({"subject_id": s, "predicate": rng.choice(preds), "object_id": o})
+        data.append({"image_id": i + 1, "width": w, "height": h, "objects": objects, "relationships": rels})
+    return data
+
+
+def make_placeholder_images(images_dir: str, data: List[Dict[str, Any]]) -> None:
+    """Ảnh placeholder (đúng kích thước bản ghi) cho draw_vi_coco_relations."""
+    from PIL import Image
+
+    os.makedirs(images_dir, exist_ok=True)
+    for item in data:
+        p = os.path.join(images_dir, f"{int(item['image_id']):012d}.jpg")
+        if not os.path.exists(p):
+            Image.new("RGB", (item["width"], item["height"]), (90, 140, 90)).save(p, quality=80)
+
+
+# ------------------------- CASES -------------------------
+# Mỗi case: setup(mods, work_dir, data_json, n) -> run() (callable được đo). setup không tính vào thời gian.
+def case_standardize(mods, work, blob, n):
+    data = json.loads(blob)
+    return lambda: mods["standardize"].process_vg_like(data)
+
+
+def case_harmonize(mods, work, blob, n):
+    data = json.loads(blob)
+    return lambda: mods["harmonize"].harmonize(data, strategy="drop", also_fix_predicates=True)
+
+
+def case_drop_extra_fields(mods, work, blob, n):
+    data = json.loads(blob)
+    labels = ["sân bóng đá", "sân bóng chày", "sân tennis"]
+    return lambda: mods["drop_extra_fields"].process_data(data, labels, "largest-area")
+
+
+def case_filter_mislabel(mods, work, blob, n):
+    data = json.loads(blob)
+    return lambda: mods["filter_mislabel"].process(data, 0.90, 0.0, False)
+
+
+def case_convert(mods, work, blob, n):
+    in_path = Path(work) / "input.json"
+    if not in_path.exists():
+        in_path.write_text(blob, encoding="utf-8")
+    images_dir = os.path.join(work, "no_images")  # không có ảnh -> dùng width/height trong bản ghi
+    os.makedirs(images_dir, exist_ok=True)
+
+    return lambda: mods["convert"].convert_vg_to_coco_sgg(
+        in_path, Path(work) / "coco.json", Path(work) / "rel.json", images_dir
+    )
+
+
+def case_draw(mods, work, blob, n, draw_max: int = 1000):
+    data = json.loads(blob)[:draw_max]
+    images_dir = os.path.join(work, "images")
+    make_placeholder_images(images_dir, data)
+    json_path = os.path.join(work, f"draw_{len(data)}.json")
+    if not os.path.exists(json_path):
+        Path(json_path).write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    out_dir = os.path.join(work, "draw_out")
+    return lambda: mods["draw"].visualize(json_path, images_dir, out_dir, force=True)
+
+
+CASES: Dict[str, Tuple[str, str, Callable]] = {
+    # tên case: (tên module, đường dẫn, setup)
+    "standardize": ("standardize", "standardize_relationships_vi.py", case_standardize),
+    "harmonize": ("harmonize", "data-cleaning/harmonize_sport_context.py", case_harmonize),
+    "drop_extra_fields": ("drop_extra_fields", "data-cleaning/drop_extra_fields.py", case_drop_extra_fields),
+    "filter_mislabel": ("filter_mislabel", "data-cleaning/filter_mislabel_soccer_in_baseball.py", case_filter_mislabel),
+    "convert": ("convert", "convert_vg_to_coco.py", case_convert),
+    "draw": ("draw", "data-cleaning/draw_vi_coco_relations.py", case_draw),
+}
+
+
+def measure(setup: Callable[[], Callable], repeat: int, memory: bool) -> Dict[str, Any]:
+    """
+    Thời gian: min qua `repeat` lần (mỗi lần setup lại vì các tool sửa dữ liệu tại chỗ). Bộ nhớ: 1 lần có tracemalloc.
+    stdout của tool (log từng ảnh) được gom vào bộ đệm -> vẫn tính chi phí format nhưng không làm ngập terminal.
+    """
+    times = []
+    for _ in range(max(1, repeat)):
+        run = setup()
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t0)
+        del run
+    out = {"time_s": round(min(times), 4), "times_s": [round(t, 4) for t in times]}
+    if memory:
+        run = setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        out["peak_mb"] = round(peak / 2**20, 2)
+    return out
+
+
+def run_suite(tools: List[str], scales: List[int], repeat: int, memory: bool,
+              draw_max: int, seed: int, work_dir: str, fixture: str = "uniform") -> List[Dict[str, Any]]:
+    mods = {CASES[t][0]: load_module(CASES[t][0], CASES[t][1]) for t in tools}
+    results = []
+    for n in scales:
+        blob = json.dumps(make_vg_data(n, seed, fixture), ensure_ascii=False)
+        work = os.path.join(work_dir, f"n{n}")
+        os.makedirs(work, exist_ok=True)
+        for tool in tools:
+            setup = CASES[tool][2]
+            if tool == "draw":
+                n_eff = min(n, draw_max)
+                res = measure(lambda: setup(mods, work, blob, n, draw_max), repeat, memory)
+            else:
+                n_eff = n
+                res = measure(lambda: setup(mods, work, blob, n), repeat, memory)
+            row = {"tool": tool, "scale": n, "images": n_eff, **res,
+                   "images_per_s": round(n_eff / res["time_s"], 1) if res["time_s"] > 0 else None}
+            results.append(row)
+            mem = f" peak={row['peak_mb']}MB" if "peak_mb" in row else ""
+            print(f"{tool:<18} n={n:<8} images={n_eff:<8} time={row['time_s']:.3f}s{mem}", flush=True)
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[Dict[str, Any]]:
+    """So với baseline theo (tool, scale); hồi quy khi time/peak vượt baseline*(1+tolerance)."""
+    base = {(r["tool"], r["scale"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get((r["tool"], r["scale"]))
+        if not b:
+            continue
+        for metric in ("time_s", "peak_mb"):
+            if metric in r and b.get(metric):
+                ratio = r[metric] / b[metric]
+                r[f"{metric}_vs_baseline"] = round(ratio, 3)
+                if ratio > 1 + tolerance:
+                    regressions.append({"tool": r["tool"], "scale": r["scale"], "metric": metric,
+                                        "baseline": b[metric], "current": r[metric], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark cleaning / conversion / visualization tools.")
+    ap.add_argument("--tools", default=",".join(CASES), help=f"Danh sách tool, phân tách bằng dấu phẩy ({','.join(CASES)})")
+    ap.add_argument("--scales", default="1k,10k", help="Số ảnh mỗi lượt, vd. 1k,10k,100k,1M")
+    ap.add_argument("--repeat", type=int, default=3, help="Số lần đo thời gian (lấy min)")
+    ap.add_argument("--no-memory", action="store_true", help="Bỏ đo bộ nhớ đỉnh (tracemalloc chậm ở scale lớn)")
+    ap.add_argument("--draw-max", type=int, default=1000, help="Số ảnh tối đa cho case draw")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--fixture", choices=["uniform", "learned"], default="uniform",
+                    help="Dữ liệu đầu vào: phân phối đều hoặc học từ datasets/ (synth_dataset.py)")
+    ap.add_argument("--work-dir", default=None, help="Thư mục tạm cho input/output (mặc định: tạo mới rồi xoá)")
+    ap.add_argument("--out", default="benchmarks/results.json", help="File JSON kết quả")
+    ap.add_argument("--baseline", default=None, help="File JSON baseline để so sánh")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Ngưỡng hồi quy (0.2 = chậm/tốn hơn 20%%)")
+    ap.add_argument("--save-baseline", default=None, help="Ghi kết quả lần này làm baseline")
+    args = ap.parse_args()
+
+    tools = [t.strip() for t in args.tools.split(",") if t.strip()]
+    unknown = [t for t in tools if t not in CASES]
+    if unknown:
+        ap.error(f"Unknown tools: {unknown}")
+    scales = [parse_scale(s) for s in args.scales.split(",") if s.strip()]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="vietsgg_bench_tools_")
+    try:
+        results = run_suite(tools, scales, args.repeat, not args.no_memory, args.draw_max, args.seed, work_dir,
+                            args.fixture)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "fixture": args.fixture,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline.get("results", []), args.tolerance)
+        report["baseline"] = args.baseline
+        report["regressions"] = regressions
+        for r in regressions:
+            print(f"⚠️ REGRESSION {r['tool']} n={r['scale']} {r['metric']}: "
+                  f"{r['baseline']} -> {r['current']} (x{r['ratio']})")
+        if not regressions:
+            print(f"✅ Không có hồi quy so với {args.baseline} (tolerance={args.tolerance:.0%})")
+        exit_code = 1 if regressions else 0
+
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ Đã lưu kết quả: {args.out}")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"✅ Đã lưu baseline: {args.save_baseline}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
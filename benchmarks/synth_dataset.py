@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+synth_dataset.py
+--------------------
+Sinh dataset tổng hợp kích thước tùy ý, mô phỏng phân phối của annotation thật
+(datasets/val.json + datasets/rel.json) mà không chứa dữ liệu gốc:
+- số object / ảnh, tần suất category, kích thước ảnh,
+- vị trí + kích thước box (chuẩn hoá theo ảnh, lấy mẫu theo từng category),
+- số quan hệ / ảnh, tần suất cặp (category chủ ngữ, category tân ngữ) và predicate theo từng cặp.
+
+Xuất theo luồng (không giữ cả dataset trong RAM), seed cố định:
+- vg:    JSON list VG-like (image_id, width, height, objects, relationships) — đầu vào của các tool làm sạch
+- coco:  COCO (images/annotations/categories) + rel.json {split: {image_id: [[s, o, pred_id]]}, rel_categories}
+- jsonl: mỗi dòng 1 bản ghi VG-like
+Tùy chọn render ảnh placeholder đúng kích thước.
+
+Sử dụng:
+  python benchmarks/synth_dataset.py --images 100000 --formats vg,coco,jsonl --out-dir synth --seed 0
+  python benchmarks/synth_dataset.py --images 1000 --formats vg --out-dir synth --render-images synth/images
+  python benchmarks/synth_dataset.py --save-model synth/model.json      # chỉ lưu thống kê đã học
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import shutil
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_COCO = ROOT / "datasets" / "val.json"
+DEFAULT_REL = ROOT / "datasets" / "rel.json"
+MAX_BOX_SAMPLES = 500  # số box chuẩn hoá giữ lại mỗi category
+
+
+# ------------------------- HỌC PHÂN PHỐI -------------------------
+def fit(coco_path: Path = DEFAULT_COCO, rel_path: Path = DEFAULT_REL, seed: int = 0) -> Dict[str, Any]:
+    """
+    Học thống kê từ file COCO + rel.json. Thứ tự annotation trong mỗi ảnh là chỉ số local mà rel.json tham chiếu
+    (giống convert_vg_to_coco). Split nào của rel.json có ảnh trong file COCO sẽ được dùng để học quan hệ theo cặp;
+    số quan hệ / ảnh học từ mọi split.
+    """
+    coco = json.loads(Path(coco_path).read_text(encoding="utf-8"))
+    rel = json.loads(Path(rel_path).read_text(encoding="utf-8"))
+    rng = random.Random(seed)
+
+    cat_name = {c["id"]: c["name"] for c in coco["categories"]}
+    predicates = list(rel["rel_categories"])
+    sizes = {img["id"]: (img["width"], img["height"]) for img in coco["images"]}
+
+    anns_by_image: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for a in coco["annotations"]:
+        anns_by_image[a["image_id"]].append(a)
+
+    size_freq: Counter = Counter()
+    objs_per_image: Counter = Counter()
+    cat_freq: Counter = Counter()
+    boxes: Dict[str, List[List[float]]] = defaultdict(list)
+    seen_boxes: Counter = Counter()
+    for img_id, (w, h) in sizes.items():
+        anns = anns_by_image.get(img_id, [])
+        size_freq[f"{w}x{h}"] += 1
+        objs_per_image[len(anns)] += 1
+        for a in anns:
+            name = cat_name[a["category_id"]]
+            cat_freq[name] += 1
+            x, y, bw, bh = a["bbox"]
+            nb = [round(x / w, 4), round(y / h, 4), round(bw / w, 4), round(bh / h, 4)]
+            # reservoir sampling -> giữ tối đa MAX_BOX_SAMPLES box mỗi category
+            seen_boxes[name] += 1
+            if len(boxes[name]) < MAX_BOX_SAMPLES:
+                boxes[name].append(nb)
+            else:
+                j = rng.randrange(seen_boxes[name])
+                if j < MAX_BOX_SAMPLES:
+                    boxes[name][j] = nb
+
+    rels_per_image: Counter = Counter()
+    pair_freq: Counter = Counter()
+    pred_by_pair: Dict[str, Counter] = defaultdict(Counter)
+    pred_freq: Counter = Counter()
+    for split, items in rel.items():
+        if split == "rel_categories" or not isinstance(items, dict):
+            continue
+        for img_key, triples in items.items():
+            rels_per_image[len(triples)] += 1
+            anns = anns_by_image.get(int(img_key)) if img_key.lstrip("-").isdigit() else None
+            for s_idx, o_idx, p_id in triples:
+                pred = predicates[p_id]
+                pred_freq[pred] += 1
+                if anns and s_idx < len(anns) and o_idx < len(anns):
+                    pair = f"{cat_name[anns[s_idx]['category_id']]}|{cat_name[anns[o_idx]['category_id']]}"
+                    pair_freq[pair] += 1
+                    pred_by_pair[pair][pred] += 1
+    # ảnh có trong COCO nhưng không có quan hệ
+    rel_keys = {k for split, items in rel.items() if isinstance(items, dict) for k in items}
+    rels_per_image[0] += sum(1 for i in sizes if str(i) not in rel_keys)
+
+    return {
+        "source": {"coco": str(coco_path), "rel": str(rel_path), "images": len(sizes)},
+        "categories": [cat_name[k] for k in sorted(cat_name)],
+        "predicates": predicates,
+        "image_sizes": dict(size_freq),
+        "objects_per_image": {str(k): v for k, v in sorted(objs_per_image.items())},
+        "category_freq": dict(cat_freq),
+        "boxes": dict(boxes),
+        "relations_per_image": {str(k): v for k, v in sorted(rels_per_image.items())},
+        "pair_freq": dict(pair_freq),
+        "predicate_by_pair": {k: dict(v) for k, v in pred_by_pair.items()},
+        "predicate_freq": dict(pred_freq),
+    }
+
+
+# ------------------------- SINH DỮ LIỆU -------------------------
+class _Weighted:
+    """Lấy mẫu rời rạc theo trọng số (bisect trên tổng tích luỹ)."""
+
+    def __init__(self, freq: Dict[Any, float]):
+        self.items = list(freq.keys())
+        self.cum = list(itertools.accumulate(float(v) for v in freq.values()))
+
+    def sample(self, rng: random.Random):
+        return self.items[bisect.bisect_right(self.cum, rng.random() * self.cum[-1])]
+
+
+class SyntheticGenerator:
+    """Sinh bản ghi VG-like theo thống kê đã học; cùng (model, seed) -> cùng dữ liệu."""
+
+    def __init__(self, model: Dict[str, Any], seed: int = 0):
+        self.model = model
+        self.seed = seed
+        self.sizes = _Weighted(model["image_sizes"])
+        self.n_objs = _Weighted({int(k): v for k, v in model["objects_per_image"].items() if int(k) > 0})
+        self.n_rels = _Weighted({int(k): v for k, v in model["relations_per_image"].items()})
+        self.cats = _Weighted(model["category_freq"])
+        self.pair_freq = model["pair_freq"]
+        self.pred_by_pair = {k: _Weighted(v) for k, v in model["predicate_by_pair"].items()}
+        self.preds = _Weighted({p: c for p, c in model["predicate_freq"].items()} or {"gần": 1})
+
+    def _box(self, rng: random.Random, name: str, w: int, h: int) -> Tuple[int, int, int, int]:
+        samples = self.model["boxes"].get(name)
+        if samples:
+            nx, ny, nw, nh = rng.choice(samples)
+            j = lambda v: v * (1.0 + rng.uniform(-0.05, 0.05))  # jitter nhẹ -> box không lặp y hệt
+            nw, nh = min(1.0, j(nw)), min(1.0, j(nh))
+            nx, ny = min(max(0.0, j(nx)), 1.0 - nw), min(max(0.0, j(ny)), 1.0 - nh)
+        else:
+            nw, nh = rng.uniform(0.05, 0.5), rng.uniform(0.05, 0.5)
+            nx, ny = rng.uniform(0, 1 - nw), rng.uniform(0, 1 - nh)
+        bw, bh = max(1, int(nw * w)), max(1, int(nh * h))
+        return int(nx * w), int(ny * h), bw, bh
+
+    def make_image(self, image_id: int) -> Dict[str, Any]:
+        rng = random.Random(f"{self.seed}:{image_id}")  # mỗi ảnh 1 seed riêng -> sinh song song/tiếp tục được
+        w, h = (int(v) for v in self.sizes.sample(rng).split("x"))
+        objects = []
+        for oid in range(1, self.n_objs.sample(rng) + 1):
+            name = self.cats.sample(rng)
+            x, y, bw, bh = self._box(rng, name, w, h)
+            objects.append({"object_id": oid, "names": [name], "x": x, "y": y, "w": bw, "h": bh})
+
+        rels = []
+        n_rels = min(self.n_rels.sample(rng), len(objects) * (len(objects) - 1))
+        if n_rels:
+            # cặp (s, o) trọng số theo tần suất cặp category (+1 làm trơn) -> ưu tiên cặp hay gặp
+            pairs = [(s, o) for s in objects for o in objects if s is not o]
+            weights = [self.pair_freq.get(f"{s['names'][0]}|{o['names'][0]}", 0) + 1 for s, o in pairs]
+            used = set()
+            for _ in range(n_rels * 3):
+                if len(rels) >= n_rels:
+                    break
+                s, o = rng.choices(pairs, weights=weights)[0]
+                if (s["object_id"], o["object_id"]) in used:
+                    continue
+                used.add((s["object_id"], o["object_id"]))
+                key = f"{s['names'][0]}|{o['names'][0]}"
+                pred = (self.pred_by_pair[key] if key in self.pred_by_pair else self.preds).sample(rng)
+                rels.append({"subject_id": s["object_id"], "predicate": pred, "object_id": o["object_id"]})
+        return {"image_id": image_id, "width": w, "height": h, "objects": objects, "relationships": rels}
+
+    def iter_images(self, n: int, start_id: int = 1) -> Iterator[Dict[str, Any]]:
+        for image_id in range(start_id, start_id + n):
+            yield self.make_image(image_id)
+
+
+# ------------------------- GHI THEO LUỒNG -------------------------
+class VGWriter:
+    """JSON list VG-like, ghi từng phần tử."""
+
+    def __init__(self, path: Path):
+        self.f = open(path, "w", encoding="utf-8")
+        self.f.write("[")
+        self.first = True
+
+    def write(self, item: Dict[str, Any]):
+        self.f.write(("\n" if self.first else ",\n") + json.dumps(item, ensure_ascii=False))
+        self.first = False
+
+    def close(self):
+        self.f.write("\n]\n")
+        self.f.close()
+
+
+class JsonlWriter:
+    def __init__(self, path: Path):
+        self.f = open(path, "w", encoding="utf-8")
+
+    def write(self, item: Dict[str, Any]):
+        self.f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+class CocoRelWriter:
+    """
+    COCO + rel.json giống convert_vg_to_coco (bbox [x,y,w,h], chỉ số quan hệ là index local trong ảnh).
+    images/annotations ghi ra 2 file tạm rồi nối -> không giữ toàn bộ trong RAM.
+    """
+
+    def __init__(self, coco_path: Path, rel_path: Path, categories: List[str], predicates: List[str], split: str):
+        self.coco_path, self.rel_path = Path(coco_path), Path(rel_path)
+        self.cat2id = {c: i + 1 for i, c in enumerate(categories)}
+        self.pred2id = {p: i for i, p in enumerate(predicates)}
+        self.categories, self.predicates, self.split = categories, predicates, split
+        self.f_img = open(str(coco_path) + ".images.tmp", "w", encoding="utf-8")
+        self.f_ann = open(str(coco_path) + ".annotations.tmp", "w", encoding="utf-8")
+        self.f_rel = open(rel_path, "w", encoding="utf-8")
+        self.f_rel.write(f"{{{json.dumps(split)}: {{")
+        self.n_img = self.n_ann = self.n_rel_img = 0
+
+    def write(self, item: Dict[str, Any]):
+        iid = item["image_id"]
+        img = {"id": iid, "file_name": f"{int(iid):012d}.jpg", "height": item["height"], "width": item["width"]}
+        self.f_img.write(("," if self.n_img else "") + "\n" + json.dumps(img, ensure_ascii=False))
+        self.n_img += 1
+        local = {}
+        for idx, o in enumerate(item["objects"]):
+            ann = {"id": self.n_ann, "image_id": iid, "bbox": [o["x"], o["y"], o["w"], o["h"]],
+                   "area": o["w"] * o["h"], "iscrowd": 0, "category_id": self.cat2id[o["names"][0]]}
+            self.f_ann.write(("," if self.n_ann else "") + "\n" + json.dumps(ann, ensure_ascii=False))
+            self.n_ann += 1
+            local[o["object_id"]] = idx
+        triples = [[local[r["subject_id"]], local[r["object_id"]], self.pred2id[r["predicate"]]]
+                   for r in item["relationships"]]
+        if triples:
+            self.f_rel.write(("," if self.n_rel_img else "") + f"\n{json.dumps(str(iid))}: {json.dumps(triples)}")
+            self.n_rel_img += 1
+
+    def close(self):
+        self.f_img.close()
+        self.f_ann.close()
+        with open(self.coco_path, "w", encoding="utf-8") as out:
+            for key, tmp in (("images", self.f_img.name), ("annotations", self.f_ann.name)):
+                out.write(("{" if key == "images" else ",") + f"\n{json.dumps(key)}: [")
+                with open(tmp, "r", encoding="utf-8") as f:
+                    shutil.copyfileobj(f, out)
+                out.write("\n]")
+                os.remove(tmp)
+            cats = [{"id": cid, "name": c, "supercategory": c} for c, cid in self.cat2id.items()]
+            out.write(f',\n"categories": {json.dumps(cats, ensure_ascii=False)}\n}}\n')
+        self.f_rel.write(f'\n}},\n"rel_categories": {json.dumps(self.predicates, ensure_ascii=False)}\n}}\n')
+        self.f_rel.close()
+
+
+def render_placeholder(item: Dict[str, Any], images_dir: str, seed: int = 0) -> str:
+    """Ảnh JPEG đúng kích thước bản ghi (màu nền theo image_id, box tô nhạt) cho các tool cần đọc ảnh."""
+    from PIL import Image, ImageDraw
+
+    path = os.path.join(images_dir, f"{int(item['image_id']):012d}.jpg")
+    rng = random.Random(f"{seed}:img:{item['image_id']}")
+    img = Image.new("RGB", (item["width"], item["height"]), tuple(rng.randint(40, 200) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for o in item["objects"]:
+        draw.rectangle([o["x"], o["y"], o["x"] + o["w"], o["y"] + o["h"]], outline=(230, 230, 230))
+    img.save(path, quality=80)
+    return path
+
+
+def generate(model: Dict[str, Any], n: int, out_dir: str, formats: List[str], seed: int = 0,
+             start_id: int = 1, split: str = "train", images_dir: Optional[str] = None,
+             prefix: str = "synthetic") -> Dict[str, Any]:
+    """Sinh n ảnh và ghi đồng thời mọi định dạng yêu cầu; trả về metadata (đường dẫn + số lượng)."""
+    os.makedirs(out_dir, exist_ok=True)
+    if images_dir:
+        os.makedirs(images_dir, exist_ok=True)
+    writers, outputs = [], {}
+    if "vg" in formats:
+        outputs["vg"] = os.path.join(out_dir, f"{prefix}_vg.json")
+        writers.append(VGWriter(Path(outputs["vg"])))
+    if "jsonl" in formats:
+        outputs["jsonl"] = os.path.join(out_dir, f"{prefix}.jsonl")
+        writers.append(JsonlWriter(Path(outputs["jsonl"])))
+    if "coco" in formats:
+        outputs["coco"] = os.path.join(out_dir, f"{prefix}_coco.json")
+        outputs["rel"] = os.path.join(out_dir, f"{prefix}_rel.json")
+        writers.append(CocoRelWriter(Path(outputs["coco"]), Path(outputs["rel"]),
+                                     model["categories"], model["predicates"], split))
+
+    gen = SyntheticGenerator(model, seed)
+    n_objs = n_rels = 0
+    try:
+        for item in gen.iter_images(n, start_id):
+            n_objs += len(item["objects"])
+            n_rels += len(item["relationships"])
+            for w in writers:
+                w.write(item)
+            if images_dir:
+                render_placeholder(item, images_dir, seed)
+    finally:
+        for w in writers:
+            w.close()
+    return {"images": n, "objects": n_objs, "relationships": n_rels, "seed": seed, "outputs": outputs}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic VietSGG-like datasets from learned statistics.")
+    ap.add_argument("--coco", default=str(DEFAULT_COCO), help="COCO annotation để học phân phối")
+    ap.add_argument("--rel", default=str(DEFAULT_REL), help="rel.json tương ứng")
+    ap.add_argument("--model", default=None, help="Dùng thống kê đã lưu (--save-model) thay vì học lại")
+    ap.add_argument("--save-model", default=None, help="Lưu thống kê đã học ra JSON")
+    ap.add_argument("--images", type=int, default=0, help="Số ảnh cần sinh")
+    ap.add_argument("--formats", default="vg", help="vg,coco,jsonl")
+    ap.add_argument("--out-dir", default="synthetic")
+    ap.add_argument("--prefix", default="synthetic")
+    ap.add_argument("--split", default="train", help="Tên split trong rel.json")
+    ap.add_argument("--start-id", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--render-images", default=None, metavar="DIR", help="Render ảnh placeholder vào DIR")
+    args = ap.parse_args()
+
+    if args.model:
+        model = json.loads(Path(args.model).read_text(encoding="utf-8"))
+    else:
+        model = fit(Path(args.coco), Path(args.rel), seed=args.seed)
+    if args.save_model:
+        Path(args.save_model).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_model).write_text(json.dumps(model, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"✅ Đã lưu thống kê: {args.save_model}")
+    if args.images > 0:
+        formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+        info = generate(model, args.images, args.out_dir, formats, seed=args.seed, start_id=args.start_id,
+                        split=args.split, images_dir=args.render_images, prefix=args.prefix)
+        print(json.dumps(info, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
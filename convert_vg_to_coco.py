@@ -1,8 +1,13 @@
 import json
 import os
+import re
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from PIL import Image
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from annotation_index import build_index
+from image_index import ImageIndex, SizeCache, candidate_names
 
 
 # === CẤU HÌNH ĐƯỜNG DẪN ===
@@ -10,29 +15,40 @@ INPUT_PATH = Path("relationships_vi_coco_uitvic_test-final.json")
 OUTPUT_COCO = Path("val.json")
 OUTPUT_REL = Path("rel_test.json")
 IMAGES_DIR = "coco_uitvic_test"  # Thư mục chứa ảnh
+SIZE_CACHE_PATH = "image_sizes_cache.json"  # cache kích thước ảnh (path, mtime, size) -> (w, h)
+PROBE_WORKERS = 8  # số thread đọc header ảnh
+
+# === CHUYỂN ĐỔI NHIỀU SPLIT (1 lượt, từ vựng category/predicate chung) ===
+# split -> (file VG-like đầu vào, thư mục ảnh); ghi <split>.json + rel.json gộp vào OUTPUT_DIR
+SPLITS = {
+    "train": (Path("relationships_vi_coco_uitvic_train-final.json"), "coco_uitvic_train"),
+    "val": (Path("relationships_vi_coco_uitvic_test-final.json"), "coco_uitvic_test"),
+}
+OUTPUT_DIR = Path(".")
 
 def coco_name_from_id(image_id: int) -> str:
     return f"{int(image_id):012d}.jpg"
 
 
 def find_image_path(image_id: int, images_dir: str) -> Optional[str]:
-    candidates = [
-        coco_name_from_id(image_id),
-        f"{image_id}.jpg",
-        f"{image_id}.png",
-        f"{int(image_id):012d}.png",
-    ]
-    for name in candidates:
+    for name in candidate_names(image_id):
         p = os.path.join(images_dir, name)
         if os.path.exists(p):
             return p
     return None
 
 # === HÀM CHUYỂN ĐỔI ===
-def convert_vg_to_coco_sgg(input_path: Path, output_coco: Path, output_rel: Path, images_dir: str):
+def convert_vg_to_coco_sgg(input_path: Path, output_coco: Path, output_rel: Path, images_dir: str,
+                           size_cache_path: Optional[str] = None, workers: int = PROBE_WORKERS):
     with open(input_path, "r", encoding="utf-8") as f:
         vg_data = json.load(f)
 
+    # 1 lần scandir + đọc kích thước từ header (song song, có cache) thay vì stat/PIL.open từng ảnh
+    index = ImageIndex(images_dir)
+    size_cache = SizeCache(size_cache_path)
+    image_sizes = index.image_sizes((int(it["image_id"]) for it in vg_data), size_cache, workers)
+    size_cache.save()
+
     images = []
     annotations = []
     relationships_by_image: Dict[str, List[List[int]]] = {}
@@ -43,12 +59,11 @@ def convert_vg_to_coco_sgg(input_path: Path, output_coco: Path, output_rel: Path
     for img_item in vg_data:
         image_id = img_item["image_id"]
         # Tìm đường dẫn ảnh thực tế
-        img_path = find_image_path(int(image_id), images_dir)
-        if img_path and os.path.exists(img_path):
+        img_path = index.path(int(image_id))
+        if img_path and int(image_id) in image_sizes:
             file_name = os.path.basename(img_path)
             file_key = os.path.splitext(file_name)[0]  # loại bỏ .jpg
-            with Image.open(img_path) as im:
-                width, height = im.size
+            width, height = image_sizes[int(image_id)]
         else:
             file_name = img_item.get("image", f"{image_id}.jpg")
             file_key = os.path.splitext(file_name)[0]
@@ -143,5 +158,160 @@ def convert_vg_to_coco_sgg(input_path: Path, output_coco: Path, output_rel: Path
     print(f"✅ Đã lưu COCO-format: {output_coco}")
     print(f"✅ Đã lưu quan hệ:     {output_rel}")
 
+def _remap(codes: np.ndarray, provisional: Dict[str, int], final: Dict[str, int]) -> np.ndarray:
+    """Đổi mã tạm (theo thứ tự gặp) sang id cuối (theo từ vựng đã sắp xếp) bằng 1 lần tra mảng."""
+    table = np.empty(max(1, len(provisional)), dtype=np.int64)
+    for name, code in provisional.items():
+        table[code] = final[name]
+    return table[codes] if codes.size else codes
+
+
+def convert_splits(splits: Dict[str, Tuple[Path, str]], output_dir: Path,
+                   size_cache_path: Optional[str] = None, workers: int = PROBE_WORKERS,
+                   write_index: bool = True) -> Dict[str, Any]:
+    """
+    Chuyển mọi split trong 1 lượt với từ vựng chung:
+    - category / predicate được gom từ tất cả split, sắp xếp -> id ổn định, giống nhau giữa train/val/test;
+    - mỗi split ghi <split>.json (COCO, cùng danh sách categories); quan hệ của mọi split ghi chung vào rel.json
+      ({split: {image_id: [[s, o, pred_id]]}, rel_categories}) -> không cần bước merge_rel và không lệch id.
+    Trong lượt đọc, nhãn/predicate được mã hoá tạm theo thứ tự gặp; sau khi có từ vựng cuối thì đổi mã bằng numpy.
+    write_index: ghi thêm sidecar <split>.index.json (annotation_index.py) để đọc annotation / quan hệ từng ảnh O(1).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    size_cache = SizeCache(size_cache_path)
+    cat_code: Dict[str, int] = {}
+    pred_code: Dict[str, int] = {}
+    parsed: Dict[str, Dict[str, Any]] = {}
+
+    for split, (input_path, images_dir) in splits.items():
+        with open(input_path, "r", encoding="utf-8") as f:
+            vg_data = json.load(f)
+        index = ImageIndex(images_dir)
+        image_sizes = index.image_sizes((int(it["image_id"]) for it in vg_data), size_cache, workers)
+
+        images, annotations, ann_cats = [], [], []
+        rel_keys, rel_counts, rel_rows = [], [], []
+        for img_item in vg_data:
+            image_id = img_item["image_id"]
+            img_path = index.path(int(image_id))
+            if img_path and int(image_id) in image_sizes:
+                file_name = os.path.basename(img_path)
+                width, height = image_sizes[int(image_id)]
+            else:
+                file_name = img_item.get("image", f"{image_id}.jpg")
+                width = img_item.get("width", 800)
+                height = img_item.get("height", 600)
+            images.append({"id": image_id, "file_name": file_name, "height": height, "width": width})
+
+            obj_id_map = {}
+            for idx, obj in enumerate(img_item.get("objects", [])):
+                category = obj["names"][0] if obj.get("names") else "unknown"
+                ann_cats.append(cat_code.setdefault(category, len(cat_code)))
+                annotations.append({
+                    "id": len(annotations),
+                    "image_id": image_id,
+                    "bbox": [obj["x"], obj["y"], obj["w"], obj["h"]],
+                    "area": obj["w"] * obj["h"],
+                    "iscrowd": 0,
+                    "category_id": None,  # điền sau khi có từ vựng chung
+                })
+                obj_id_map[obj["object_id"]] = idx
+
+            n_before = len(rel_rows)
+            for rel in img_item.get("relationships", []):
+                p = pred_code.setdefault(rel["predicate"], len(pred_code))
+                s_idx = obj_id_map.get(rel["subject_id"])
+                o_idx = obj_id_map.get(rel["object_id"])
+                if s_idx is not None and o_idx is not None:
+                    rel_rows.append((s_idx, o_idx, p))
+            if len(rel_rows) > n_before:
+                rel_keys.append(str(image_id))
+                rel_counts.append(len(rel_rows) - n_before)
+
+        parsed[split] = {
+            "images": images, "annotations": annotations,
+            "ann_cats": np.asarray(ann_cats, dtype=np.int64),
+            "rel_keys": rel_keys, "rel_counts": rel_counts,
+            "rel_rows": np.asarray(rel_rows, dtype=np.int64).reshape(-1, 3),
+        }
+        print(f"• {split}: {len(images)} ảnh, {len(annotations)} object, {len(rel_rows)} quan hệ")
+    size_cache.save()
+
+    # Từ vựng chung, sắp xếp ổn định
+    category2id = {c: i + 1 for i, c in enumerate(sorted(cat_code))}
+    predicate_list = ["__background__"] + sorted(pred_code)
+    predicate2id = {p: i for i, p in enumerate(predicate_list)}
+    categories = [{"id": cid, "name": name, "supercategory": name} for name, cid in category2id.items()]
+
+    rel_out: Dict[str, Any] = {}
+    outputs = {}
+    for split, d in parsed.items():
+        for ann, cid in zip(d["annotations"], _remap(d["ann_cats"], cat_code, category2id).tolist()):
+            ann["category_id"] = cid
+        rows = d["rel_rows"]
+        if rows.size:
+            rows = rows.copy()
+            rows[:, 2] = _remap(rows[:, 2], pred_code, predicate2id)
+        split_rels, start = {}, 0
+        for key, n in zip(d["rel_keys"], d["rel_counts"]):
+            split_rels[key] = rows[start:start + n].tolist()
+            start += n
+        rel_out[split] = split_rels
+
+        out_path = output_dir / f"{split}.json"
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"images": d["images"], "annotations": d["annotations"], "categories": categories},
+                      f, ensure_ascii=False, indent=2)
+        outputs[split] = str(out_path)
+        print(f"✅ Đã lưu COCO-format: {out_path}")
+
+    rel_out["rel_categories"] = predicate_list
+    rel_path = output_dir / "rel.json"
+    with open(rel_path, "w", encoding="utf-8") as f:
+        json.dump(rel_out, f, ensure_ascii=False, indent=2)
+    outputs["rel"] = str(rel_path)
+    print(f"✅ Đã lưu quan hệ:     {rel_path}")
+
+    if write_index:
+        for split in parsed:
+            index_path = build_index(output_dir / f"{split}.json", rel_path, split)
+            outputs[f"{split}_index"] = str(index_path)
+            print(f"✅ Đã lưu index:       {index_path}")
+    return {"outputs": outputs, "num_categories": len(category2id), "num_predicates": len(predicate_list)}
+
+
+def parse_split_spec(spec: str) -> Tuple[str, Path, str]:
+    """
+    "NAME=INPUT[:IMAGES_DIR]" -> (name, input, images_dir). Dấu ":" của ổ đĩa Windows (C:\\... hoặc C:/...)
+    ở đầu INPUT không bị coi là dấu phân cách; IMAGES_DIR lấy nguyên phần còn lại (có thể cũng là C:\\...).
+    Bỏ IMAGES_DIR -> thư mục ảnh của split cùng tên trong SPLITS (không có thì IMAGES_DIR mặc định).
+    """
+    name, sep, rest = spec.partition("=")
+    if not sep or not name or not rest:
+        raise ValueError(f"--split không hợp lệ: {spec!r} (cần NAME=INPUT[:IMAGES_DIR])")
+    m = re.match(r"((?:[A-Za-z]:[\\/])?[^:]*)(?::(.*))?$", rest)
+    inp, img_dir = m.group(1), m.group(2)
+    return name, Path(inp), img_dir or SPLITS.get(name, (None, IMAGES_DIR))[1]
+
+
 # === GỌI HÀM CHUYỂN ĐỔI ===
-convert_vg_to_coco_sgg(INPUT_PATH, OUTPUT_COCO, OUTPUT_REL, IMAGES_DIR)
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Chuyển VG-like (tiếng Việt) sang COCO + rel.json cho SGG.")
+    ap.add_argument("--split", action="append", default=[], metavar="NAME=INPUT[:IMAGES_DIR]",
+                    help="Chuyển nhiều split trong 1 lượt (lặp lại cho mỗi split), vd. train=train_vi.json:coco_uitvic_train")
+    ap.add_argument("--all-splits", action="store_true", help="Dùng cấu hình SPLITS ở đầu file")
+    ap.add_argument("--out-dir", default=str(OUTPUT_DIR), help="Thư mục ghi <split>.json + rel.json")
+    ap.add_argument("--no-index", action="store_true", help="Không ghi sidecar <split>.index.json")
+    args = ap.parse_args()
+
+    if args.split or args.all_splits:
+        splits = dict(SPLITS) if args.all_splits else {}
+        for spec in args.split:
+            name, inp, img_dir = parse_split_spec(spec)
+            splits[name] = (inp, img_dir)
+        convert_splits(splits, Path(args.out_dir), SIZE_CACHE_PATH, write_index=not args.no_index)
+    else:
+        convert_vg_to_coco_sgg(INPUT_PATH, OUTPUT_COCO, OUTPUT_REL, IMAGES_DIR, SIZE_CACHE_PATH)
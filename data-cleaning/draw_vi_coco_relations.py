@@ -10,8 +10,9 @@ Vẽ bbox & quan hệ (tiếng Việt) lên ảnh COCO-Style bằng OpenCV (trá
 
 Ảnh COCO có tên dạng 12 chữ số: 000000<image_id>.jpg (ví dụ image_id=7615 -> 000000007615.jpg)
 
-Chú ý tiếng Việt: OpenCV putText không hỗ trợ Unicode hoàn chỉnh. Ta dùng Pillow để vẽ chữ
-với font Unicode (Arial/SegoeUI/DejaVu/Noto), sau đó trả ảnh về OpenCV. 
+Chú ý tiếng Việt: OpenCV putText không hỗ trợ Unicode hoàn chỉnh. Ta dùng Pillow để render chữ
+với font Unicode (Arial/SegoeUI/DejaVu/Noto) thành sprite (cache theo font/size/chuỗi), rồi alpha-blend
+thẳng lên ảnh OpenCV -> box, mũi tên và chữ vẽ trong 1 lượt trên cùng 1 buffer BGR.
 
 Sử dụng:
   python viz/draw_vi_coco_relations.py output-AI/relationships_vi_coco_uitvic_test.json \
@@ -20,13 +21,21 @@ Sử dụng:
 Phụ thuộc: opencv-python, numpy, Pillow
 """
 from __future__ import annotations
-import os, json, argparse
+import os, sys, json, argparse, threading
 from typing import Dict, List, Tuple, Optional, Any
 
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+# image_index.py / render_manifest.py nằm ở thư mục gốc repo (dùng chung với convert_vg_to_coco.py, visual_vg_format.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_index import ImageIndex, candidate_names, probe_image_size  # noqa: E402
+from render_manifest import RenderManifest, digest, plan, source_sig  # noqa: E402
+
+
+RENDER_VERSION = 1  # tăng khi đổi cách vẽ -> manifest vẽ lại toàn bộ
+
 
 # ------------------------- I/O -------------------------
 def read_json(path: str):
@@ -47,13 +56,7 @@ def coco_name_from_id(image_id: int) -> str:
 
 def find_image_path(image_id: int, images_dir: str) -> Optional[str]:
     """Tìm ảnh theo nhiều ứng viên tên file trong thư mục images_dir; trả về đường dẫn đầu tiên tìm thấy."""
-    candidates = [
-        coco_name_from_id(image_id),
-        f"{image_id}.jpg",
-        f"{image_id}.png",
-        f"{int(image_id):012d}.png",
-    ]
-    for name in candidates:
+    for name in candidate_names(image_id):
         p = os.path.join(images_dir, name)
         if os.path.exists(p):
             return p
@@ -175,6 +178,83 @@ def get_vietnamese_font(size: int = 18) -> ImageFont.FreeTypeFont | ImageFont.Im
 
 
 # ------------------------- VẼ (PIL + OpenCV) -------------------------
+# Sprite chữ đã render sẵn: (font path, size, text, fg, bg) -> (dx, dy, màu BGR, alpha).
+# Nhãn / predicate là từ vựng nhỏ lặp lại nhiều -> mỗi chuỗi chỉ render bằng Pillow 1 lần,
+# sau đó chỉ alpha-blend lát NumPy lên ảnh BGR, không chuyển đổi cả khung hình BGR<->RGB.
+# Tra cache không cần khoá; lượt render + chèn/xoá giữ _SPRITE_LOCK (viewer vẽ nhiều ảnh song song trên các thread).
+_SPRITE_CACHE: Dict[Tuple, Tuple[int, int, np.ndarray, np.ndarray]] = {}
+_SPRITE_CACHE_MAX = 4096
+_SPRITE_LOCK = threading.Lock()
+
+
+def _text_sprite(text: str, font: ImageFont.ImageFont, fg, bg) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    """
+    Render (nền + chữ) bằng Pillow một lần: nền là hình chữ nhật đặc [0, -th-4] .. [tw+6, 2] quanh baseline,
+    chữ đặt tại (3, -th-1); phần nét chữ tràn ra ngoài nền vẫn được giữ (alpha theo độ phủ). Trả về (dx, dy) của góc trái-trên sprite
+    so với org_xy, màu BGR (h, w, 3) và alpha (h, w) uint8.
+    """
+    key = (getattr(font, "path", None), getattr(font, "size", None), text, tuple(fg),
+           tuple(bg) if bg is not None else None)
+    hit = _SPRITE_CACHE.get(key)
+    if hit is not None:
+        return hit
+    with _SPRITE_LOCK:
+        hit = _SPRITE_CACHE.get(key)  # thread khác có thể vừa render xong
+        if hit is None:
+            hit = _render_sprite(text, font, fg, bg)
+            if len(_SPRITE_CACHE) >= _SPRITE_CACHE_MAX:
+                _SPRITE_CACHE.pop(next(iter(_SPRITE_CACHE)))
+            _SPRITE_CACHE[key] = hit
+        return hit
+
+
+def _render_sprite(text: str, font: ImageFont.ImageFont, fg, bg) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    try:
+        bbox = draw.textbbox((0, 0), text, font=font)
+        tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    except Exception:
+        tw, th = draw.textsize(text, font=font)
+        bbox = (0, 0, tw, th)
+    tx, ty = 3, -th - 1  # gốc vẽ chữ so với org_xy
+    rect = (0, -th - 4, tw + 6, 2)  # PIL rectangle: gồm cả biên phải/dưới
+    x0 = min(rect[0], tx + bbox[0]) if bg is not None else tx + bbox[0]
+    y0 = min(rect[1], ty + bbox[1]) if bg is not None else ty + bbox[1]
+    x1 = max(rect[2] + 1, tx + bbox[2]) if bg is not None else tx + bbox[2]
+    y1 = max(rect[3] + 1, ty + bbox[3]) if bg is not None else ty + bbox[3]
+    w, h = max(1, x1 - x0), max(1, y1 - y0)
+
+    mask = Image.new("L", (w, h), 0)
+    ImageDraw.Draw(mask).text((tx - x0, ty - y0), text, font=font, fill=255)
+    m = np.asarray(mask, dtype=np.float32)[..., None] / 255.0
+    fg_bgr = np.asarray(fg[::-1], dtype=np.float32)  # fg/bg là màu RGB của Pillow
+    color = np.broadcast_to(fg_bgr, (h, w, 3)).copy()
+    alpha = m[..., 0].copy()
+    if bg is not None:
+        rx0, ry0, rx1, ry1 = rect[0] - x0, rect[1] - y0, rect[2] - x0 + 1, rect[3] - y0 + 1
+        bg_bgr = np.asarray(bg[::-1], dtype=np.float32)
+        color[ry0:ry1, rx0:rx1] = bg_bgr * (1.0 - m[ry0:ry1, rx0:rx1]) + fg_bgr * m[ry0:ry1, rx0:rx1]
+        alpha[ry0:ry1, rx0:rx1] = 1.0
+    return x0, y0, np.rint(color).astype(np.uint8), np.rint(alpha * 255).astype(np.uint8)
+
+
+def blit_sprite(img: np.ndarray, sprite: Tuple[int, int, np.ndarray, np.ndarray], org_xy: Tuple[int, int]) -> np.ndarray:
+    """Alpha-blend sprite lên ảnh BGR (tại chỗ), cắt theo biên ảnh."""
+    dx, dy, color, alpha = sprite
+    H, W = img.shape[:2]
+    x0, y0 = org_xy[0] + dx, org_xy[1] + dy
+    sx0, sy0 = max(0, -x0), max(0, -y0)
+    ix0, iy0 = max(0, x0), max(0, y0)
+    ix1, iy1 = min(W, x0 + color.shape[1]), min(H, y0 + color.shape[0])
+    if ix1 <= ix0 or iy1 <= iy0:
+        return img
+    c = color[sy0:sy0 + iy1 - iy0, sx0:sx0 + ix1 - ix0].astype(np.uint16)
+    a = alpha[sy0:sy0 + iy1 - iy0, sx0:sx0 + ix1 - ix0, None].astype(np.uint16)
+    roi = img[iy0:iy1, ix0:ix1]
+    roi[...] = ((roi.astype(np.uint16) * (255 - a) + c * a + 127) // 255).astype(np.uint8)
+    return img
+
+
 def draw_text_vi(
     img_bgr: np.ndarray,
     text: str,
@@ -183,30 +263,12 @@ def draw_text_vi(
     fg=(255, 255, 255),
     bg=(0, 0, 0),
 ) -> np.ndarray:
-    """Vẽ text Unicode lên ảnh BGR bằng Pillow. org_xy là toạ độ góc trái-dưới (giống cv2.putText)."""
-    # Chuyển BGR -> RGB cho Pillow
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    pil_img = Image.fromarray(img_rgb)
-    draw = ImageDraw.Draw(pil_img)
-    # Tính bbox của text
-    ascent, descent = font.getmetrics() if hasattr(font, "getmetrics") else (0, 0)
-    try:
-        bbox = draw.textbbox((0, 0), text, font=font)
-        tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
-    except Exception:
-        tw, th = draw.textsize(text, font=font)
-    x, y_baseline = org_xy
-    # Chúng ta coi org_xy là baseline, vẽ nền phía trên
-    x0, y0 = x, y_baseline - th - 4
-    x1, y1 = x + tw + 6, y_baseline + 2
-    # Vẽ nền (bg)
-    if bg is not None:
-        draw.rectangle([x0, y0, x1, y1], fill=bg)
-    # Vẽ text (điều chỉnh lên 1-2 px cho đẹp)
-    draw.text((x + 3, y_baseline - th - 1), text, font=font, fill=fg)
-    # Chuyển về BGR
-    out = cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
-    return out
+    """
+    Vẽ text Unicode (nền bg, chữ fg — màu RGB như Pillow) lên ảnh BGR, tại chỗ.
+    org_xy là toạ độ góc trái-dưới (giống cv2.putText). Chữ render bằng Pillow 1 lần / (font, text, màu)
+    rồi dùng lại từ cache.
+    """
+    return blit_sprite(img_bgr, _text_sprite(text, font, fg, bg), (int(org_xy[0]), int(org_xy[1])))
 
 
 def draw_box(img: np.ndarray, bbox_xyxy: List[float], color=(0, 165, 255), thick=2):
@@ -245,29 +307,30 @@ def to_xyxy(x: float, y: float, w: float, h: float) -> List[float]:
 
 
 # ------------------------- LOGIC -------------------------
-def visualize_entry(
+def resolve_image_path(image_id: int, images_dir: str, index: Optional[ImageIndex] = None) -> Optional[str]:
+    """Đường dẫn ảnh của image_id: qua ImageIndex nếu có, ngược lại dò từng tên ứng viên."""
+    if index is not None:
+        return index.path(int(image_id))
+    img_path = find_image_path(int(image_id), images_dir)
+    if img_path and not os.path.exists(img_path):
+        return None
+    return img_path
+
+
+def draw_entry(
+    img: np.ndarray,
     entry: dict,
-    images_dir: str,
-    out_dir: str,
     font: ImageFont.ImageFont,
     name_map: Optional[Dict[int, Dict[int, str]]] = None,
-) -> Optional[str]:
+    scale: float = 1.0,
+    thick: int = 2,
+) -> np.ndarray:
     """
-    Vẽ bbox + tên đối tượng + mũi tên quan hệ cho một bản ghi.
+    Vẽ bbox + tên đối tượng + mũi tên quan hệ của một bản ghi lên ảnh BGR (tại chỗ).
     - Ưu tiên tên từ dữ liệu (names[0]); nếu không có, dùng name_map nếu cung cấp; cuối cùng fallback "ĐT <id>".
-    - Lưu ảnh kết quả vào out_dir, trả về đường dẫn file đã lưu hoặc None nếu không vẽ được.
+    - scale: hệ số toạ độ khi ảnh đã bị thu nhỏ (thumbnail); thick: độ dày nét box / mũi tên.
     """
     image_id = entry.get("image_id")
-    if image_id is None:
-        return None
-    img_path = find_image_path(int(image_id), images_dir)
-    if not img_path or not os.path.exists(img_path):
-        return None
-
-    img = cv2.imread(img_path)
-    if img is None:
-        return None
-
     # object_id -> bbox_xyxy; object_id -> name (nếu có)
     id2bbox: Dict[int, List[float]] = {}
     id2name: Dict[int, str] = {}
@@ -294,11 +357,13 @@ def visualize_entry(
                     name = cand.strip()
                     break
         bbox = to_xyxy(x, y, w, h)
+        if scale != 1.0:
+            bbox = [v * scale for v in bbox]
         id2bbox[oid] = bbox
         if name:
             id2name[oid] = name
         # Vẽ bbox + nhãn (ưu tiên name_map, sau đó trường name nội bộ, rồi fallback)
-        img = draw_box(img, bbox, color=(0, 165, 255), thick=2)
+        img = draw_box(img, bbox, color=(0, 165, 255), thick=thick)
         # Ưu tiên dùng tên có sẵn trong dữ liệu, sau đó mới tới name_map nếu cung cấp.
         label = id2name.get(oid) or (name_map or {}).get(int(image_id), {}).get(oid) or f"ĐT {oid}"
         # vẽ label phía trên góc trái bbox
@@ -315,12 +380,39 @@ def visualize_entry(
             b2 = id2bbox[oid]
             c1 = center_of(b1)
             c2 = center_of(b2)
-            img = draw_arrow(img, c1, c2, color=(0, 0, 230), thick=2)
+            img = draw_arrow(img, c1, c2, color=(0, 0, 230), thick=thick)
             # Nhãn predicate ở giữa
             mx, my = (c1[0] + c2[0]) // 2, (c1[1] + c2[1]) // 2
             img = draw_text_vi(
                 img, pred, (mx, my), font, fg=(255, 255, 255), bg=(0, 0, 230)
             )
+    return img
+
+
+def visualize_entry(
+    entry: dict,
+    images_dir: str,
+    out_dir: str,
+    font: ImageFont.ImageFont,
+    name_map: Optional[Dict[int, Dict[int, str]]] = None,
+    index: Optional[ImageIndex] = None,
+) -> Optional[str]:
+    """
+    Vẽ một bản ghi lên ảnh gốc (draw_entry) và lưu.
+    - index (tuỳ chọn): ImageIndex của images_dir -> tra đường dẫn không cần stat từng ứng viên.
+    - Lưu ảnh kết quả vào out_dir, trả về đường dẫn file đã lưu hoặc None nếu không vẽ được.
+    """
+    image_id = entry.get("image_id")
+    if image_id is None:
+        return None
+    img_path = resolve_image_path(int(image_id), images_dir, index)
+    if not img_path:
+        return None
+
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+    img = draw_entry(img, entry, font, name_map)
 
     # Lưu
     ensure_dir(out_dir)
@@ -329,23 +421,272 @@ def visualize_entry(
     return out_path
 
 
-def visualize(json_path: str, images_dir: str, out_dir: str, name_map_path: Optional[str] = None) -> int:
-    """Vẽ cho toàn bộ dữ liệu trong JSON; trả về số ảnh đã lưu."""
+# ------------------------- SONG SONG (process pool) -------------------------
+# Trạng thái của mỗi worker: font, name_map, ImageIndex chỉ dựng 1 lần trong initializer.
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(images_dir: str, name_map_path: Optional[str]) -> None:
+    _WORKER["font"] = get_vietnamese_font(size=18)
+    _WORKER["name_map"] = load_name_map(name_map_path)
+    _WORKER["index"] = ImageIndex(images_dir)
+    _WORKER["images_dir"] = images_dir
+
+
+def _render_chunk(entries: List[dict], out_dir: str) -> List[Optional[str]]:
+    """Vẽ 1 nhóm bản ghi bằng trạng thái _WORKER; trả về đường dẫn đã lưu (None nếu không vẽ được) cho từng bản ghi."""
+    return [
+        visualize_entry(entry, _WORKER["images_dir"], out_dir, _WORKER["font"], _WORKER["name_map"], _WORKER["index"])
+        for entry in entries
+    ]
+
+
+def _render_parallel(entries: List[dict], images_dir: str, out_dir: str, name_map_path: Optional[str],
+                     workers: int) -> List[Optional[str]]:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from tqdm import tqdm
+
+    # nhóm nhỏ -> cân tải giữa các worker + tiến độ cập nhật đều
+    size = max(1, min(64, -(-len(entries) // (workers * 8))))
+    chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+    results: List[List[Optional[str]]] = [[] for _ in chunks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(images_dir, name_map_path)) as ex:
+        futures = {ex.submit(_render_chunk, c, out_dir): k for k, c in enumerate(chunks)}
+        with tqdm(total=len(entries), desc="Vẽ ảnh", unit="ảnh") as bar:
+            for fut in as_completed(futures):
+                k = futures[fut]
+                results[k] = fut.result()
+                bar.update(len(chunks[k]))
+    return [r for chunk in results for r in chunk]
+
+
+def load_entries(json_path: str) -> List[dict]:
+    """Bản ghi của file JSON: list các dict, hoặc 1 dict đơn."""
     data = read_json(json_path)
+    if isinstance(data, list):
+        return [e for e in data if isinstance(e, dict)]
+    return [data] if isinstance(data, dict) else []
+
+
+def render_settings(font: ImageFont.ImageFont) -> Dict[str, Any]:
+    """Cấu hình vẽ ảnh full-size; đổi bất kỳ giá trị nào -> manifest coi mọi ảnh đầu ra là cũ."""
+    return {
+        "version": RENDER_VERSION,
+        "font": font.path if isinstance(getattr(font, "path", None), str) else type(font).__name__,
+        "font_size": getattr(font, "size", None),
+        "box": [(0, 165, 255), 2],
+        "label": [(0, 0, 0), (0, 165, 255)],
+        "arrow": [(0, 0, 230), 2],
+        "predicate": [(255, 255, 255), (0, 0, 230)],
+    }
+
+
+def visualize(json_path: str, images_dir: str, out_dir: str, name_map_path: Optional[str] = None,
+              workers: int = 1, force: bool = False) -> int:
+    """
+    Vẽ cho toàn bộ dữ liệu trong JSON; trả về số ảnh đầu ra hiện có (vẽ mới + đã cập nhật từ lần trước).
+    workers > 1: chia bản ghi thành nhóm, vẽ song song bằng process pool (mỗi worker chọn font 1 lần);
+    workers <= 0: dùng số CPU. Số ảnh giống hệt khi chạy tuần tự.
+    Manifest trong out_dir (render_manifest.py): bỏ qua ảnh có bản ghi, ảnh nguồn và cấu hình vẽ không đổi;
+    xoá ảnh đầu ra của bản ghi không còn trong JSON. force: vẽ lại tất cả nhưng vẫn cập nhật manifest.
+    """
+    entries = load_entries(json_path)
     ensure_dir(out_dir)
-    font = get_vietnamese_font(size=18)
     name_map = load_name_map(name_map_path)
+    index = ImageIndex(images_dir)  # 1 lần scandir cho cả file JSON
+    font = get_vietnamese_font(size=18)
+    manifest = RenderManifest(out_dir, render_settings(font))
+
+    items = []
+    for entry in entries:
+        image_id = entry.get("image_id")
+        if image_id is None:
+            continue
+        img_path = resolve_image_path(int(image_id), images_dir, index)
+        if not img_path:
+            continue
+        entry_hash = digest([entry, name_map.get(int(image_id))])
+        items.append((os.path.basename(img_path), entry_hash, source_sig(img_path), entry))
+    todo, skipped, keep = plan(manifest, items, force)
+
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(todo))
+    todo_entries = [it[3] for it in todo]
+    if workers > 1:
+        results = _render_parallel(todo_entries, images_dir, out_dir, name_map_path, workers)
+    else:
+        _WORKER.update(font=font, name_map=name_map, index=index, images_dir=images_dir)
+        results = _render_chunk(todo_entries, out_dir)
+
     saved = 0
-    if isinstance(data, list):
-        for entry in data:
-            if not isinstance(entry, dict):
-                continue
-            if visualize_entry(entry, images_dir, out_dir, font, name_map):
-                saved += 1
-    elif isinstance(data, dict):
-        if visualize_entry(data, images_dir, out_dir, font, name_map):
+    failed = set()
+    for item, out_path in zip(todo, results):
+        if out_path:
             saved += 1
-    return saved
+            manifest.record(item[0], item[1], item[2])
+        else:
+            failed.add(item[0])
+    removed = manifest.prune(n for n in keep if n not in failed)
+    manifest.save()
+    print(f"⏭️ Bỏ qua {skipped} ảnh đã cập nhật, vẽ {saved} ảnh, xoá {removed} ảnh cũ")
+    return saved + skipped
+
+
+# ------------------------- CONTACT SHEET (review) -------------------------
+SHEET_CAPTION_H = 22  # chiều cao dòng chú thích image_id dưới mỗi ô
+SHEET_BG = (40, 40, 40)
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def _split_arg(v: Optional[str]) -> List[str]:
+    return [x.strip() for x in (v or "").split(",") if x.strip()]
+
+
+def select_entries(
+    entries: List[dict],
+    ids: Optional[List[int]] = None,
+    labels: Optional[List[str]] = None,
+    predicates: Optional[List[str]] = None,
+) -> List[dict]:
+    """Lọc bản ghi: image_id thuộc ids, có object nhãn thuộc labels, có quan hệ predicate thuộc predicates (AND)."""
+    ids_set = {int(i) for i in ids or []}
+    labels_set = set(labels or [])
+    preds_set = set(predicates or [])
+    out = []
+    for e in entries:
+        if ids_set and e.get("image_id") not in ids_set:
+            continue
+        if labels_set and not any(
+            isinstance(n, str) and n.strip() in labels_set
+            for o in e.get("objects", []) or [] for n in (o.get("names") or [])[:1]
+        ):
+            continue
+        if preds_set and not any(str(r.get("predicate")) in preds_set for r in e.get("relationships", []) or []):
+            continue
+        out.append(e)
+    return out
+
+
+def load_thumbnail(img_path: str, cell_w: int, cell_h: int) -> Optional[Tuple[np.ndarray, float]]:
+    """
+    Decode ảnh đã thu nhỏ vừa ô (cell_w, cell_h): đọc kích thước từ header rồi dùng IMREAD_REDUCED_COLOR_2/4/8
+    (libjpeg giải mã thẳng ở 1/2, 1/4, 1/8) -> không decode full-size. Trả về (ảnh BGR, hệ số so với ảnh gốc).
+    """
+    size = probe_image_size(img_path)
+    flag = cv2.IMREAD_COLOR
+    if size:
+        factor = max(size[0] / cell_w, size[1] / cell_h)  # = 1 / hệ số thu nhỏ để vừa ô
+        for r, f in _REDUCED_FLAGS:
+            if factor >= r:
+                flag = f
+                break
+    img = cv2.imread(img_path, flag)
+    if img is None:
+        return None
+    w0, h0 = size if size else (img.shape[1], img.shape[0])
+    scale = min(cell_w / w0, cell_h / h0, 1.0)
+    tw, th = max(1, round(w0 * scale)), max(1, round(h0 * scale))
+    if (img.shape[1], img.shape[0]) != (tw, th):
+        # sau khi decode giảm độ phân giải chỉ còn thu nhỏ < 2 lần -> INTER_LINEAR đủ đẹp và nhanh hơn INTER_AREA
+        interp = cv2.INTER_AREA if img.shape[1] >= 2 * tw else cv2.INTER_LINEAR
+        img = cv2.resize(img, (tw, th), interpolation=interp)
+    return img, scale
+
+
+def _sheet_fonts() -> Tuple[ImageFont.ImageFont, ImageFont.ImageFont]:
+    if "thumb_font" not in _WORKER:
+        _WORKER["thumb_font"] = get_vietnamese_font(size=12)
+        _WORKER["caption_font"] = get_vietnamese_font(size=14)
+    return _WORKER["thumb_font"], _WORKER["caption_font"]
+
+
+def _render_sheet(entries: List[dict], out_path: str, cols: int, rows: int, cell: int) -> Dict[str, Any]:
+    """Ghép tối đa cols x rows thumbnail đã vẽ annotation thành 1 trang JPEG (dùng trạng thái _WORKER)."""
+    thumb_font, caption_font = _sheet_fonts()
+    ch = cell + SHEET_CAPTION_H
+    page = np.full((rows * ch, cols * cell, 3), SHEET_BG, dtype=np.uint8)
+    placed, missing = [], []
+    for k, entry in enumerate(entries[: cols * rows]):
+        r, c = divmod(k, cols)
+        x0, y0 = c * cell, r * ch
+        image_id = entry.get("image_id")
+        img_path = resolve_image_path(int(image_id), _WORKER["images_dir"], _WORKER["index"]) \
+            if image_id is not None else None
+        thumb = load_thumbnail(img_path, cell - 4, cell - 4) if img_path else None
+        caption = str(image_id)
+        if thumb is None:
+            missing.append(image_id)
+            caption += " (thiếu ảnh)"
+        else:
+            img, scale = thumb
+            img = draw_entry(img, entry, thumb_font, _WORKER["name_map"], scale=scale, thick=1)
+            th, tw = img.shape[:2]
+            ox, oy = x0 + (cell - tw) // 2, y0 + (cell - th) // 2
+            page[oy:oy + th, ox:ox + tw] = img
+            placed.append(image_id)
+        draw_text_vi(page, caption, (x0 + 2, y0 + ch - 4), caption_font, fg=(255, 255, 255), bg=(0, 0, 0))
+    cv2.imwrite(out_path, page, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return {"page": os.path.basename(out_path), "image_ids": placed, "missing": missing}
+
+
+def contact_sheets(
+    json_path: str,
+    images_dir: str,
+    out_dir: str,
+    name_map_path: Optional[str] = None,
+    cols: int = 8,
+    rows: int = 6,
+    cell: int = 256,
+    ids: Optional[List[int]] = None,
+    labels: Optional[List[str]] = None,
+    predicates: Optional[List[str]] = None,
+    workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Chế độ review: thumbnail có annotation (decode giảm độ phân giải) ghép thành các trang cols x rows,
+    chú thích image_id dưới mỗi ô. Lọc theo ids / labels / predicates. Ghi sheet_0001.jpg, ... và sheets.json
+    (trang -> image_ids). workers > 1: mỗi trang vẽ trong 1 process (0 = số CPU).
+    """
+    from tqdm import tqdm
+
+    entries = select_entries(load_entries(json_path), ids, labels, predicates)
+    ensure_dir(out_dir)
+    per_page = cols * rows
+    pages = [entries[i:i + per_page] for i in range(0, len(entries), per_page)]
+    jobs = [(p, os.path.join(out_dir, f"sheet_{k + 1:04d}.jpg"), cols, rows, cell) for k, p in enumerate(pages)]
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    results: List[Dict[str, Any]] = []
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(images_dir, name_map_path)) as ex:
+            futures = [ex.submit(_render_sheet, *job) for job in jobs]
+            for fut in tqdm(futures, desc="Contact sheet", unit="trang"):
+                results.append(fut.result())
+    else:
+        _init_worker(images_dir, name_map_path)
+        for job in tqdm(jobs, desc="Contact sheet", unit="trang"):
+            results.append(_render_sheet(*job))
+
+    # Xoá trang cũ vượt quá số trang lần này (lọc hẹp hơn lần chạy trước) để sheets.json khớp với thư mục
+    current = {os.path.basename(job[1]) for job in jobs}
+    for fn in os.listdir(out_dir):
+        if fn.startswith("sheet_") and fn.endswith(".jpg") and fn not in current:
+            os.remove(os.path.join(out_dir, fn))
+
+    with open(os.path.join(out_dir, "sheets.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return {
+        "pages": len(results),
+        "images": sum(len(r["image_ids"]) for r in results),
+        "missing": sum(len(r["missing"]) for r in results),
+    }
 
 
 def main():
@@ -371,9 +712,44 @@ def main():
         help="ĐƯỜNG DẪN file JSON ánh xạ tên: image_id -> {object_id: name}. Tuỳ chọn.\n"
              "Mặc định script sẽ ưu tiên dùng trường 'names' hoặc 'name' có sẵn trong dữ liệu.",
     )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Số process vẽ song song (mặc định 1 = tuần tự; 0 = số CPU)",
+    )
+    ap.add_argument(
+        "--force",
+        action="store_true",
+        help="Vẽ lại mọi ảnh (không xét manifest trong thư mục --out, vẫn cập nhật manifest)",
+    )
+    ap.add_argument(
+        "--contact-sheet",
+        action="store_true",
+        help="Chế độ review: ghép thumbnail có annotation thành các trang sheet_XXXX.jpg thay vì ảnh full-size",
+    )
+    ap.add_argument("--grid", default="8x6", help="Số cột x số hàng mỗi trang contact sheet (mặc định 8x6)")
+    ap.add_argument("--thumb", type=int, default=256, help="Kích thước ô thumbnail (px, mặc định 256)")
+    ap.add_argument("--ids", default=None, help="Chỉ lấy các image_id (phân tách bằng dấu phẩy)")
+    ap.add_argument("--labels", default=None, help="Chỉ lấy ảnh có object mang nhãn này (phân tách bằng dấu phẩy)")
+    ap.add_argument("--predicates", default=None, help="Chỉ lấy ảnh có quan hệ này (phân tách bằng dấu phẩy)")
     args = ap.parse_args()
 
-    n = visualize(args.json, args.images, args.out, args.name_map)
+    if args.contact_sheet:
+        cols, _, rows = args.grid.lower().partition("x")
+        stats = contact_sheets(
+            args.json, args.images, args.out, args.name_map,
+            cols=int(cols), rows=int(rows or cols), cell=args.thumb,
+            ids=[int(i) for i in _split_arg(args.ids)],
+            labels=_split_arg(args.labels), predicates=_split_arg(args.predicates),
+            workers=args.workers,
+        )
+        print(f"✅ Đã ghép {stats['images']} ảnh vào {stats['pages']} trang: {args.out}")
+        if stats["missing"]:
+            print(f"⚠️ {stats['missing']} ảnh không tìm thấy (đánh dấu 'thiếu ảnh' trên trang).")
+        return
+
+    n = visualize(args.json, args.images, args.out, args.name_map, args.workers, force=args.force)
     print(f"✅ Đã lưu {n} ảnh vào: {args.out}")
     if n == 0:
         print(
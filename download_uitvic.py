@@ -9,7 +9,10 @@ Yêu cầu:
 
 Cách dùng:
 - Chạy từ thư mục gốc repo: python download_uitvic.py
-- Kết quả: dữ liệu được đặt/ghép vào ./data
+- Kết quả: mỗi file được lưu 1 lần trong kho địa chỉ hoá theo nội dung ./data/.store (image_store.py),
+  ./data là view hardlink/reflink/symlink với tên ảnh COCO 12 chữ số (000000007615.jpg) -> không nhân đôi
+  dung lượng so với cache kagglehub; chạy lại chỉ hash file mới/đổi và tạo link còn thiếu.
+- View tên rút gọn (7615.jpg): python rename_image.py data/coco_uitvic_train --view coco_uitvic_train
 """
 
 #Download datataset
@@ -23,16 +26,21 @@ path = kagglehub.dataset_download("leo040802/uitvic-dataset")
 
 print("Path to dataset files:", path)
 
-import shutil
 import os
 from pathlib import Path
 
+from image_store import ImageStore
+
 # Thiết lập thư mục đích local ./data để hợp nhất dữ liệu tải về
-# (không ghi đè toàn bộ, chỉ copy tree với dirs_exist_ok=True).
+# (không copy: file vào kho ./data/.store 1 lần, ./data chỉ chứa link tới object).
 # Robust copy: if `path` points to a cache/version folder, try to detect the real dataset root
 src_path = Path(path)  # path from kagglehub (already extracted in your run)
 local_dest = Path('.') / 'data'
 local_dest.mkdir(parents=True, exist_ok=True)
+# Kho object (sha256) + manifest; LINK_MODE: auto (hardlink -> reflink -> symlink -> copy), hardlink, reflink, symlink, copy
+STORE_DIR = local_dest / '.store'
+LINK_MODE = 'auto'
+HASH_WORKERS = os.cpu_count() or 4
 
 def looks_like_dataset_root(p: Path) -> bool:
     """
@@ -73,7 +81,7 @@ for c in candidates:
 if chosen is None and src_path.exists():
     chosen = src_path
 
-# Nếu tìm được source hợp lệ, tiến hành sao chép hợp nhất về ./data
+# Nếu tìm được source hợp lệ, ingest vào kho và dựng view ./data
 if chosen is None:
     print('No valid source dataset found at', src_path)
 else:
@@ -84,17 +92,15 @@ else:
         if Path(chosen).resolve() == local_dest.resolve():
             print('Source is same as destination; nothing to do.')
         else:
-            # Sao chép toàn bộ nội dung từ `chosen` sang `local_dest`.
-            # - Thư mục: copytree với dirs_exist_ok=True (ghép, không xoá đích).
-            # - Tệp đơn lẻ: copy2 để giữ metadata cơ bản.
-            # copy contents of chosen into local_dest (merge)
-            for item in Path(chosen).iterdir():
-                dest = local_dest / item.name
-                if item.is_dir():
-                    shutil.copytree(item, dest, dirs_exist_ok=True)
-                else:
-                    shutil.copy2(item, dest)
-            print('Dataset copied/extracted to:', local_dest)
+            # Không copy nguyên cây nữa: ingest vào kho (bỏ qua file có mtime/size không đổi, hash song song),
+            # rồi dựng ./data bằng link tới object với tên ảnh COCO 12 chữ số.
+            store = ImageStore(str(STORE_DIR))
+            stats = store.ingest(str(chosen), workers=HASH_WORKERS, mode=LINK_MODE)
+            print(f"Ingested {stats['files']} files: hashed {stats['hashed']}, stored {stats['stored']}, "
+                  f"deduplicated {stats['deduped']}, unchanged {stats['skipped']}")
+            stats = store.view(str(local_dest), naming='coco', mode=LINK_MODE)
+            print(f"View {local_dest}: linked {stats['linked']}, unchanged {stats['skipped']}, removed {stats['removed']}")
+            print('Dataset linked to:', local_dest)
     except Exception as e:
-        # Ghi log lỗi copy (ví dụ: quyền truy cập, đường dẫn dài, xung đột file đang mở, ...)
-        print('Error while copying dataset:', e)
\ No newline at end of file
+        # Ghi log lỗi ingest/link (ví dụ: quyền truy cập, đường dẫn dài, xung đột file đang mở, ...)
+        print('Error while ingesting dataset:', e)
\ No newline at end of file
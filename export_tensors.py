@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+export_tensors.py
+--------------------
+Xuất annotation SGG (COCO <split>.json + rel.json) thành mảng .npy liền khối cho loader huấn luyện
+(RelTR / EGTR / SGTR), mở bằng memmap -> worker không phải parse JSON / dựng lookup khi khởi động.
+
+Mỗi split ghi vào <out_dir>/<split>/:
+- image_ids.npy    int64 (M,)      image_id theo thứ tự images trong COCO
+- image_sizes.npy  int32 (M, 2)    (width, height)
+- obj_offsets.npy  int64 (M+1,)    object của ảnh i: [obj_offsets[i], obj_offsets[i+1])
+- boxes.npy        float32 (K, 4)  bbox COCO [x, y, w, h]
+- labels.npy       int32 (K,)      category_id (theo categories trong meta.json)
+- rel_offsets.npy  int64 (M+1,)    quan hệ của ảnh i: [rel_offsets[i], rel_offsets[i+1])
+- relations.npy    int32 (N, 3)    [subject_idx, object_idx, predicate_id], idx là chỉ số object local trong ảnh
+- meta.json        split, categories, rel_categories, số lượng
+
+Sử dụng:
+  python export_tensors.py --split train=datasets/train.json --split val=datasets/val.json --rel datasets/rel.json --out tensors
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def export_split(coco_path: Path, rel_path: Path, split: str, out_dir: Path,
+                 rel_data: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Xuất 1 split; thứ tự object trong mỗi ảnh giữ nguyên thứ tự annotation (khớp chỉ số local của rel.json)."""
+    with open(coco_path, "r", encoding="utf-8") as f:
+        coco = json.load(f)
+    if rel_data is None:
+        with open(rel_path, "r", encoding="utf-8") as f:
+            rel_data = json.load(f)
+    split_rels = rel_data.get(split, {})
+
+    images = coco["images"]
+    image_ids = np.asarray([img["id"] for img in images], dtype=np.int64)
+    image_sizes = np.asarray([[img["width"], img["height"]] for img in images], dtype=np.int32).reshape(-1, 2)
+    id2idx = {int(iid): i for i, iid in enumerate(image_ids.tolist())}
+
+    anns = coco["annotations"]
+    ann_img = np.asarray([id2idx[int(a["image_id"])] for a in anns], dtype=np.int64)
+    order = np.argsort(ann_img, kind="stable")  # gom theo ảnh, giữ thứ tự annotation trong ảnh
+    boxes = np.asarray([a["bbox"] for a in anns], dtype=np.float32).reshape(-1, 4)[order]
+    labels = np.asarray([a["category_id"] for a in anns], dtype=np.int32)[order]
+    obj_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ann_img, minlength=len(images)), out=obj_offsets[1:])
+
+    rel_counts = np.zeros(len(images), dtype=np.int64)
+    chunks = []
+    for i, iid in enumerate(image_ids.tolist()):
+        triples = split_rels.get(str(iid))
+        if triples:
+            rel_counts[i] = len(triples)
+            chunks.append(np.asarray(triples, dtype=np.int32).reshape(-1, 3))
+    relations = np.concatenate(chunks) if chunks else np.zeros((0, 3), dtype=np.int32)
+    rel_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(rel_counts, out=rel_offsets[1:])
+
+    # kiểm tra chỉ số local nằm trong số object của ảnh
+    n_obj = np.repeat(np.diff(obj_offsets), rel_counts)
+    bad = int(((relations[:, 0] >= n_obj) | (relations[:, 1] >= n_obj)).sum()) if len(relations) else 0
+    if bad:
+        print(f"⚠️ {split}: {bad} quan hệ tham chiếu object ngoài phạm vi ảnh")
+
+    out = Path(out_dir) / split
+    out.mkdir(parents=True, exist_ok=True)
+    arrays = {
+        "image_ids": image_ids, "image_sizes": image_sizes, "obj_offsets": obj_offsets,
+        "boxes": np.ascontiguousarray(boxes), "labels": np.ascontiguousarray(labels),
+        "rel_offsets": rel_offsets, "relations": np.ascontiguousarray(relations),
+    }
+    for name, arr in arrays.items():
+        np.save(out / f"{name}.npy", arr)
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "split": split,
+        "num_images": len(images),
+        "num_objects": int(len(labels)),
+        "num_relations": int(len(relations)),
+        "categories": coco.get("categories", []),
+        "rel_categories": rel_data.get("rel_categories", []),
+    }
+    with open(out / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+class SplitArrays:
+    """
+    Reader tối giản: mở các .npy bằng memmap (chia sẻ page cache giữa các worker).
+    image(i) trả về view (không copy) boxes / labels / triplets của ảnh thứ i.
+    """
+
+    def __init__(self, split_dir: Path, mmap_mode: str = "r"):
+        split_dir = Path(split_dir)
+        with open(split_dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(split_dir / f"{name}.npy", mmap_mode=mmap_mode)
+        self.image_ids = load("image_ids")
+        self.image_sizes = load("image_sizes")
+        self.obj_offsets = load("obj_offsets")
+        self.boxes = load("boxes")
+        self.labels = load("labels")
+        self.rel_offsets = load("rel_offsets")
+        self.relations = load("relations")
+        self._id2idx = None
+
+    def __len__(self) -> int:
+        return int(self.image_ids.shape[0])
+
+    def index_of(self, image_id: int) -> int:
+        """Chỉ số ảnh theo image_id (dựng dict 1 lần khi cần)."""
+        if self._id2idx is None:
+            self._id2idx = {int(iid): i for i, iid in enumerate(self.image_ids.tolist())}
+        return self._id2idx[int(image_id)]
+
+    def image(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(boxes (k,4) float32 [x,y,w,h], labels (k,) int32, triplets (n,3) int32) — đều là view của memmap."""
+        o0, o1 = int(self.obj_offsets[i]), int(self.obj_offsets[i + 1])
+        r0, r1 = int(self.rel_offsets[i]), int(self.rel_offsets[i + 1])
+        return self.boxes[o0:o1], self.labels[o0:o1], self.relations[r0:r1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export SGG annotations to memmap-able .npy arrays.")
+    ap.add_argument("--split", action="append", required=True, metavar="NAME=COCO_JSON",
+                    help="Split cần xuất (lặp lại), vd. train=datasets/train.json")
+    ap.add_argument("--rel", required=True, help="rel.json gộp ({split: {...}, rel_categories})")
+    ap.add_argument("--out", default="tensors", help="Thư mục đầu ra")
+    args = ap.parse_args()
+
+    with open(args.rel, "r", encoding="utf-8") as f:
+        rel_data = json.load(f)
+    for spec in args.split:
+        name, _, coco_path = spec.partition("=")
+        meta = export_split(Path(coco_path), Path(args.rel), name, Path(args.out), rel_data)
+        print(f"✅ {name}: {meta['num_images']} ảnh, {meta['num_objects']} object, "
+              f"{meta['num_relations']} quan hệ -> {Path(args.out) / name}")
+
+
+if __name__ == "__main__":
+    main()
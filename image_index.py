@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+image_index.py
+--------------------
+Chỉ mục thư mục ảnh + đọc kích thước ảnh từ header, dùng chung cho convert_vg_to_coco.py
+và data-cleaning/draw_vi_coco_relations.py:
+- ImageIndex: 1 lần os.scandir -> image_id -> đường dẫn, cùng thứ tự ưu tiên tên file như find_image_path
+  (000000<id>.jpg, <id>.jpg, <id>.png, 000000<id>.png) nhưng không stat từng ứng viên.
+- probe_image_size: đọc (width, height) từ header JPEG/PNG (vài KB đầu), fallback Pillow cho định dạng khác.
+- SizeCache: cache kích thước bền vững theo (đường dẫn, mtime, size) -> chuyển đổi lần sau không mở lại ảnh.
+"""
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def candidate_names(image_id: int) -> List[str]:
+    """Các tên file ứng viên theo thứ tự ưu tiên (giống find_image_path)."""
+    return [
+        f"{int(image_id):012d}.jpg",
+        f"{image_id}.jpg",
+        f"{image_id}.png",
+        f"{int(image_id):012d}.png",
+    ]
+
+
+# ------------------------- HEADER PROBE -------------------------
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    """Duyệt marker JPEG tới SOFn (bỏ qua DHT/JPG/DAC) để lấy kích thước."""
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        while b and b != b"\xff":
+            b = f.read(1)
+        while b == b"\xff":
+            b = f.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # marker không có độ dài
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        length = struct.unpack(">H", seg)[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:5])
+            return w, h
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def probe_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """(width, height) từ header; None nếu không đọc được. Giống Image.open(path).size (không xoay theo EXIF)."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head[:2] == b"\xff\xd8":
+                size = _jpeg_size(f)
+                if size:
+                    return size
+    except OSError:
+        return None
+    # định dạng khác / header lạ -> Pillow (vẫn chỉ đọc header)
+    try:
+        from PIL import Image
+
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+# ------------------------- SIZE CACHE -------------------------
+class SizeCache:
+    """{path: [mtime_ns, file_size, width, height]} lưu JSON; entry chỉ dùng khi mtime + size khớp."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.data: Dict[str, List[int]] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    def get(self, path: str, st: os.stat_result) -> Optional[Tuple[int, int]]:
+        e = self.data.get(path)
+        if e and e[0] == st.st_mtime_ns and e[1] == st.st_size:
+            return e[2], e[3]
+        return None
+
+    def set(self, path: str, st: os.stat_result, size: Tuple[int, int]):
+        self.data[path] = [st.st_mtime_ns, st.st_size, int(size[0]), int(size[1])]
+        self.dirty = True
+
+    def save(self):
+        if not (self.path and self.dirty):
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+# ------------------------- INDEX -------------------------
+class ImageIndex:
+    """Chỉ mục 1 thư mục ảnh (không đệ quy), xây bằng 1 lần os.scandir."""
+
+    def __init__(self, images_dir: str):
+        self.images_dir = images_dir
+        self.entries: Dict[str, os.DirEntry] = {}
+        try:
+            with os.scandir(images_dir) as it:
+                for e in it:
+                    if e.name.lower().endswith(IMAGE_EXTS) and e.is_file():
+                        self.entries[e.name] = e
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def path(self, image_id: int) -> Optional[str]:
+        """Đường dẫn ảnh của image_id (ứng viên đầu tiên có trong thư mục) hoặc None."""
+        for name in candidate_names(image_id):
+            e = self.entries.get(name)
+            if e is not None:
+                return e.path
+        return None
+
+    def image_sizes(self, image_ids: Iterable[int], cache: Optional[SizeCache] = None,
+                    workers: int = 8) -> Dict[int, Tuple[int, int]]:
+        """
+        image_id -> (width, height) cho các ảnh tìm thấy. Đọc header song song (thread pool, hợp với FS mạng);
+        ảnh có trong cache với mtime/size khớp thì không mở file.
+        """
+        out: Dict[int, Tuple[int, int]] = {}
+        todo: List[Tuple[int, str, os.stat_result]] = []
+        seen = set()
+        for iid in image_ids:
+            if iid in seen:
+                continue
+            seen.add(iid)
+            p = self.path(iid)
+            if p is None:
+                continue
+            st = self.entries[os.path.basename(p)].stat()
+            hit = cache.get(p, st) if cache is not None else None
+            if hit is not None:
+                out[iid] = hit
+            else:
+                todo.append((iid, p, st))
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+                sizes = list(ex.map(lambda t: probe_image_size(t[1]), todo))
+            for (iid, p, st), size in zip(todo, sizes):
+                if size is None:
+                    continue
+                out[iid] = size
+                if cache is not None:
+                    cache.set(p, st, size)
+        return out
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+image_store.py
+--------------------
+Kho ảnh địa chỉ hoá theo nội dung cho bước chuẩn bị dữ liệu (download_uitvic.py, rename_image.py):
+- ingest: mỗi file lưu đúng 1 lần tại <store>/objects/<2 ký tự đầu>/<sha256><ext>, hash song song (thread);
+  file nguồn có (mtime_ns, size) không đổi so với manifest -> bỏ qua, không đọc lại.
+- view: dựng thư mục theo quy ước tên "coco" (000000007615.jpg), "stripped" (7615.jpg) hoặc "original"
+  bằng hardlink / reflink / symlink tới object -> không nhân đôi dung lượng; view chạy lại chỉ tạo link còn thiếu.
+- verify: hash lại mọi object song song, báo object hỏng / mất.
+Manifest <store>/manifest.json: {"files": {đường dẫn tương đối: {sha256, size, mtime_ns}}, "views": {thư mục: {tên: sha256}}}.
+
+Lưu ý: ở mode hardlink, object và file nguồn / view dùng chung inode -> đừng sửa ảnh tại chỗ (verify sẽ phát hiện).
+
+Sử dụng:
+  python image_store.py ingest --src ~/.cache/kagglehub/datasets/leo040802/uitvic-dataset/versions/1 --store data/.store
+  python image_store.py view --store data/.store --dest data --naming coco
+  python image_store.py view --store data/.store --subset coco_uitvic_train --dest coco_uitvic_train --naming stripped
+  python image_store.py verify --store data/.store --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from image_index import IMAGE_EXTS
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+NAMINGS = ("coco", "stripped", "original")
+LINK_MODES = ("auto", "hardlink", "reflink", "symlink", "copy")
+FICLONE = 0x40049409  # ioctl reflink của Linux (btrfs, xfs, ...)
+CHUNK = 1 << 20
+
+
+# ------------------------- TÊN FILE -------------------------
+def view_name(filename: str, naming: str) -> str:
+    """Đổi tên ảnh có stem là số theo quy ước; file khác (annotation, ảnh tên chữ) giữ nguyên."""
+    stem, ext = os.path.splitext(filename)
+    if naming == "original" or ext.lower() not in IMAGE_EXTS or not stem.isdigit():
+        return filename
+    if naming == "coco":
+        return f"{int(stem):012d}{ext}"
+    return (stem.lstrip("0") or "0") + ext  # giống rename_image.py
+
+
+# ------------------------- HASH + LINK -------------------------
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _reflink(src: str, dst: str):
+    import fcntl  # không có trên Windows -> ImportError, mode auto sẽ thử cách khác
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def link_file(src: str, dst: str, mode: str = "auto", allow_symlink: bool = True) -> str:
+    """
+    Tạo dst trỏ tới nội dung src (ghi đè nguyên tử nếu dst đã có); trả về cách đã dùng.
+    mode auto: hardlink -> reflink -> symlink (nếu allow_symlink) -> copy.
+    """
+    order = {
+        "auto": ["hardlink", "reflink"] + (["symlink"] if allow_symlink else []) + ["copy"],
+        "hardlink": ["hardlink"], "reflink": ["reflink"], "symlink": ["symlink"], "copy": ["copy"],
+    }[mode]
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp = dst + ".tmp-link"
+    last_err: Optional[BaseException] = None
+    for how in order:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            if how == "hardlink":
+                os.link(src, tmp)
+            elif how == "reflink":
+                _reflink(src, tmp)
+            elif how == "symlink":
+                os.symlink(os.path.abspath(src), tmp)
+            else:
+                shutil.copy2(src, tmp)
+        except (OSError, ImportError, NotImplementedError) as e:
+            last_err = e
+            continue
+        os.replace(tmp, dst)
+        return how
+    raise OSError(f"Không tạo được {dst} từ {src} (mode={mode}): {last_err}")
+
+
+# ------------------------- STORE -------------------------
+class ImageStore:
+    """Kho object <root>/objects + manifest; mọi thao tác ghi manifest nguyên tử khi save()."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.files: Dict[str, Dict] = {}
+        self.views: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format_version") == FORMAT_VERSION:
+                self.files = data.get("files", {})
+                self.views = data.get("views", {})
+
+    def object_path(self, sha: str, ext: str = "") -> str:
+        return os.path.join(self.root, "objects", sha[:2], sha + ext.lower())
+
+    def object_for(self, rel: str) -> str:
+        return self.object_path(self.files[rel]["sha256"], os.path.splitext(rel)[1])
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"format_version": FORMAT_VERSION, "files": self.files, "views": self.views}, f,
+                      ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    # ----- ingest -----
+    def ingest(self, src_dir: str, prefix: str = "", workers: int = 8, mode: str = "auto") -> Dict[str, int]:
+        """
+        Đưa mọi file trong src_dir vào kho với khoá "<prefix>/<đường dẫn tương đối>".
+        Chỉ hash file mới / đổi (mtime_ns, size); object trùng nội dung lưu 1 lần.
+        Khoá dưới prefix không còn trong src_dir bị xoá khỏi manifest (object giữ tới gc).
+        """
+        src_dir = os.path.abspath(src_dir)
+        store_abs = os.path.abspath(self.root)
+        prefix = prefix.strip("/")
+        seen: List[Tuple[str, str, os.stat_result]] = []
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            dirnames[:] = sorted(d for d in dirnames
+                                 if os.path.abspath(os.path.join(dirpath, d)) != store_abs)
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, src_dir).replace(os.sep, "/")
+                if prefix:
+                    rel = f"{prefix}/{rel}"
+                seen.append((rel, path, os.stat(path)))
+
+        todo = []
+        skipped = 0
+        for rel, path, st in seen:
+            rec = self.files.get(rel)
+            if (rec and rec.get("size") == st.st_size and rec.get("mtime_ns") == st.st_mtime_ns
+                    and os.path.exists(self.object_for(rel))):
+                skipped += 1
+            else:
+                todo.append((rel, path, st))
+
+        # hashlib nhả GIL khi hash khối lớn -> thread đủ song song cho I/O + hash
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            hashes = list(ex.map(lambda t: file_sha256(t[1]), todo))
+
+        stored = deduped = 0
+        for (rel, path, st), sha in zip(todo, hashes):
+            obj = self.object_path(sha, os.path.splitext(rel)[1])
+            if os.path.exists(obj):
+                deduped += 1
+            else:
+                # object phải là file thật: không symlink về nguồn (cache có thể bị xoá)
+                link_file(path, obj, mode, allow_symlink=False)
+                stored += 1
+            self.files[rel] = {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+        keys = {rel for rel, _, _ in seen}
+        under = (lambda k: k.startswith(prefix + "/")) if prefix else (lambda k: True)
+        dropped = [k for k in self.files if under(k) and k not in keys]
+        for k in dropped:
+            del self.files[k]
+        self.save()
+        return {"files": len(seen), "hashed": len(todo), "stored": stored, "deduped": deduped,
+                "skipped": skipped, "dropped": len(dropped)}
+
+    # ----- view -----
+    def view(self, dest: str, naming: str = "coco", subset: str = "", mode: str = "auto") -> Dict[str, int]:
+        """
+        Dựng dest từ các khoá dưới subset (giữ thư mục con), đổi tên ảnh theo naming.
+        Link đã đúng theo manifest thì bỏ qua; link do view này tạo trước đó mà không còn khoá thì xoá.
+        """
+        if naming not in NAMINGS:
+            raise ValueError(f"naming phải là một trong {NAMINGS}")
+        subset = subset.strip("/")
+        dest_key = os.path.abspath(dest)
+        old = self.views.get(dest_key, {})
+        new: Dict[str, str] = {}
+        used: Dict[str, str] = {}
+        linked = skipped = conflicts = 0
+        modes: Dict[str, int] = {}
+        for rel in sorted(self.files):
+            if subset:
+                if not rel.startswith(subset + "/"):
+                    continue
+                sub = rel[len(subset) + 1:]
+            else:
+                sub = rel
+            head, tail = os.path.split(sub)
+            out = (f"{head}/" if head else "") + view_name(tail, naming)
+            if out in used:
+                print(f"⚠️ Trùng tên trong view: {used[out]} và {rel} -> {out}, giữ file đầu")
+                conflicts += 1
+                continue
+            used[out] = rel
+            sha = self.files[rel]["sha256"]
+            new[out] = sha
+            target = os.path.join(dest, *out.split("/"))
+            if old.get(out) == sha and os.path.exists(target):
+                skipped += 1
+                continue
+            how = link_file(self.object_for(rel), target, mode)
+            modes[how] = modes.get(how, 0) + 1
+            linked += 1
+
+        removed = 0
+        for out in old:
+            if out not in new:
+                try:
+                    os.remove(os.path.join(dest, *out.split("/")))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        self.views[dest_key] = new
+        self.save()
+        return {"files": len(new), "linked": linked, "skipped": skipped, "removed": removed,
+                "conflicts": conflicts, **{f"mode_{k}": v for k, v in modes.items()}}
+
+    # ----- verify / gc -----
+    def verify(self, workers: int = 8) -> List[str]:
+        """Hash lại song song mọi object được tham chiếu; trả về các khoá có object mất / sai checksum."""
+        objects: Dict[str, List[str]] = {}
+        for rel in self.files:
+            objects.setdefault(self.object_for(rel), []).append(rel)
+
+        def check(obj: str) -> bool:
+            try:
+                return file_sha256(obj) == os.path.basename(obj).split(".")[0]
+            except OSError:
+                return False
+
+        paths = sorted(objects)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            oks = list(ex.map(check, paths))
+        return sorted(rel for obj, ok in zip(paths, oks) if not ok for rel in objects[obj])
+
+    def gc(self) -> int:
+        """Xoá object không còn khoá nào tham chiếu; trả về số object đã xoá."""
+        live = {os.path.abspath(self.object_for(rel)) for rel in self.files}
+        removed = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            for name in filenames:
+                path = os.path.abspath(os.path.join(dirpath, name))
+                if path not in live:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+def _fmt(stats: Dict[str, int]) -> str:
+    return ", ".join(f"{k}={v}" for k, v in stats.items())
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    ap = argparse.ArgumentParser(description="Kho ảnh địa chỉ hoá theo nội dung + view hardlink/reflink/symlink.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ingest", help="Đưa thư mục nguồn vào kho (bỏ qua file không đổi)")
+    p.add_argument("--src", required=True, help="Thư mục nguồn (vd. cache kagglehub)")
+    p.add_argument("--store", default="data/.store", help="Thư mục kho")
+    p.add_argument("--prefix", default="", help="Tiền tố khoá trong manifest (vd. coco_uitvic_train)")
+    p.add_argument("--workers", type=int, default=8, help="Số thread hash")
+    p.add_argument("--mode", choices=[m for m in LINK_MODES if m != "symlink"], default="auto",
+                   help="Cách đưa file vào kho (auto: hardlink -> reflink -> copy)")
+
+    p = sub.add_parser("view", help="Dựng thư mục ảnh theo quy ước tên từ kho")
+    p.add_argument("--store", default="data/.store", help="Thư mục kho")
+    p.add_argument("--dest", required=True, help="Thư mục view")
+    p.add_argument("--naming", choices=NAMINGS, default="coco",
+                   help="coco: 000000007615.jpg, stripped: 7615.jpg, original: giữ tên")
+    p.add_argument("--subset", default="", help="Chỉ lấy khoá dưới tiền tố này (vd. coco_uitvic_train)")
+    p.add_argument("--mode", choices=LINK_MODES, default="auto",
+                   help="auto: hardlink -> reflink -> symlink -> copy")
+
+    p = sub.add_parser("verify", help="Kiểm tra checksum mọi object song song")
+    p.add_argument("--store", default="data/.store", help="Thư mục kho")
+    p.add_argument("--workers", type=int, default=8, help="Số thread hash")
+
+    p = sub.add_parser("gc", help="Xoá object không còn được tham chiếu")
+    p.add_argument("--store", default="data/.store", help="Thư mục kho")
+
+    args = ap.parse_args(argv)
+    store = ImageStore(args.store)
+    if args.cmd == "ingest":
+        print(f"✅ Ingest {args.src} -> {args.store}: {_fmt(store.ingest(args.src, args.prefix, args.workers, args.mode))}")
+    elif args.cmd == "view":
+        print(f"✅ View {args.dest} ({args.naming}): {_fmt(store.view(args.dest, args.naming, args.subset, args.mode))}")
+    elif args.cmd == "verify":
+        bad = store.verify(args.workers)
+        if bad:
+            print(f"⚠️ {len(bad)} file có object mất / sai checksum:")
+            for rel in bad[:20]:
+                print("   ", rel)
+            raise SystemExit(1)
+        print(f"✅ {len(store.files)} file khớp checksum")
+    else:
+        print(f"✅ Đã xoá {store.gc()} object không còn tham chiếu")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,7 @@ def merge_rel_files(rel_files, output_file):
     merged_test = {}
     merged_train = {}
     merged_categories = []
-    categories_set = set()
+    category_index = {}
 
     for rel_path in rel_files:
         if not os.path.exists(rel_path):
@@ -22,18 +22,23 @@ def merge_rel_files(rel_files, output_file):
             continue
         with open(rel_path, "r", encoding="utf-8") as f:
             data = json.load(f)
+            # Gộp rel_categories trước -> đổi id predicate của file này sang id trong danh sách gộp
+            # (mỗi file tự đánh id theo từ vựng riêng nên cùng 1 id có thể là 2 predicate khác nhau)
+            local_to_merged = []
+            for cat in data.get("rel_categories", []):
+                if cat not in category_index:
+                    category_index[cat] = len(merged_categories)
+                    merged_categories.append(cat)
+                local_to_merged.append(category_index[cat])
+            remapped = {
+                k: [[s, o, local_to_merged[p]] for s, o, p in v]
+                for k, v in data.get("test", {}).items()
+            }
             # Gộp phần test hoặc train
             if "val" in rel_path:
-                for k, v in data.get("test", {}).items():
-                    merged_test[k] = v
+                merged_test.update(remapped)
             elif "train" in rel_path:
-                for k, v in data.get("test", {}).items():
-                    merged_train[k] = v
-            # Gộp rel_categories
-            for cat in data.get("rel_categories", []):
-                if cat not in categories_set:
-                    merged_categories.append(cat)
-                    categories_set.add(cat)
+                merged_train.update(remapped)
 
     merged = {
         "train": merged_train,
@@ -44,5 +49,6 @@ def merge_rel_files(rel_files, output_file):
         json.dump(merged, f, ensure_ascii=False, indent=2)
     print(f"✅ Đã lưu file ghép: {output_file}")
 
+# Khuyến nghị: convert_vg_to_coco.py --all-splits ghi rel.json gộp với từ vựng chung (không cần bước này)
 if __name__ == "__main__":
     merge_rel_files(REL_FILES, OUTPUT_FILE)
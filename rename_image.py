@@ -1,3 +1,16 @@
+"""
+rename_image.py
+--------------------
+Đưa ảnh về tên rút gọn (000123.jpg -> 123.jpg).
+- Mặc định: đổi tên tại chỗ (như trước, mất tên COCO 12 chữ số).
+- --view DEST: không đụng tới thư mục gốc; ingest vào kho image_store.py (bỏ qua file không đổi)
+  rồi dựng DEST bằng hardlink/reflink/symlink với tên rút gọn -> cả 2 quy ước tên cùng tồn tại, không tốn thêm dung lượng.
+
+Sử dụng:
+  python rename_image.py coco_uitvic_train
+  python rename_image.py data/coco_uitvic_train --view coco_uitvic_train --store data/.store
+"""
+import argparse
 import os
 
 
@@ -24,6 +37,29 @@ def rename_images(folder: str) -> None:
                 os.rename(old_path, new_path)
 
 
+def link_stripped_view(folder: str, dest: str, store_dir: str, mode: str = "auto", workers: int = 8) -> None:
+    """Dựng view tên rút gọn của `folder` tại `dest` qua kho ảnh địa chỉ hoá theo nội dung (giữ nguyên `folder`)."""
+    from image_store import ImageStore
+
+    store = ImageStore(store_dir)
+    prefix = os.path.basename(os.path.normpath(folder))
+    stats = store.ingest(folder, prefix=prefix, workers=workers)
+    print(f"✅ Ingest {folder}: {stats['hashed']} file hash mới, {stats['skipped']} file không đổi")
+    stats = store.view(dest, naming="stripped", subset=prefix, mode=mode)
+    print(f"✅ View {dest}: {stats['linked']} link mới, {stats['skipped']} không đổi, {stats['removed']} đã xoá")
+
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Bỏ số 0 ở đầu tên ảnh .jpg (tại chỗ hoặc qua view link).")
     # Mặc định dùng thư mục coco_uitvic_train như trước đây
-    rename_images("coco_uitvic_train")
+    ap.add_argument("folder", nargs="?", default="coco_uitvic_train", help="Thư mục ảnh")
+    ap.add_argument("--view", default=None, help="Dựng view tên rút gọn tại đây thay vì đổi tên tại chỗ")
+    ap.add_argument("--store", default=os.path.join("data", ".store"), help="Thư mục kho image_store.py")
+    ap.add_argument("--mode", choices=["auto", "hardlink", "reflink", "symlink", "copy"], default="auto",
+                    help="Cách tạo view (auto: hardlink -> reflink -> symlink -> copy)")
+    ap.add_argument("--workers", type=int, default=8, help="Số thread hash khi ingest")
+    args = ap.parse_args()
+    if args.view:
+        link_stripped_view(args.folder, args.view, args.store, args.mode, args.workers)
+    else:
+        rename_images(args.folder)
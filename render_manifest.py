@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+render_manifest.py
+--------------------
+Manifest cho render ảnh tăng dần (data-cleaning/draw_vi_coco_relations.py, visual_vg_format.py):
+mỗi ảnh đầu ra -> hash bản ghi annotation, (mtime_ns, size) của ảnh nguồn và hash cấu hình vẽ (font, màu, kích thước).
+- is_current: ảnh đầu ra còn đúng -> bỏ qua, không decode / vẽ / ghi lại;
+- prune: xoá ảnh đầu ra (do manifest quản lý) của các bản ghi không còn trong JSON.
+Manifest lưu tại <out_dir>/.render_manifest.json, ghi nguyên tử.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MANIFEST_NAME = ".render_manifest.json"
+
+
+def digest(obj: Any) -> str:
+    """Hash ổn định của 1 object JSON (thứ tự khoá không ảnh hưởng)."""
+    blob = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def source_sig(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class RenderManifest:
+    """{"settings": hash, "outputs": {tên file: {"entry": hash, "src": [mtime_ns, size]}}}."""
+
+    def __init__(self, out_dir: str, settings: Dict[str, Any]):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.settings = digest(settings)
+        self.outputs: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("settings") == self.settings:
+                    self.outputs = data.get("outputs", {})
+                else:
+                    # cấu hình vẽ đổi: mọi ảnh cũ phải vẽ lại, nhưng vẫn nhớ tên để prune
+                    self.outputs = {k: {} for k in data.get("outputs", {})}
+                    self.dirty = True
+            except (OSError, ValueError):
+                self.outputs = {}
+
+    def is_current(self, out_name: str, entry_hash: str, src: Optional[List[int]]) -> bool:
+        rec = self.outputs.get(out_name)
+        return bool(
+            rec and src is not None and rec.get("entry") == entry_hash and rec.get("src") == src
+            and os.path.exists(os.path.join(self.out_dir, out_name))
+        )
+
+    def record(self, out_name: str, entry_hash: str, src: Optional[List[int]]):
+        self.outputs[out_name] = {"entry": entry_hash, "src": src}
+        self.dirty = True
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Xoá ảnh đầu ra không còn bản ghi tương ứng; trả về số file đã xoá."""
+        keep = set(keep)
+        removed = 0
+        for name in [n for n in self.outputs if n not in keep]:
+            try:
+                os.remove(os.path.join(self.out_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            del self.outputs[name]
+            self.dirty = True
+        return removed
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "outputs": self.outputs}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def plan(manifest: RenderManifest, items: Iterable[Tuple[str, str, Optional[List[int]], Any]], force: bool = False):
+    """
+    items: (out_name, entry_hash, src_sig, payload). Trả về (todo, skipped, keep):
+    todo là các item cần vẽ, skipped là số ảnh đã cập nhật, keep là tên mọi ảnh đầu ra hợp lệ.
+    force=True -> vẽ lại tất cả (bỏ qua is_current); caller vẫn record / prune / save như thường.
+    """
+    todo, keep, skipped = [], [], 0
+    for item in items:
+        keep.append(item[0])
+        if not force and manifest.is_current(item[0], item[1], item[2]):
+            skipped += 1
+        else:
+            todo.append(item)
+    return todo, skipped, keep
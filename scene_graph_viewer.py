@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+scene_graph_viewer.py
+--------------------
+Trình xem scene graph cục bộ (HTTP trên localhost) thay cho việc vẽ sẵn toàn bộ ảnh ra đĩa:
+- nạp annotation 1 lần (VG-like list, hoặc COCO <split>.json + rel.json; có sidecar <split>.index.json
+  của annotation_index.py thì đọc từng ảnh bằng seek, không nạp cả file COCO);
+- chỉ vẽ ảnh khi được xem (draw_entry của data-cleaning/draw_vi_coco_relations.py), kết quả JPEG giữ trong LRU;
+- phân trang, tìm theo image_id / nhãn / triplet (chủ ngữ|predicate|tân ngữ, để trống = bất kỳ), prev/next bằng
+  phím ← →, trình duyệt tải trước ảnh kế tiếp.
+
+Sử dụng:
+  python scene_graph_viewer.py --json output-AI/relationships_vi_coco_uitvic_test.json --images data/coco_uitvic_test
+  python scene_graph_viewer.py --coco datasets/val.json --rel datasets/rel.json --split val --images coco_uitvic_test
+  -> mở http://127.0.0.1:8765
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "data-cleaning"))
+
+from annotation_index import AnnotationIndex, default_index_path  # noqa: E402
+from draw_vi_coco_relations import (  # noqa: E402
+    draw_entry,
+    get_vietnamese_font,
+    load_entries,
+    load_thumbnail,
+    resolve_image_path,
+)
+from image_index import ImageIndex  # noqa: E402
+
+
+# ------------------------- NGUỒN DỮ LIỆU -------------------------
+class VGSource:
+    """File VG-like (list bản ghi image_id / objects / relationships) — đúng định dạng draw_entry dùng."""
+
+    def __init__(self, json_path: str):
+        entries = load_entries(json_path)
+        self.entries = {int(e["image_id"]): e for e in entries if e.get("image_id") is not None}
+        self.image_ids: List[int] = list(self.entries)
+
+    def entry(self, image_id: int) -> dict:
+        return self.entries[image_id]
+
+    def labels(self, image_id: int) -> List[str]:
+        return [str((o.get("names") or [""])[0]) for o in self.entries[image_id].get("objects", []) or []]
+
+    def triplets(self, image_id: int) -> List[Tuple[str, str, str]]:
+        e = self.entries[image_id]
+        names = {o.get("object_id"): str((o.get("names") or [""])[0]) for o in e.get("objects", []) or []}
+        return [(names.get(r.get("subject_id"), ""), str(r.get("predicate", "")), names.get(r.get("object_id"), ""))
+                for r in e.get("relationships", []) or []]
+
+
+class _InMemoryCoco:
+    """Cùng giao diện với AnnotationIndex khi không có sidecar: nạp COCO + rel rồi gom theo ảnh."""
+
+    def __init__(self, coco_path: str, rel_path: Optional[str], split: Optional[str]):
+        with open(coco_path, "r", encoding="utf-8") as f:
+            coco = json.load(f)
+        self.categories = {c["id"]: c for c in coco.get("categories", [])}
+        self.image_ids = [img["id"] for img in coco["images"]]
+        self._anns: Dict[int, List[dict]] = {}
+        for a in coco["annotations"]:
+            self._anns.setdefault(a["image_id"], []).append(a)
+        self._rels: Dict[str, List[List[int]]] = {}
+        if rel_path:
+            with open(rel_path, "r", encoding="utf-8") as f:
+                self._rels = json.load(f).get(split, {})
+
+    def annotations(self, image_id: int) -> List[dict]:
+        return self._anns.get(image_id, [])
+
+    def category_ids(self, image_id: int) -> List[int]:
+        return [a["category_id"] for a in self._anns.get(image_id, [])]
+
+    def relations(self, image_id: int) -> List[List[int]]:
+        return self._rels.get(str(image_id), [])
+
+
+class CocoSource:
+    """COCO <split>.json + rel.json; dùng sidecar index nếu có và còn khớp file."""
+
+    def __init__(self, coco_path: str, rel_path: Optional[str], split: Optional[str]):
+        split = split or Path(coco_path).stem
+        self.rel_categories: List[str] = []
+        if rel_path:
+            with open(rel_path, "r", encoding="utf-8") as f:
+                self.rel_categories = json.load(f).get("rel_categories", [])
+        index_path = default_index_path(coco_path)
+        self.ix: Any = None
+        if index_path.exists():
+            try:
+                self.ix = AnnotationIndex(index_path)
+            except ValueError as e:
+                print(f"⚠️ {e} -> nạp toàn bộ file COCO")
+        if self.ix is None:
+            self.ix = _InMemoryCoco(coco_path, rel_path, split)
+        self.image_ids: List[int] = list(self.ix.image_ids)
+        self.cat_names = {cid: c["name"] for cid, c in self.ix.categories.items()}
+
+    def _pred(self, pid: int) -> str:
+        return self.rel_categories[pid] if 0 <= pid < len(self.rel_categories) else str(pid)
+
+    def entry(self, image_id: int) -> dict:
+        anns = self.ix.annotations(image_id)
+        objects = [{"object_id": k, "names": [self.cat_names.get(a["category_id"], "unknown")],
+                    "x": a["bbox"][0], "y": a["bbox"][1], "w": a["bbox"][2], "h": a["bbox"][3]}
+                   for k, a in enumerate(anns)]
+        rels = [{"subject_id": s, "predicate": self._pred(p), "object_id": o}
+                for s, o, p in self.ix.relations(image_id)]
+        return {"image_id": image_id, "objects": objects, "relationships": rels}
+
+    def labels(self, image_id: int) -> List[str]:
+        return [self.cat_names.get(c, "unknown") for c in self.ix.category_ids(image_id)]
+
+    def triplets(self, image_id: int) -> List[Tuple[str, str, str]]:
+        labels = self.labels(image_id)
+        get = lambda i: labels[i] if 0 <= i < len(labels) else ""
+        return [(get(s), self._pred(p), get(o)) for s, o, p in self.ix.relations(image_id)]
+
+
+# ------------------------- VIEWER -------------------------
+class SceneGraphViewer:
+    """Tìm kiếm + vẽ theo yêu cầu; LRU ảnh JPEG đã vẽ và LRU kết quả tìm kiếm."""
+
+    def __init__(self, source, images_dir: str, cache_size: int = 256, max_size: int = 1280):
+        self.source = source
+        self.images_dir = images_dir
+        self.index = ImageIndex(images_dir)
+        self.font = get_vietnamese_font(size=18)
+        self.thumb_font = get_vietnamese_font(size=14)
+        self.cache_size = cache_size
+        self.max_size = max_size
+        self.pos = {iid: i for i, iid in enumerate(source.image_ids)}
+        self._renders: "OrderedDict[int, bytes]" = OrderedDict()
+        self._searches: "OrderedDict[Tuple, Tuple[List[int], Dict[int, int]]]" = OrderedDict()
+        self.lock = threading.Lock()  # nguồn (seek file) + các LRU; cache sprite chữ có khoá riêng (_SPRITE_LOCK)
+
+    # --- tìm kiếm ---
+    def search(self, image_id: str = "", label: str = "", triplet: str = "") -> List[int]:
+        return self.search_index(image_id, label, triplet)[0]
+
+    def search_index(self, image_id: str = "", label: str = "", triplet: str = "") -> Tuple[List[int], Dict[int, int]]:
+        """Như search, kèm {image_id: vị trí} dựng 1 lần cùng kết quả trong LRU (info tra O(1) mỗi lần chuyển ảnh)."""
+        key = (image_id.strip(), label.strip(), triplet.strip())
+        if not any(key):
+            return self.source.image_ids, self.pos
+        with self.lock:
+            hit = self._searches.get(key)
+            if hit is not None:
+                self._searches.move_to_end(key)
+                return hit
+            ids = self.source.image_ids
+            if key[0]:
+                want = {int(x) for x in key[0].replace(" ", "").split(",") if x.lstrip("-").isdigit()}
+                ids = [i for i in ids if i in want]
+            if key[1]:
+                ids = [i for i in ids if any(key[1] in lb for lb in self.source.labels(i))]
+            if key[2]:
+                parts = (key[2].split("|") + ["", ""])[:3]
+                parts = [p.strip() for p in parts]
+                ids = [i for i in ids if any(all(not q or q in v for q, v in zip(parts, t))
+                                             for t in self.source.triplets(i))]
+            hit = (ids, {iid: k for k, iid in enumerate(ids)})
+            self._searches[key] = hit
+            if len(self._searches) > 32:
+                self._searches.popitem(last=False)
+            return hit
+
+    def page(self, ids: List[int], page: int, size: int) -> Dict[str, Any]:
+        page = max(0, page)
+        return {"total": len(ids), "page": page, "size": size, "ids": ids[page * size:(page + 1) * size]}
+
+    def info(self, image_id: int, ids: List[int], pos: Dict[int, int]) -> Dict[str, Any]:
+        """Metadata 1 ảnh + prev/next trong danh sách kết quả hiện tại (pos: image_id -> vị trí trong ids)."""
+        with self.lock:
+            triplets = self.source.triplets(image_id)
+            labels = self.source.labels(image_id)
+        k = pos.get(image_id, -1)
+        return {
+            "image_id": image_id,
+            "position": k,
+            "total": len(ids),
+            "prev": ids[k - 1] if k > 0 else None,
+            "next": ids[k + 1] if 0 <= k < len(ids) - 1 else None,
+            "labels": labels,
+            "triplets": triplets,
+        }
+
+    # --- vẽ ---
+    def render(self, image_id: int) -> Optional[bytes]:
+        # khoá chỉ giữ khi tra/ghi LRU và đọc bản ghi từ nguồn; decode + vẽ + mã hoá JPEG chạy song song giữa các request
+        with self.lock:
+            jpg = self._renders.get(image_id)
+            if jpg is not None:
+                self._renders.move_to_end(image_id)
+                return jpg
+            entry = self.source.entry(image_id)
+        img_path = resolve_image_path(image_id, self.images_dir, self.index)
+        if not img_path:
+            return None
+        thumb = load_thumbnail(img_path, self.max_size, self.max_size)
+        if thumb is None:
+            return None
+        img, scale = thumb
+        font = self.font if scale >= 0.75 else self.thumb_font
+        img = draw_entry(img, entry, font, scale=scale, thick=2 if scale >= 0.75 else 1)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 88])
+        if not ok:
+            return None
+        jpg = buf.tobytes()
+        with self.lock:
+            self._renders[image_id] = jpg
+            self._renders.move_to_end(image_id)
+            if len(self._renders) > self.cache_size:
+                self._renders.popitem(last=False)
+        return jpg
+
+
+PAGE_HTML = """<!doctype html>
+<html lang="vi"><head><meta charset="utf-8"><title>VietSGG viewer</title>
+<style>
+body{margin:0;font:14px sans-serif;display:flex;height:100vh}
+#side{width:300px;overflow:auto;border-right:1px solid #ccc;padding:8px;box-sizing:border-box}
+#main{flex:1;overflow:auto;padding:8px}
+#list a{display:block;padding:2px 4px;cursor:pointer}#list a.cur{background:#cde}
+input{width:100%;box-sizing:border-box;margin-bottom:4px}img{max-width:100%}
+</style></head><body>
+<div id="side">
+<input id="qid" placeholder="image_id (vd. 368,7615)"><input id="qlabel" placeholder="nhãn (vd. người)">
+<input id="qtrip" placeholder="triplet: chủ ngữ|predicate|tân ngữ"><button onclick="search(0)">Tìm</button>
+<div id="pager"></div><div id="list"></div></div>
+<div id="main"><div id="nav"></div><img id="img"><pre id="meta"></pre></div>
+<script>
+let Q="",PAGE=0,SIZE=__PAGE_SIZE__,CUR=null,INFO=null;
+const $=id=>document.getElementById(id);
+function qs(){return "id="+encodeURIComponent($("qid").value)+"&label="+encodeURIComponent($("qlabel").value)+
+ "&triplet="+encodeURIComponent($("qtrip").value);}
+async function search(p){Q=qs();PAGE=p;const r=await (await fetch("/api/list?"+Q+"&page="+p+"&size="+SIZE)).json();
+ $("pager").innerHTML=(p>0?'<button onclick="search('+(p-1)+')">◀</button> ':'')+"trang "+(p+1)+"/"+
+ Math.max(1,Math.ceil(r.total/SIZE))+" ("+r.total+" ảnh)"+((p+1)*SIZE<r.total?' <button onclick="search('+(p+1)+')">▶</button>':'');
+ $("list").innerHTML=r.ids.map(i=>'<a id="i'+i+'" onclick="show('+i+')">'+i+'</a>').join("");
+ if(r.ids.length&&(CUR===null||!r.ids.includes(CUR)))show(r.ids[0]);}
+async function show(id){CUR=id;document.querySelectorAll("#list a.cur").forEach(a=>a.classList.remove("cur"));
+ const a=$("i"+id);if(a)a.classList.add("cur");$("img").src="/render/"+id+".jpg";
+ INFO=await (await fetch("/api/info/"+id+"?"+Q)).json();
+ $("nav").textContent=(INFO.position+1)+"/"+INFO.total+"  image_id="+id+"  (← →)";
+ $("meta").textContent="Nhãn: "+INFO.labels.join(", ")+"\\n"+INFO.triplets.map(t=>t.join(" — ")).join("\\n");
+ if(INFO.next!==null)new Image().src="/render/"+INFO.next+".jpg";}
+document.addEventListener("keydown",e=>{if(!INFO||e.target.tagName==="INPUT")return;
+ const t=e.key==="ArrowRight"?INFO.next:e.key==="ArrowLeft"?INFO.prev:null;
+ if(t!==null){const p=Math.floor((INFO.position+(e.key==="ArrowRight"?1:-1))/SIZE);if(p!==PAGE)search(p).then(()=>show(t));else show(t);}});
+search(0);
+</script></body></html>"""
+
+
+def make_handler(viewer: SceneGraphViewer, page_size: int):
+    page_html = PAGE_HTML.replace("__PAGE_SIZE__", str(page_size)).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):  # im lặng như các tool khác; lỗi vẫn trả về client
+            pass
+
+        def _send(self, code: int, body: bytes, ctype: str):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, obj: Any):
+            self._send(200, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            query = (q.get("id", ""), q.get("label", ""), q.get("triplet", ""))
+            try:
+                if url.path == "/":
+                    self._send(200, page_html, "text/html; charset=utf-8")
+                elif url.path == "/api/list":
+                    self._json(viewer.page(viewer.search(*query), int(q.get("page", 0)), int(q.get("size", page_size))))
+                elif url.path.startswith("/api/info/"):
+                    image_id = int(url.path.rsplit("/", 1)[1])
+                    if image_id not in viewer.pos:
+                        return self._send(404, b"unknown image_id", "text/plain")
+                    self._json(viewer.info(image_id, *viewer.search_index(*query)))
+                elif url.path.startswith("/render/") and url.path.endswith(".jpg"):
+                    image_id = int(url.path[len("/render/"):-len(".jpg")])
+                    jpg = viewer.render(image_id) if image_id in viewer.pos else None
+                    if jpg is None:
+                        return self._send(404, b"image not found", "text/plain")
+                    self._send(200, jpg, "image/jpeg")
+                else:
+                    self._send(404, b"not found", "text/plain")
+            except ValueError as e:
+                self._send(400, str(e).encode("utf-8"), "text/plain; charset=utf-8")
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local on-demand scene-graph viewer (VG-like JSON or COCO + rel.json).")
+    ap.add_argument("--json", default=None, help="File VG-like (list image_id / objects / relationships)")
+    ap.add_argument("--coco", default=None, help="File COCO <split>.json (thay cho --json)")
+    ap.add_argument("--rel", default=None, help="rel.json (đi cùng --coco)")
+    ap.add_argument("--split", default=None, help="Split trong rel.json (mặc định: tên file COCO)")
+    ap.add_argument("--images", required=True, help="Thư mục ảnh")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--cache", type=int, default=256, help="Số ảnh đã vẽ giữ trong LRU")
+    ap.add_argument("--max-size", type=int, default=1280, help="Cạnh dài tối đa của ảnh hiển thị")
+    ap.add_argument("--page-size", type=int, default=50, help="Số image_id mỗi trang danh sách")
+    args = ap.parse_args()
+    if bool(args.json) == bool(args.coco):
+        ap.error("pass exactly one of --json or --coco")
+
+    source = VGSource(args.json) if args.json else CocoSource(args.coco, args.rel, args.split)
+    viewer = SceneGraphViewer(source, args.images, args.cache, args.max_size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(viewer, args.page_size))
+    print(f"✅ {len(source.image_ids)} ảnh — mở http://{args.host}:{server.server_address[1]} (Ctrl+C để dừng)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
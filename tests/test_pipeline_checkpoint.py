@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoint JSONL ghi fingerprint cấu hình ở dòng đầu: resume với cấu hình khác phải bỏ kết quả cũ.
+"""
+import dataclasses
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pipeline = pytest.importorskip("vietsgg_pipeline")
+
+
+def _write(path, fingerprint, items):
+    ckpt = pipeline.JsonlCheckpoint(path, fingerprint=fingerprint)
+    for k, v in items.items():
+        ckpt.append(k, v)
+    ckpt.close()
+
+
+def test_checkpoint_resumes_only_with_matching_config(tmp_path):
+    path = str(tmp_path / "det_ckpt.jsonl")
+    cfg = pipeline.Config()
+    fp = pipeline.checkpoint_fingerprint(cfg, pipeline.DET_RESULT_FIELDS)
+    _write(path, fp, {"a.jpg": [1], "b.jpg": [2]})
+
+    assert pipeline.JsonlCheckpoint(path, fingerprint=fp).load() == {"a.jpg": [1], "b.jpg": [2]}
+    # trường không ảnh hưởng kết quả (đường dẫn, profile) -> vẫn resume được
+    same = dataclasses.replace(cfg, output_det_path="x.json", profile=True)
+    assert pipeline.checkpoint_fingerprint(same, pipeline.DET_RESULT_FIELDS) == fp
+
+    changed = dataclasses.replace(cfg, score_threshold=cfg.score_threshold + 0.1)
+    fp2 = pipeline.checkpoint_fingerprint(changed, pipeline.DET_RESULT_FIELDS)
+    assert fp2 != fp
+    assert pipeline.JsonlCheckpoint(path, fingerprint=fp2).load() == {}
+    assert not os.path.exists(path)
+
+    # ghi tiếp sau khi bỏ -> header mới, chỉ còn ảnh của cấu hình mới
+    _write(path, fp2, {"c.jpg": [3]})
+    assert pipeline.JsonlCheckpoint(path, fingerprint=fp2).load() == {"c.jpg": [3]}
+
+
+def test_checkpoint_without_header_is_not_resumed(tmp_path):
+    path = str(tmp_path / "rel_ckpt.jsonl")
+    _write(path, "", {"a.jpg": {"image_id": 1}})
+    assert pipeline.JsonlCheckpoint(path).load() == {"a.jpg": {"image_id": 1}}
+    assert pipeline.JsonlCheckpoint(path, fingerprint="abc").load() == {}
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Chạy vietsgg_pipeline.py như tiến trình riêng với backend fake/stub (không cần GPU/mạng):
+2 shard song song + --merge-shards phải cho output giống hệt 1 lần chạy không chia shard.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "vietsgg_pipeline.py")
+sys.path.insert(0, ROOT)
+
+pipeline = pytest.importorskip("vietsgg_pipeline")
+
+
+def _overrides(img_dir: str, out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    values = {
+        "img_dir": img_dir,
+        "output_rel_path": os.path.join(out_dir, "rel.json"),
+        "output_det_path": os.path.join(out_dir, "det.json"),
+        "cache_path": os.path.join(out_dir, "cache.json"),
+        "det_checkpoint_path": os.path.join(out_dir, "det_ckpt.jsonl"),
+        "rel_checkpoint_path": os.path.join(out_dir, "rel_ckpt.jsonl"),
+        "group_cache_path": "",
+        "detector_backend": "fake",
+        "openai_backend": "stub",
+        "resume": False,
+        "profile": True,
+        "profile_summary_path": os.path.join(out_dir, "profile.json"),
+    }
+    args = []
+    for k, v in values.items():
+        args += ["--set", f"{k}={json.dumps(v) if isinstance(v, bool) else v}"]
+    return args + ["--log-dir", os.path.join(out_dir, "logs")]
+
+
+def _cmd(*args):
+    return [sys.executable, SCRIPT, *args]
+
+
+def _load(out_dir: str, name: str):
+    with open(os.path.join(out_dir, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("padded", [True, False], ids=["padded", "unpadded"])
+def test_two_shard_processes_merge_to_unsharded_output(tmp_path, padded):
+    img_dir = str(tmp_path / "images")
+    pipeline._make_bench_images(img_dir, 12)
+    if not padded:
+        # 2.jpg, 10.jpg...: thứ tự tên file khác thứ tự số của image_id
+        for f in os.listdir(img_dir):
+            os.rename(os.path.join(img_dir, f), os.path.join(img_dir, f"{int(os.path.splitext(f)[0])}.jpg"))
+
+    full_dir = str(tmp_path / "full")
+    subprocess.run(_cmd(*_overrides(img_dir, full_dir)), check=True, cwd=str(tmp_path))
+
+    shard_dir = str(tmp_path / "sharded")
+    args = _overrides(img_dir, shard_dir)
+    procs = [subprocess.Popen(_cmd(*args, "--shard", f"{i}/2"), cwd=str(tmp_path)) for i in range(2)]
+    assert [p.wait() for p in procs] == [0, 0]
+    subprocess.run(_cmd(*args, "--merge-shards", "2"), check=True, cwd=str(tmp_path))
+
+    for i in range(2):
+        shard_rel = pipeline.shard_path(os.path.join(shard_dir, "rel.json"), i, 2)
+        with open(shard_rel, "r", encoding="utf-8") as f:
+            assert json.load(f), f"shard {i} got no images"
+        # mỗi shard ghi profile riêng, không ghi đè lẫn nhau
+        assert os.path.exists(pipeline.shard_path(os.path.join(shard_dir, "profile.json"), i, 2))
+    assert not os.path.exists(os.path.join(shard_dir, "profile.json"))
+
+    full_rel = _load(full_dir, "rel.json")
+    assert len(full_rel) == 12
+    assert any(r["relationships"] for r in full_rel)
+    if not padded:
+        assert [r["image_id"] for r in full_rel][:4] == [0, 1, 10, 11]
+    assert _load(shard_dir, "rel.json") == full_rel
+    assert _load(shard_dir, "det.json") == _load(full_dir, "det.json")
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+vietsgg_dataset.py
+--------------------
+Dataset kiểu PyTorch (__len__ / __getitem__, không bắt buộc cài torch) cho COCO <split>.json + rel.json:
+- index dựng 1 lần trong __init__ thành mảng numpy liền khối (đường dẫn ảnh, box, nhãn, offset, quan hệ)
+  -> khi DataLoader fork worker, các mảng này được chia sẻ copy-on-write, không bị "chạm" refcount
+  như list/dict Python nên không nhân bản bộ nhớ theo số worker;
+- ảnh chỉ decode khi __getitem__ được gọi; tuỳ chọn LRU giới hạn số ảnh đã decode/resize (mỗi worker 1 LRU);
+- tuỳ chọn max_size: trả ảnh đã thu nhỏ (cạnh dài <= max_size), decode giảm độ phân giải ngay trong libjpeg
+  (cv2.IMREAD_REDUCED_COLOR_2/4/8) khi tỉ lệ cho phép, box được scale theo.
+
+Sử dụng:
+  ds = VietSGGDataset("datasets/val.json", "datasets/rel.json", "val", images_dir="coco_uitvic_test",
+                      cache_size=256, max_size=800)
+  loader = torch.utils.data.DataLoader(ds, batch_size=8, num_workers=4, collate_fn=collate_list)
+"""
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from image_index import ImageIndex
+
+# (hệ số giảm, cờ imread) — thử từ lớn tới nhỏ
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def collate_list(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """collate_fn cho DataLoader: ảnh khác kích thước nên giữ nguyên list sample."""
+    return batch
+
+
+class VietSGGDataset:
+    """
+    Mỗi sample là dict:
+      image_id, file_name,
+      image      uint8 (H, W, 3), RGB (rgb=True) hoặc BGR
+      boxes      float32 (k, 4) bbox COCO [x, y, w, h] theo kích thước ảnh trả về
+      labels     int32 (k,) category_id
+      relations  int32 (n, 3) [subject_idx, object_idx, predicate_id] (chỉ số object local)
+      orig_size  (width, height) theo annotation; size: (width, height) của ảnh trả về
+    """
+
+    def __init__(self, coco_path: Union[str, Path], rel_path: Optional[Union[str, Path]] = None,
+                 split: Optional[str] = None, images_dir: Optional[str] = None, cache_size: int = 0,
+                 max_size: Optional[int] = None, rgb: bool = True, reduced_decode: bool = True,
+                 transform: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.cache_size = int(cache_size)
+        self.max_size = max_size
+        self.rgb = rgb
+        self.reduced_decode = reduced_decode
+        self.transform = transform
+        self._build_index(Path(coco_path), Path(rel_path) if rel_path else None, split, images_dir)
+        self._cache: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # ------------------------- INDEX (1 lần) -------------------------
+    def _build_index(self, coco_path: Path, rel_path: Optional[Path], split: Optional[str],
+                     images_dir: Optional[str]):
+        with open(coco_path, "r", encoding="utf-8") as f:
+            coco = json.load(f)
+        rel_data: Dict[str, Any] = {}
+        if rel_path is not None:
+            with open(rel_path, "r", encoding="utf-8") as f:
+                rel_data = json.load(f)
+        if split is None:
+            keys = [k for k in rel_data if k != "rel_categories"]
+            split = keys[0] if len(keys) == 1 else coco_path.stem
+        self.split = split
+        self.categories = {c["id"]: c["name"] for c in coco.get("categories", [])}
+        self.rel_categories: List[str] = rel_data.get("rel_categories", [])
+        split_rels = rel_data.get(split, {})
+
+        images = coco["images"]
+        self.image_ids = np.asarray([img["id"] for img in images], dtype=np.int64)
+        self.orig_sizes = np.asarray([[img["width"], img["height"]] for img in images], dtype=np.int32).reshape(-1, 2)
+        id2idx = {int(img["id"]): i for i, img in enumerate(images)}
+
+        base = images_dir if images_dir is not None else str(coco_path.parent)
+        index = ImageIndex(base)
+        paths = []
+        for img in images:
+            p = index.path(int(img["id"])) if len(index) else None
+            paths.append(p or os.path.join(base, img["file_name"]))
+        # mảng bytes độ dài cố định: 1 khối bộ nhớ, không có object Python cho từng phần tử
+        self.paths = np.asarray([p.encode("utf-8") for p in paths], dtype=np.bytes_)
+        self.file_names = np.asarray([img["file_name"].encode("utf-8") for img in images], dtype=np.bytes_)
+
+        anns = coco["annotations"]
+        ann_img = np.asarray([id2idx[int(a["image_id"])] for a in anns], dtype=np.int64)
+        order = np.argsort(ann_img, kind="stable")
+        self.boxes = np.asarray([a["bbox"] for a in anns], dtype=np.float32).reshape(-1, 4)[order]
+        self.labels = np.asarray([a["category_id"] for a in anns], dtype=np.int32)[order]
+        self.obj_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ann_img, minlength=len(images)), out=self.obj_offsets[1:])
+
+        counts = np.zeros(len(images), dtype=np.int64)
+        chunks = []
+        for i, img in enumerate(images):
+            triples = split_rels.get(str(img["id"]))
+            if triples:
+                counts[i] = len(triples)
+                chunks.append(np.asarray(triples, dtype=np.int32).reshape(-1, 3))
+        self.relations = np.concatenate(chunks) if chunks else np.zeros((0, 3), dtype=np.int32)
+        self.rel_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.rel_offsets[1:])
+        self._id2idx = None
+
+    def __len__(self) -> int:
+        return int(self.image_ids.shape[0])
+
+    def index_of(self, image_id: int) -> int:
+        if self._id2idx is None:
+            self._id2idx = {int(iid): i for i, iid in enumerate(self.image_ids.tolist())}
+        return self._id2idx[int(image_id)]
+
+    # ------------------------- DECODE -------------------------
+    def _target_size(self, i: int):
+        w, h = (int(v) for v in self.orig_sizes[i])
+        if not self.max_size or max(w, h) <= self.max_size:
+            return None
+        scale = self.max_size / max(w, h)
+        return max(1, round(w * scale)), max(1, round(h * scale))
+
+    def _decode(self, i: int) -> np.ndarray:
+        path = self.paths[i].decode("utf-8")
+        target = self._target_size(i)
+        flag = cv2.IMREAD_COLOR
+        if target is not None and self.reduced_decode:
+            factor = int(self.orig_sizes[i].max()) / self.max_size
+            for r, f in _REDUCED_FLAGS:
+                if factor >= r:
+                    flag = f
+                    break
+        img = cv2.imread(path, flag)
+        if img is None:
+            raise FileNotFoundError(f"Cannot read image: {path}")
+        if target is not None and (img.shape[1], img.shape[0]) != target:
+            img = cv2.resize(img, target, interpolation=cv2.INTER_AREA)
+        if self.rgb:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return img
+
+    def load_image(self, i: int) -> np.ndarray:
+        """Ảnh thứ i (đã resize nếu có max_size); qua LRU nếu cache_size > 0. Ảnh lấy từ cache là bản copy."""
+        if self.cache_size <= 0:
+            return self._decode(i)
+        img = self._cache.get(i)
+        if img is not None:
+            self._cache.move_to_end(i)
+            self.cache_hits += 1
+            return img.copy()
+        self.cache_misses += 1
+        img = self._decode(i)
+        self._cache[i] = img
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return img.copy()
+
+    def clear_cache(self):
+        self._cache.clear()
+        self.cache_hits = self.cache_misses = 0
+
+    # ------------------------- SAMPLE -------------------------
+    def annotations(self, i: int):
+        """(boxes, labels, relations) theo kích thước gốc, không decode ảnh — view của mảng index."""
+        o0, o1 = int(self.obj_offsets[i]), int(self.obj_offsets[i + 1])
+        r0, r1 = int(self.rel_offsets[i]), int(self.rel_offsets[i + 1])
+        return self.boxes[o0:o1], self.labels[o0:o1], self.relations[r0:r1]
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        img = self.load_image(i)
+        boxes, labels, relations = self.annotations(i)
+        w0, h0 = (int(v) for v in self.orig_sizes[i])
+        h, w = img.shape[:2]
+        boxes = boxes.copy()
+        if (w, h) != (w0, h0):
+            boxes *= np.asarray([w / w0, h / h0, w / w0, h / h0], dtype=np.float32)
+        sample = {
+            "image_id": int(self.image_ids[i]),
+            "file_name": self.file_names[i].decode("utf-8"),
+            "image": img,
+            "boxes": boxes,
+            "labels": labels.copy(),
+            "relations": relations.copy(),
+            "orig_size": (w0, h0),
+            "size": (w, h),
+        }
+        return self.transform(sample) if self.transform is not None else sample
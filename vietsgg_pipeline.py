@@ -0,0 +1,2465 @@
+# -*- coding: utf-8 -*-
+"""
+vietsgg_pipeline.py
+--------------------
+Pipeline sinh annotation VietSGG (GroundingDINO + GPT) tách ra từ VietSGG.ipynb để import được
+(notebook chỉ `from vietsgg_pipeline import *`) và chạy trực tiếp bằng python: shard, ghép shard, benchmark offline.
+Tham số Config ghi đè bằng --config <file JSON> và/hoặc --set KEY=VALUE (VALUE đọc như JSON, không được thì là chuỗi).
+transformers / openai chỉ được import khi dùng backend "gdino" / "openai" -> backend fake/stub chạy được không cần chúng.
+
+Sử dụng:
+  python vietsgg_pipeline.py --set img_dir=data/coco_uitvic_train
+  python vietsgg_pipeline.py --shard 0/4            # ... --shard 3/4 trên các máy/tiến trình khác
+  python vietsgg_pipeline.py --merge-shards 4
+  python vietsgg_pipeline.py --bench-offline --bench-images 100 --bench-concurrency 1,2,4 --bench-latency-ms 0,50,200
+"""
+import argparse
+import base64
+import dataclasses
+import difflib
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, List, Dict, Tuple, Any, Optional
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+import torch
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+# =========================
+# Logging (DEBUG -> file)
+# =========================
+logger = logging.getLogger("SGG-Pipeline")
+
+
+def setup_logging(log_dir: str = "./logs"):
+    """Ghi log DEBUG ra <log_dir>/pipeline_debug.log + console (gọi từ main() hoặc notebook, không chạy khi import)."""
+    os.makedirs(log_dir, exist_ok=True)
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        handlers=[
+            logging.FileHandler(os.path.join(log_dir, "pipeline_debug.log"), encoding="utf-8"),
+            logging.StreamHandler()
+        ],
+    )
+
+
+# =========================
+# Configs & Constants
+# =========================
+@dataclass
+class Config:
+    img_dir: str = "/datasets/coco_uitvic_train"
+    output_rel_path: str = "relationships_vi_coco_uitvic_train.json"
+    output_det_path: str = "detections_cache_coco_uitvic_train.json"      # lưu phát hiện để tái sử dụng
+    device: str = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # GroundingDINO
+    # gd_model_id: str = "IDEA-Research/grounding-dino-base"
+    gd_model_id: str = "rziga/mm_grounding_dino_large_all"
+
+    box_threshold: float = 0.25         # ngưỡng box của post_process_grounded_object_detection
+    text_threshold: float = 0.4 #0.25
+    score_threshold: float = 0.35 #0.30
+    nms_iou_threshold: float = 0.5
+
+    # Hậu xử lý detection
+    people_merge_iou: float = 0.6       # merge_people_cross_label
+    shoes_min_ratio: float = 0.008      # filter_shoes
+    shoes_max_keep: int = 2
+
+    # Lưu output thô (chưa lọc ngưỡng) của GDINO -> quét ngưỡng/NMS không cần chạy lại model
+    raw_store_dir: str = ""             # "" = tắt
+    raw_store_min_score: float = 0.05   # bỏ các query có max prob thấp hơn (giữ file gọn); sweep box_threshold chỉ có nghĩa từ mức này trở lên
+    detect_from_raw_store: bool = False # ảnh đã có trong raw store -> chỉ chạy lại ngưỡng + hậu xử lý
+
+    # Prompt labels
+    # === Semantic grouping===
+    group_chunk_size: int = 9  # chạy GDINO theo nhóm nhãn để giảm lẫn
+    label_groups: Dict[str, List[str]] = field(default_factory=lambda: {
+        # Nhóm người & vai trò
+        "PEOPLE": [
+            "player", "referee", "coach", "kid", "audience",
+        ],
+        # Nhóm bóng & dụng cụ cầm tay
+        "BALLS_GEARS": [
+            "soccer ball", "basketball", "volleyball", "tennis ball", "baseball",
+            "tennis racket", "baseball bat", "baseball glove", "whistle"
+        ],
+        # Nhóm sân bãi & thiết bị cố định
+        "ENV": [
+            "soccer field", "tennis court", "basketball hoop", "baseball field", "rugby field", "goal", "net", "scoreboard", "volleyball court"
+        ],
+        # Nhóm trang phục (giảm đồng nghĩa để đỡ nhiễu)
+        "WEAR": [
+            "uniform", "shoes"
+        ],
+        # Nhóm động vật thi đấu
+        "ANIMAL":[
+            "horses", "elephant"
+        ]
+    })
+    group_order: List[str] = field(default_factory=lambda: ["PEOPLE", "BALLS_GEARS", "ENV", "WEAR", "ANIMAL"])
+
+    # Lịch chạy group thích ứng: chạy trước group rẻ/recall cao, bỏ chunk khó xuất hiện theo prior đồng xuất hiện
+    adaptive_schedule: bool = False
+    schedule_first_groups: List[str] = field(default_factory=lambda: ["PEOPLE", "ENV"])
+    schedule_min_prob: float = 0.05     # chạy chunk nếu P(nhãn | nhãn đã thấy) >= ngưỡng
+    schedule_prior_path: str = ""       # detections cache / VG-like json để học prior ("" = output_det_path)
+    schedule_eval_every: int = 20       # mỗi N ảnh chạy thêm lịch đầy đủ để đo recall (0 = tắt)
+
+    force_redetect: bool = True # True nếu không dùng detect đã lưu
+    # cache detection theo (ảnh, group, labels, model, ngưỡng): force_redetect chỉ chạy lại group đã đổi ("" = tắt)
+    group_cache_path: str = "detections_groups_coco_uitvic_train.jsonl"
+
+    # Checkpoint JSONL (ghi nối từng ảnh) -> chạy lại sau crash chỉ xử lý phần còn thiếu
+    resume: bool = True
+    det_checkpoint_path: str = "detections_ckpt_coco_uitvic_train.jsonl"
+    rel_checkpoint_path: str = "relationships_ckpt_coco_uitvic_train.jsonl"
+    checkpoint_fsync_every: int = 20    # fsync sau mỗi N ảnh
+    keep_checkpoints: bool = False      # giữ checkpoint sau khi run() hoàn tất
+
+    # Chia shard (nhiều máy/tiến trình): ảnh được gán theo hash tên file -> shard_index/shard_count
+    shard_index: int = 0
+    shard_count: int = 1
+
+    # Profiling theo stage (decode ảnh, preprocess/forward/post-process GDINO, NMS, dịch, GPT vision...)
+    profile: bool = False
+    profile_summary_path: str = "profile_summary_coco_uitvic_train.json"
+    profile_trace_path: str = ""        # Chrome trace JSON ("" = không ghi)
+
+    # OpenAI
+    gpt_model_vision: str = "gpt-4.1"          # dùng cho caption/quan hệ
+    gpt_model_text: str = "gpt-4.1-mini"       # dùng cho dịch/nhẹ; có thể thay bằng 3.5 nếu muốn
+    # openai_api_key_env: str = "API_KEY"
+
+    # Backend: "gdino" | "fake" (detector), "openai" | "stub" (GPT) -> benchmark/CI không cần GPU/mạng
+    detector_backend: str = "gdino"
+    openai_backend: str = "openai"
+    openai_base_url: str = ""           # "" = API mặc định; vd. StubOpenAIServer.base_url
+    fake_detector_latency_ms: float = 0.0
+    fake_detector_boxes: int = 4
+    stub_latency_ms: float = 0.0        # độ trễ mỗi request của stub GPT
+    stub_error_rate: float = 0.0        # tỉ lệ request stub GPT trả lỗi
+
+    # Dịch: prefetch toàn bộ nhãn/vị từ trước pha quan hệ -> tra cứu per-image chỉ từ bộ nhớ
+    translate_prefetch: bool = True
+    translate_batch_size: int = 50      # số cụm từ mỗi request dịch
+
+    # Quan hệ
+    max_relations: int = 6
+
+    # Ảnh gửi lên GPT vision (nén + thu nhỏ để giảm dung lượng request)
+    payload_format: str = "JPEG"        # "JPEG" | "WEBP" | "PNG"
+    payload_quality: int = 85           # chất lượng JPEG/WEBP
+    payload_max_side: int = 1024        # cạnh dài tối đa (0 = không giới hạn)
+    payload_max_pixels: int = 0         # ngân sách số điểm ảnh w*h (0 = không giới hạn)
+    payload_reuse_source: bool = True   # dùng lại bytes JPEG gốc nếu ảnh đã nằm trong ngân sách
+    payload_cache_size: int = 8         # số ảnh đã mã hoá giữ trong bộ nhớ (caption + relations dùng chung)
+
+    # Cache GPT
+    cache_path: str = "./gpt_cache_coco_uitvic_train.json"  # cache đơn giản đầu vào->đầu ra
+    cache_seed_path: str = ""      # nếu cache_path chưa có -> khởi tạo từ file này (dùng cho shard)
+    cache_relations: bool = True   # cache kết quả extract_relations theo nội dung (ảnh + objects + model)
+    cache_save_every: int = 50     # ghi cache ra đĩa sau mỗi N ảnh (tránh mất khi crash)
+
+    # Từ điển vị từ EN->VI (ưu tiên)
+    predicate_map_en_vi: Dict[str, str] = field(default_factory=lambda: {
+        "holding": "cầm",
+        "kicking": "đá",
+        "throwing": "ném",
+        "catching": "bắt",
+        "hit": "đánh",
+        "riding": "cưỡi",
+        "wearing": "đeo",
+        "standing on": "đứng trên",
+        "sitting on": "ngồi trên",
+        "next to": "bên cạnh",
+        "in front of": "phía trước",
+        "behind": "phía sau",
+        "near": "gần",
+        "far from": "xa",
+        "touching": "chạm",
+        "guarding": "kèm",
+        "dribbling": "dẫn bóng",
+        "shooting": "sút/ném",
+        "passing": "chuyền",
+        "looking at": "nhìn vào",
+        "celebrating": "ăn mừng",
+        "blocking": "chắn",
+        "swing": "vung",
+        "swung": "vung",
+    })
+
+    # Từ điển EN->VI cho đối tượng cố định (tiền dịch sẵn)
+    object_dict_en_vi: Dict[str, str] = field(default_factory=lambda: {
+        "player": "vận động viên",
+        "referee": "trọng tài",
+        "coach": "huấn luyện viên",
+        "kid": "trẻ em",
+        "audience": "khán giả",
+        "soccer ball": "quả bóng đá",
+        "basketball": "quả bóng rổ",
+        "volleyball": "quả bóng chuyền",
+        "tennis ball": "quả bóng tennis",
+        "rugby ball": "quả bóng bầu dục",
+        "baseball": "bóng chày",
+        "tennis racket": "vợt tennis",
+        "baseball bat": "gậy bóng chày",
+        "baseball glove": "găng bóng chày",
+        "whistle": "còi",
+        "scoreboard": "bảng tỉ số",
+        "goal": "khung thành",
+        "net": "lưới",
+        "basketball hoop": "rổ bóng rổ",
+        "tennis court": "sân tennis",
+        "soccer field": "sân bóng đá",
+        "baseball field": "sân bóng chày",
+        "volleyball field": "sân bóng chuyền",
+        "rugby court": "sân bóng bầu dục",
+        "sportswear": "đồ thể thao",
+        # "jersey": "áo đấu",
+        "uniform": "đồng phục",
+        "shoes": "giày",
+        "horses": "ngựa",
+        "elephant": "voi",
+    })
+
+
+# ==== Ontology & label normalization helpers ====
+CANONICALS = {
+    # people
+    "player": ["player", "athlete"],
+    "referee": ["referee", "umpire"],
+    "coach": ["coach"],
+    "kid": ["kid", "child"],
+    "audience": ["audience", "crowd", "spectator"],
+    # balls
+    "soccer ball": ["soccer ball", "football (soccer ball)"],
+    "basketball": ["basketball"],
+    "volleyball": ["volleyball"],
+    "tennis ball": ["tennis ball"],
+    "baseball": ["baseball"],
+    # gears
+    "tennis racket": ["tennis racket", "racket"],
+    "baseball bat": ["baseball bat", "bat"],
+    "baseball glove": ["baseball glove", "glove"],
+    "whistle": ["whistle"],
+    # field/court/goals
+    "goal": ["goal"],
+    "net": ["net"],
+    "basketball hoop": ["basketball hoop", "rim"],
+    "tennis court": ["tennis court"],
+    "soccer field": ["soccer field", "football pitch"],
+    # wear
+    "sportswear": ["sportswear"],
+    "jersey": ["jersey"],
+    "uniform": ["uniform"],
+    "shoes": ["shoes", "sneakers", "cleats"],
+    # crowd big region (optional)
+    "scoreboard": ["scoreboard"],
+    "bench": ["bench"],
+}
+
+# Build reverse alias->canonical
+ALIAS2CANON = {}
+for cano, aliases in CANONICALS.items():
+    for a in aliases:
+        ALIAS2CANON[a.lower()] = cano
+
+
+# =========================
+# Utilities
+# =========================
+def pil_to_base64_png(img: Image.Image) -> str:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+    return f"data:image/png;base64,{b64}"
+
+
+def image_digest(img: Image.Image) -> str:
+    """SHA-256 của nội dung điểm ảnh (mode + size + bytes) -> dùng làm khoá cache theo nội dung."""
+    h = hashlib.sha256()
+    h.update(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode("utf-8"))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def torchvision_nms(boxes, scores, iou_threshold=0.5):
+    if len(boxes) == 0:
+        return []
+    t_boxes = torch.tensor(boxes, device="cpu", dtype=torch.float32)
+    t_scores = torch.tensor(scores, device="cpu", dtype=torch.float32)
+    # Nếu có torchvision, xài thẳng; nếu không có, fallback đơn giản
+    try:
+        keep_idx = torch.ops.torchvision.nms(t_boxes, t_scores, iou_threshold)
+        return keep_idx.cpu().tolist()
+    except Exception as e:
+        logger.warning(f"NMS fallback: {e}")
+        # Fallback: greedy
+        keep = []
+        idxs = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        seen = [False] * len(scores)
+
+        def iou(a, b):
+            x1 = max(a[0], b[0])
+            y1 = max(a[1], b[1])
+            x2 = min(a[2], b[2])
+            y2 = min(a[3], b[3])
+            inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+            areaA = max(0.0, a[2]-a[0]) * max(0.0, a[3]-a[1])
+            areaB = max(0.0, b[2]-b[0]) * max(0.0, b[3]-b[1])
+            union = areaA + areaB - inter + 1e-9
+            return inter / union
+
+        for i, idx in enumerate(idxs):
+            if seen[idx]:
+                continue
+            keep.append(idx)
+            for j in idxs[i+1:]:
+                if not seen[j] and iou(boxes[idx], boxes[j]) >= iou_threshold:
+                    seen[j] = True
+        return keep
+
+
+def parse_image_id_from_name(fname: str):
+    stem = os.path.splitext(fname)[0]
+    m = re.search(r"(\d+)$", stem)
+    return int(m.group(1)) if m else stem
+
+
+def list_images(img_dir: str) -> List[str]:
+    """Ảnh trong img_dir theo thứ tự tên file (thứ tự output của run() và merge_shards)."""
+    return sorted(f for f in os.listdir(img_dir) if f.lower().endswith((".jpg", ".png", ".jpeg")))
+
+
+def shard_of(fname: str, shard_count: int) -> int:
+    """Gán ảnh vào shard theo hash ổn định của tên file (không phụ thuộc máy/thứ tự listdir)."""
+    digest = hashlib.sha1(fname.encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % max(1, shard_count)
+
+
+# =========================
+# Image payload encoder (GPT vision)
+# =========================
+
+
+@dataclass
+class EncodedImage:
+    data_url: str
+    size: Tuple[int, int]      # kích thước ảnh thực sự gửi đi (w, h)
+    scale: float               # tỉ lệ so với ảnh gốc -> dùng để đổi toạ độ bbox
+    num_bytes: int             # số bytes ảnh (trước base64)
+
+
+class ImagePayloadEncoder:
+    """
+    Mã hoá ảnh gửi lên GPT vision:
+      - thu nhỏ theo cạnh dài tối đa / ngân sách điểm ảnh,
+      - nén JPEG/WEBP theo chất lượng cấu hình (PNG nếu muốn giữ lossless),
+      - dùng lại bytes JPEG gốc nếu ảnh đã vừa ngân sách (không mã hoá lại),
+      - cache payload theo ảnh để caption + extract_relations không mã hoá 2 lần.
+    """
+
+    _MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        self.fmt = cfg.payload_format.upper()
+        if self.fmt not in self._MIME:
+            raise ValueError(f"Unsupported payload_format: {cfg.payload_format}")
+        self._cache: "OrderedDict[str, EncodedImage]" = OrderedDict()
+        # thống kê
+        self.bytes_sent = 0
+        self.encode_seconds = 0.0
+        self.num_encoded = 0
+        self.num_reused = 0
+        self.num_cache_hits = 0
+
+    def signature(self) -> Dict[str, Any]:
+        """Các tham số ảnh hưởng tới ảnh gửi đi (đưa vào khoá cache quan hệ)."""
+        return {
+            "format": self.fmt,
+            "quality": self.cfg.payload_quality,
+            "max_side": self.cfg.payload_max_side,
+            "max_pixels": self.cfg.payload_max_pixels,
+        }
+
+    def scale_for(self, size: Tuple[int, int]) -> float:
+        """Tỉ lệ thu nhỏ (<= 1) để ảnh vừa max_side và max_pixels."""
+        w, h = size
+        scale = 1.0
+        if self.cfg.payload_max_side > 0 and max(w, h) > self.cfg.payload_max_side:
+            scale = min(scale, self.cfg.payload_max_side / max(w, h))
+        if self.cfg.payload_max_pixels > 0 and w * h > self.cfg.payload_max_pixels:
+            scale = min(scale, math.sqrt(self.cfg.payload_max_pixels / (w * h)))
+        return scale
+
+    def encode(self, img: Image.Image, src_path: Optional[str] = None) -> EncodedImage:
+        key = self._cache_key(img, src_path)
+        enc = self._cache.get(key)
+        if enc is not None:
+            self._cache.move_to_end(key)
+            self.num_cache_hits += 1
+        else:
+            t0 = time.perf_counter()
+            with PROFILER.stage("payload_encode"):
+                enc = self._encode(img, src_path)
+            self.encode_seconds += time.perf_counter() - t0
+            self._cache[key] = enc
+            while len(self._cache) > max(0, self.cfg.payload_cache_size):
+                self._cache.popitem(last=False)
+        self.bytes_sent += enc.num_bytes
+        return enc
+
+    def summary(self) -> str:
+        return (
+            f"Image payload: bytes_sent={self.bytes_sent} encoded={self.num_encoded} "
+            f"reused_jpeg={self.num_reused} cache_hits={self.num_cache_hits} "
+            f"encode_time={self.encode_seconds:.2f}s"
+        )
+
+    def _cache_key(self, img: Image.Image, src_path: Optional[str]) -> str:
+        if src_path:
+            try:
+                st = os.stat(src_path)
+                return f"{src_path}:{st.st_mtime_ns}:{st.st_size}"
+            except OSError:
+                pass
+        return image_digest(img)
+
+    def _encode(self, img: Image.Image, src_path: Optional[str]) -> EncodedImage:
+        scale = self.scale_for(img.size)
+        # Ảnh gốc đã là JPEG và vừa ngân sách -> gửi nguyên bytes, không mã hoá lại
+        if scale >= 1.0 and self.cfg.payload_reuse_source and src_path:
+            raw = self._read_jpeg(src_path)
+            if raw is not None:
+                self.num_reused += 1
+                return EncodedImage(self._to_data_url(raw, "JPEG"), img.size, 1.0, len(raw))
+
+        if scale < 1.0:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.LANCZOS)
+        buf = io.BytesIO()
+        if self.fmt == "PNG":
+            img.save(buf, format="PNG")
+        else:
+            img.convert("RGB").save(buf, format=self.fmt, quality=self.cfg.payload_quality)
+        raw = buf.getvalue()
+        self.num_encoded += 1
+        return EncodedImage(self._to_data_url(raw, self.fmt), img.size, scale, len(raw))
+
+    @staticmethod
+    def _read_jpeg(path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return None
+        return raw if raw[:3] == b"\xff\xd8\xff" else None
+
+    def _to_data_url(self, raw: bytes, fmt: str) -> str:
+        b64 = base64.b64encode(raw).decode("utf-8")
+        return f"data:{self._MIME[fmt]};base64,{b64}"
+
+
+# =========================
+# Profiling (per-stage timers)
+# =========================
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("prof", "name", "t0")
+
+    def __init__(self, prof: "StageProfiler", name: str):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.prof._record(self.name, self.t0, time.perf_counter())
+        return False
+
+
+class StageProfiler:
+    """
+    Đo thời gian theo stage (context manager) + bộ đếm. Tắt -> stage() trả về nullcontext dùng chung
+    (chỉ tốn 1 lần kiểm tra cờ). Kết thúc run(): ghi JSON tóm tắt (p50/p90/p99) và tuỳ chọn Chrome trace
+    (mở bằng chrome://tracing hoặc Perfetto).
+    """
+
+    def __init__(self, enabled: bool = False, trace: bool = False):
+        self.reset(enabled, trace)
+
+    def reset(self, enabled: bool, trace: bool = False):
+        self.enabled = enabled
+        self.trace = enabled and trace
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.events: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            # shard chạy bằng thread (benchmark_offline) dùng chung PROFILER -> += không nguyên tử
+            with self._lock:
+                self.counters[name] += n
+
+    def _record(self, name: str, t0: float, t1: float):
+        with self._lock:
+            self.samples[name].append(t1 - t0)
+            if self.trace:
+                self.events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": (t0 - self._origin) * 1e6, "dur": (t1 - t0) * 1e6,
+                })
+
+    def summary(self) -> Dict[str, Any]:
+        stages = {}
+        for name, xs in sorted(self.samples.items()):
+            arr = np.asarray(xs, dtype=np.float64) * 1000.0
+            p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+            stages[name] = {
+                "count": int(arr.size), "total_s": round(float(arr.sum()) / 1000.0, 4),
+                "mean_ms": round(float(arr.mean()), 3), "p50_ms": round(float(p50), 3),
+                "p90_ms": round(float(p90), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(arr.max()), 3),
+            }
+        return {
+            "wall_s": round(time.perf_counter() - self._origin, 4),
+            "stages": stages,
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def write(self, summary_path: str, trace_path: str = ""):
+        if not self.enabled:
+            return
+        summary = self.summary()
+        if summary_path:
+            with open(summary_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            logger.info(f"Saved profile summary -> {summary_path}")
+        if trace_path and self.trace:
+            with open(trace_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+            logger.info(f"Saved Chrome trace -> {trace_path} ({len(self.events)} events)")
+        for name, st in summary["stages"].items():
+            logger.info(
+                f"[profile] {name:<24} n={st['count']:<6} total={st['total_s']:.2f}s "
+                f"p50={st['p50_ms']:.1f}ms p90={st['p90_ms']:.1f}ms p99={st['p99_ms']:.1f}ms"
+            )
+
+
+# dùng chung cho mọi module; SGGPipeline bật/tắt theo cfg.profile
+PROFILER = StageProfiler()
+
+
+# =========================
+# GPT Cache (in-memory + disk)
+# =========================
+class SimpleCache:
+    def __init__(self, path: str, seed_path: Optional[str] = None):
+        """seed_path: nếu `path` chưa có, khởi tạo từ cache này (vd. shard dùng cache chung làm nền)."""
+        self.path = path
+        self.data: Dict[str, Any] = {}
+        src = path if os.path.exists(path) else seed_path
+        if src and os.path.exists(src):
+            try:
+                with open(src, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except Exception:
+                self.data = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.data.get(key)
+
+    def set(self, key: str, value: Any):
+        self.data[key] = value
+
+    def save(self):
+        # ghi ra file tạm rồi replace -> không làm hỏng cache cũ nếu tiến trình chết giữa chừng
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Cannot save cache: {e}")
+
+
+# =========================
+# Checkpoint (JSONL append-only)
+# =========================
+class JsonlCheckpoint:
+    """
+    Mỗi ảnh xong -> ghi nối 1 dòng {"key": ..., "value": ...}; fsync theo lô.
+    Khi chạy lại, load() trả về các ảnh đã xong (bỏ qua dòng cuối bị cắt do crash).
+    fingerprint (tuỳ chọn): dòng đầu {"config": fingerprint}; load() gặp fingerprint khác (hoặc file cũ không có)
+    -> xoá checkpoint, trả về rỗng thay vì dùng lại kết quả của cấu hình cũ.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 20, fingerprint: str = ""):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fingerprint = fingerprint
+        self._f = None
+        self._pending = 0
+
+    def load(self) -> Dict[str, Any]:
+        done: Dict[str, Any] = {}
+        if not os.path.exists(self.path):
+            return done
+        header = None
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                    if "config" in rec and "key" not in rec:
+                        header = rec["config"]
+                        continue
+                    done[rec["key"]] = rec["value"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    logger.warning(f"Skip broken checkpoint line in {self.path}")
+        if self.fingerprint and header != self.fingerprint and (done or header is not None):
+            logger.warning(f"Config changed since {self.path} was written -> discard {len(done)} checkpointed images")
+            self.remove()
+            return {}
+        return done
+
+    def append(self, key: str, value: Any):
+        if self._f is None:
+            self._open()
+        self._f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.flush()
+
+    def flush(self):
+        if self._f is None or self._pending == 0:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._f is not None:
+            self.flush()
+            self._f.close()
+            self._f = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _open(self):
+        # Dòng cuối bị cắt (không có '\n') -> xuống dòng trước khi ghi tiếp
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._f = open(self.path, "a", encoding="utf-8")
+        if needs_newline:
+            self._f.write("\n")
+        if is_new and self.fingerprint:
+            self._f.write(json.dumps({"config": self.fingerprint}) + "\n")
+
+
+# =========================
+# Translator (with caching)
+# =========================
+class Translator:
+    def __init__(self, cfg: Config, client: "OpenAI", cache: SimpleCache):
+        self.cfg = cfg
+        self.client = client
+        self.cache = cache
+        self.api_calls = 0
+
+    def _request_translations(self, terms: List[str]) -> List[str]:
+        """1 request GPT dịch cả list; ném lỗi nếu request/parse thất bại."""
+        prompt = (
+            "Dịch các từ/cụm từ tiếng Anh sau sang tiếng Việt, giữ đúng nghĩa trong ngữ cảnh thể thao. "
+            "Chỉ trả về JSON dạng {\"translations\": [\"...\"]}, đúng thứ tự đầu vào."
+        )
+        messages = [
+            {"role": "user", "content": prompt + "\n\n" + json.dumps(terms, ensure_ascii=False)}
+        ]
+        self.api_calls += 1
+        with PROFILER.stage("gpt.translate"):
+            resp = self.client.chat.completions.create(
+                model=self.cfg.gpt_model_text,
+                messages=messages,
+                max_tokens=max(256, 16 * len(terms)),
+                temperature=0
+            )
+        text_out = (resp.choices[0].message.content or "").strip()
+        js = text_out[text_out.find("{"): text_out.rfind("}") + 1]
+        return json.loads(js).get("translations", terms)
+
+    def prefetch(self, terms: List[str]) -> int:
+        """
+        Dịch trước toàn bộ từ vựng (nhãn + vị từ) theo vài request lớn và ghi vào cache
+        -> translate_terms per-image chỉ tra bộ nhớ. Trả về số term đã dịch mới.
+        """
+        pending = []
+        seen = set()
+        for t in terms:
+            t_norm = t.strip().lower()
+            if not t_norm or t_norm in seen or t_norm in self.cfg.object_dict_en_vi:
+                continue
+            seen.add(t_norm)
+            if not self.cache.get(f"translate::{t_norm}"):
+                pending.append(t_norm)
+
+        B = max(1, self.cfg.translate_batch_size)
+        done = 0
+        for i in range(0, len(pending), B):
+            chunk = pending[i:i + B]
+            try:
+                vi_list = self._request_translations(chunk)
+            except Exception as e:
+                logger.warning(f"Translate prefetch error: {e}")
+                continue
+            if len(vi_list) != len(chunk):
+                # lệch thứ tự -> không cache, để translate_terms xử lý từng ảnh
+                logger.warning(f"Translate prefetch: got {len(vi_list)} items for {len(chunk)} terms, skipped")
+                continue
+            for en, vi in zip(chunk, vi_list):
+                self.cache.set(f"translate::{en}", vi)
+            done += len(chunk)
+        logger.info(f"Translate prefetch: {len(seen)} terms, {done} newly translated")
+        return done
+
+    def translate_terms(self, terms: List[str]) -> List[str]:
+        """Dịch list EN->VI. Ưu tiên tra từ điển cố định; cache; nếu chưa có, gọi GPT nhẹ."""
+        out: List[str] = []
+        to_query: List[str] = []
+        idx_map: Dict[int, str] = {}
+
+        # Tra trước từ điển cố định + cache
+        for i, t in enumerate(terms):
+            t_norm = t.strip().lower()
+            if t_norm in self.cfg.object_dict_en_vi:
+                out.append(self.cfg.object_dict_en_vi[t_norm])
+            else:
+                key = f"translate::{t_norm}"
+                cached = self.cache.get(key)
+                if cached:
+                    out.append(cached)
+                else:
+                    idx_map[len(to_query)] = t_norm
+                    to_query.append(t_norm)
+                    out.append(None)  # placeholder
+
+        if to_query:
+            key = f"translate_batch::{json.dumps(to_query, ensure_ascii=False)}"
+            cached = self.cache.get(key)
+            if cached:
+                vi_list = cached
+            else:
+                try:
+                    vi_list = self._request_translations(to_query)
+                except Exception as e:
+                    logger.warning(f"Translate error: {e}")
+                    vi_list = to_query  # fallback
+                self.cache.set(key, vi_list)
+
+            # Điền vào kết quả + lưu cache đơn lẻ
+            vi_idx = 0
+            for i in range(len(out)):
+                if out[i] is None:
+                    vi_term = vi_list[vi_idx] if vi_idx < len(vi_list) else to_query[vi_idx]
+                    vi_idx += 1
+                    orig = idx_map[vi_idx - 1]
+                    self.cache.set(f"translate::{orig}", vi_term)
+                    out[i] = vi_term
+
+        return out
+
+
+class LabelResolver:
+    """
+    Ánh xạ raw_label của GDINO -> nhãn canonical (EN) cho 1 nhóm prompt, dựng 1 lần:
+      - prompt đã chuẩn hoá sẵn (không normalize lại mỗi lần gọi),
+      - index exact: prompt -> canonical (qua ALIAS2CANON),
+      - index theo dạng token (chuỗi token ghép) để bắt khớp tuyệt đối sau khi tách token,
+      - memo có giới hạn raw -> canonical; chỉ chuỗi mới gặp mới chạy difflib.
+    Kết quả giống hệt cách cũ (exact -> difflib cutoff 0.4 -> fallback prompt đầu).
+    """
+
+    def __init__(self, group_prompts: List[str], memo_size: int = 4096):
+        self.group_norm = [p.strip().lower() for p in group_prompts]
+        self.exact: Dict[str, str] = {}
+        for p in self.group_norm:
+            self.exact.setdefault(p, ALIAS2CANON.get(p, p))
+        self.memo: "OrderedDict[str, str]" = OrderedDict()
+        self.memo_size = memo_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _focus(raw: str) -> str:
+        tokens = re.split(r"[ ,;/]+", raw)
+        return " ".join([t for t in tokens if t])[:80]
+
+    def _resolve_uncached(self, raw: str) -> str:
+        # nếu nhãn khớp exactly 1 prompt trong group
+        if raw in self.exact:
+            return self.exact[raw]
+        # lấy token dài nhất/ý nghĩa nhất rồi so gần đúng
+        focus = self._focus(raw)
+        if focus in self.exact:
+            # khớp tuyệt đối -> difflib cũng trả về đúng prompt này (ratio = 1.0)
+            return self.exact[focus]
+        cand = difflib.get_close_matches(focus, self.group_norm, n=1, cutoff=0.4)
+        cand = cand[0] if cand else self.group_norm[0]  # fallback
+        # map alias->canonical nếu có
+        return ALIAS2CANON.get(cand, cand)
+
+    def resolve(self, raw_label: str) -> str:
+        raw = raw_label.strip().lower()
+        label = self.memo.get(raw)
+        if label is not None:
+            self.hits += 1
+            self.memo.move_to_end(raw)
+            return label
+        self.misses += 1
+        label = self._resolve_uncached(raw)
+        self.memo[raw] = label
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+        return label
+
+
+# 1 resolver cho mỗi bộ prompt (mỗi chunk của group) -> dựng 1 lần, dùng cho mọi ảnh
+_LABEL_RESOLVERS: Dict[Tuple[str, ...], LabelResolver] = {}
+
+
+def get_label_resolver(group_prompts: List[str]) -> LabelResolver:
+    key = tuple(group_prompts)
+    resolver = _LABEL_RESOLVERS.get(key)
+    if resolver is None:
+        resolver = _LABEL_RESOLVERS[key] = LabelResolver(group_prompts)
+    return resolver
+
+
+def label_resolver_stats() -> Dict[str, int]:
+    """Tổng hợp hit/miss của memo trên mọi resolver."""
+    hits = sum(r.hits for r in _LABEL_RESOLVERS.values())
+    misses = sum(r.misses for r in _LABEL_RESOLVERS.values())
+    return {"resolvers": len(_LABEL_RESOLVERS), "hits": hits, "misses": misses}
+
+
+def choose_best_label(raw_label: str, group_prompts: list[str]) -> str:
+    """
+    Nhận raw_label từ GDINO (có thể là chuỗi ghép) và danh sách prompt của group,
+    trả về nhãn canonical gần nhất (EN).
+    """
+    return get_label_resolver(group_prompts).resolve(raw_label)
+
+
+PEOPLE = {"player","referee","coach","kid","audience"}
+
+PRIORITY = ["referee","player","coach","kid","audience"]  # giữ nhãn ưu tiên cao hơn
+
+def merge_people_cross_label(dets: list[dict], iou_thr=0.6) -> list[dict]:
+    people = [d for d in dets if d["label"] in PEOPLE]
+    others = [d for d in dets if d["label"] not in PEOPLE]
+    if len(people) <= 1:
+        return dets
+
+    # sort theo score và theo thứ tự ưu tiên label
+    pri_idx = {lb:i for i,lb in enumerate(PRIORITY)}
+    people.sort(key=lambda d: (-d["score"], pri_idx.get(d["label"], 999)))
+
+    keep = []
+    used = [False]*len(people)
+
+    def _iou(a,b):
+        ax1,ay1,ax2,ay2 = a["bbox"]
+        bx1,by1,bx2,by2 = b["bbox"]
+        x1=max(ax1,bx1); y1=max(ay1,by1); x2=min(ax2,bx2); y2=min(ay2,by2)
+        inter=max(0,x2-x1)*max(0,y2-y1)
+        areaA=max(0,ax2-ax1)*max(0,ay2-ay1)
+        areaB=max(0,bx2-bx1)*max(0,by2-by1)
+        union=areaA+areaB-inter+1e-9
+        return inter/union
+
+    for i,a in enumerate(people):
+        if used[i]: continue
+        used[i]=True
+        merged=a
+        for j,b in enumerate(people):
+            if i==j or used[j]: continue
+            if _iou(a,b)>=iou_thr:
+                # cùng người -> chọn nhãn ưu tiên cao hơn (đã sắp)
+                used[j]=True
+        keep.append(merged)
+    return keep + others
+
+
+def filter_shoes(dets: list[dict], img_w: int, img_h: int, min_ratio=0.002, max_keep=4) -> list[dict]:
+    area_min = img_w*img_h*min_ratio
+    shoes = [d for d in dets if d["label"]=="shoes"]
+    others = [d for d in dets if d["label"]!="shoes"]
+    if not shoes: return dets
+    # giữ những shoes lớn hơn ngưỡng
+    shoes = [d for d in shoes if (d["bbox"][2]-d["bbox"][0])*(d["bbox"][3]-d["bbox"][1]) >= area_min]
+    # giới hạn số đôi
+    shoes.sort(key=lambda d: -d["score"])
+    shoes = shoes[:max_keep]
+    return others + shoes
+
+
+# =========================
+# Adaptive group scheduling
+# =========================
+
+
+class CooccurrencePrior:
+    """
+    Đồng xuất hiện nhãn (EN canonical) học từ annotation có sẵn:
+    P(x | l) = số ảnh có cả l và x / số ảnh có l; P(x) = tần suất theo ảnh.
+    """
+
+    def __init__(self):
+        self.num_images = 0
+        self.label_count: Counter = Counter()
+        self.pair_count: Dict[str, Counter] = defaultdict(Counter)
+
+    def add(self, labels: set):
+        self.num_images += 1
+        for a in labels:
+            self.label_count[a] += 1
+            for b in labels:
+                if a != b:
+                    self.pair_count[a][b] += 1
+
+    def prob(self, label: str, given: set) -> float:
+        """
+        Xác suất gặp `label` khi đã thấy các nhãn `given` (lấy max theo từng nhãn đã thấy).
+        Nhãn chưa từng có trong prior -> 1.0 (bắt buộc chạy): prior thường học từ output lần chạy trước,
+        nếu trả 0 thì nhãn chưa bao giờ phát hiện được sẽ không bao giờ được chạy.
+        """
+        if self.num_images == 0 or self.label_count[label] == 0:
+            return 1.0
+        known = [g for g in given if self.label_count[g] > 0]
+        if not known:
+            return self.label_count[label] / self.num_images
+        return max(self.pair_count[g][label] / self.label_count[g] for g in known)
+
+    @classmethod
+    def from_file(cls, path: str, cfg: Config) -> "CooccurrencePrior":
+        """
+        Hỗ trợ:
+          - detections cache (output_det_path): {fname: [{"label": EN, ...}, ...]}
+          - VG-like (relationships_vi_*.json): [{"objects": [{"names": [VI]}, ...]}, ...] -> đổi VI về EN
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        vi2en = {vi: en for en, vi in cfg.object_dict_en_vi.items()}
+        prior = cls()
+        if isinstance(data, dict):
+            for dets in data.values():
+                prior.add({ALIAS2CANON.get(d["label"], d["label"]) for d in dets})
+        elif isinstance(data, list):
+            for ann in data:
+                names = {(o.get("names") or [""])[0].strip().lower() for o in ann.get("objects", [])}
+                prior.add({vi2en[n] for n in names if n in vi2en})
+        return prior
+
+
+class AdaptiveScheduler:
+    """
+    Chạy trước các group rẻ, recall cao (schedule_first_groups); với mỗi chunk của group còn lại,
+    chỉ chạy nếu có nhãn trong chunk có P(nhãn | nhãn đã thấy) >= schedule_min_prob (nhãn prior chưa thấy luôn chạy).
+    Mỗi schedule_eval_every ảnh chạy thêm lịch đầy đủ để đo recall của lịch thích ứng.
+    """
+
+    def __init__(self, cfg: Config, prior: CooccurrencePrior):
+        self.cfg = cfg
+        self.prior = prior
+        self.chunks_run = 0
+        self.chunks_skipped = 0
+        self.images = 0
+        self.eval_images = 0
+        self.eval_matched = 0
+        self.eval_total = 0
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> Optional["AdaptiveScheduler"]:
+        path = cfg.schedule_prior_path or cfg.output_det_path
+        if not os.path.exists(path):
+            logger.warning(f"Adaptive schedule disabled: no co-occurrence prior at {path}")
+            return None
+        prior = CooccurrencePrior.from_file(path, cfg)
+        logger.info(f"Adaptive schedule: prior from {path} ({prior.num_images} images)")
+        return cls(cfg, prior)
+
+    def is_first(self, gname: str) -> bool:
+        return gname in self.cfg.schedule_first_groups
+
+    def should_run(self, chunk_labels: List[str], observed: set) -> bool:
+        run = any(
+            self.prior.prob(ALIAS2CANON.get(l.strip().lower(), l.strip().lower()), observed) >= self.cfg.schedule_min_prob
+            for l in chunk_labels
+        )
+        if run:
+            self.chunks_run += 1
+        else:
+            self.chunks_skipped += 1
+            logger.debug(f"[schedule] skip chunk {chunk_labels} | observed={sorted(observed)}")
+        return run
+
+    def eval_due(self) -> bool:
+        self.images += 1
+        every = self.cfg.schedule_eval_every
+        return every > 0 and (self.images - 1) % every == 0
+
+    def record_eval(self, adaptive: List[Dict[str, Any]], full: List[Dict[str, Any]], iou_thr: float = 0.5):
+        """Recall = số detection của lịch đầy đủ được lịch thích ứng tìm lại (cùng nhãn, IoU >= iou_thr)."""
+        def _iou(a, b):
+            x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+            x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+            inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+            union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter + 1e-9
+            return inter / union
+
+        used = [False] * len(adaptive)
+        for f in full:
+            for i, a in enumerate(adaptive):
+                if not used[i] and a["label"] == f["label"] and _iou(a["bbox"], f["bbox"]) >= iou_thr:
+                    used[i] = True
+                    self.eval_matched += 1
+                    break
+        self.eval_total += len(full)
+        self.eval_images += 1
+
+    def summary(self) -> str:
+        total = self.chunks_run + self.chunks_skipped
+        recall = self.eval_matched / self.eval_total if self.eval_total else float("nan")
+        return (
+            f"Adaptive schedule: scheduled chunks run={self.chunks_run} skipped={self.chunks_skipped}"
+            f" ({self.chunks_skipped / max(1, total):.0%}) | recall vs full schedule={recall:.3f}"
+            f" on {self.eval_images} eval images"
+        )
+
+
+# =========================
+# Object Detector (GDINO)
+# =========================
+def contextual_field_fix(dets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Nếu phát hiện ra bóng của môn thể thao nào (bóng đá, bóng rổ, tennis, bóng chày),
+    thì sẽ ưu tiên giữ sân tương ứng (soccer field, basketball hoop, tennis court),
+    và loại bỏ các sân khác không liên quan.
+
+    Ngoài ra, sửa các nhãn bị lệch (ví dụ: "tennis court" thành "soccer field" nếu có bóng đá).
+    """
+    labels = {d["label"] for d in dets}
+
+    # Tập sân đang có trong ảnh
+    courts = {
+        "soccer field": None,
+        "tennis court": None,
+        "basketball hoop": None,
+    }
+
+    for d in dets:
+        if d["label"] in courts:
+            courts[d["label"]] = d
+
+    # Quy tắc ưu tiên
+    priority_sport = None
+    if "soccer ball" in labels or "goal" in labels or "cleats" in labels:
+        priority_sport = "soccer"
+    elif "basketball" in labels or "basketball hoop" in labels:
+        priority_sport = "basketball"
+    elif "tennis ball" in labels or "tennis racket" in labels:
+        priority_sport = "tennis"
+    elif "baseball" in labels or "baseball bat" in labels:
+        priority_sport = "baseball"
+    elif "volleyball" in labels:
+        priority_sport = "volleyball"
+
+    # Ánh xạ sport → sân mong muốn
+    desired_court = {
+        "soccer": "soccer field",
+        "basketball": "basketball hoop",
+        "tennis": "tennis court",
+        "volleyball": "volleyball court",
+    }
+
+    if priority_sport and desired_court.get(priority_sport):
+        keep = desired_court[priority_sport]
+        # Loại bỏ các sân khác
+        dets = [d for d in dets if d["label"] not in courts or d["label"] == keep]
+        # Nếu nhãn bị lệch → sửa lại
+        for d in dets:
+            if d["label"] in courts and d["label"] != keep:
+                d["label"] = keep
+
+    return dets
+
+
+def postprocess_detections(dets_all: List[Dict[str, Any]], img_size: Tuple[int, int], cfg: Config) -> List[Dict[str, Any]]:
+    """
+    Chuỗi hậu xử lý sau khi gom detection của mọi group (dùng chung cho chạy GDINO và replay từ raw store):
+    NMS theo label -> merge người -> contextual_field_fix -> lọc giày.
+    """
+    if not dets_all:
+        return []
+
+    # NMS theo label (giữ cấu trúc cũ)
+    merged: List[Dict[str, Any]] = []
+    by_label: Dict[str, List[Dict[str, Any]]] = {}
+    for d in dets_all:
+        by_label.setdefault(d["label"], []).append(d)
+
+    for label, items in by_label.items():
+        boxes = [it["bbox"] for it in items]
+        scores = [it["score"] for it in items]
+        with PROFILER.stage("nms"):
+            keep = torchvision_nms(boxes, scores, cfg.nms_iou_threshold)
+        for idx in keep:
+            merged.append(items[idx])
+
+    # === hậu xử lý đã có của bạn ===
+    merged = merge_people_cross_label(merged, iou_thr=cfg.people_merge_iou)
+    with PROFILER.stage("contextual_field_fix"):
+        merged = contextual_field_fix(merged)
+
+    w, h = img_size
+    merged = filter_shoes(merged, w, h, min_ratio=cfg.shoes_min_ratio, max_keep=cfg.shoes_max_keep)  # khuyến nghị cứng tay
+    return merged
+
+
+class GroupDetectionCache:
+    """
+    Cache detection (đã lọc ngưỡng, trước NMS/hậu xử lý) theo từng group, khoá theo
+    (hash ảnh, tên group, labels của group, model, ngưỡng detector) -> thêm/sửa 1 group
+    chỉ chạy lại group đó. Lưu dạng JSONL ghi nối.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 20):
+        self.log = JsonlCheckpoint(path, fsync_every)
+        self.data: Dict[str, Any] = self.log.load()
+
+    @staticmethod
+    def key(img_digest: str, gname: str, glabels: List[str], cfg: Config) -> str:
+        payload = {
+            "image": img_digest,
+            "group": gname,
+            "labels": list(glabels),
+            "chunk_size": cfg.group_chunk_size,
+            "model": cfg.gd_model_id,
+            "box_threshold": cfg.box_threshold,
+            "text_threshold": cfg.text_threshold,
+            "score_threshold": cfg.score_threshold,
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return "gdino::" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        dets = self.data.get(key)
+        if dets is None:
+            return None
+        # bản sao: hậu xử lý sửa label tại chỗ
+        return [dict(d, bbox=list(d["bbox"])) for d in dets]
+
+    def set(self, key: str, dets: List[Dict[str, Any]]):
+        dets = [dict(d, bbox=list(d["bbox"])) for d in dets]
+        self.data[key] = dets
+        self.log.append(key, dets)
+
+    def close(self):
+        self.log.close()
+
+
+class ObjectDetector:
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        logger.info("Loading GroundingDINO...")
+        from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+
+        self.processor = AutoProcessor.from_pretrained(cfg.gd_model_id)
+        self.model = AutoModelForZeroShotObjectDetection.from_pretrained(cfg.gd_model_id).to(cfg.device)
+        self.group_cache = (
+            GroupDetectionCache(cfg.group_cache_path, cfg.checkpoint_fsync_every) if cfg.group_cache_path else None
+        )
+        self.group_passes_run = 0
+        self.group_passes_skipped = 0
+        self.scheduler = AdaptiveScheduler.from_config(cfg) if cfg.adaptive_schedule else None
+        self._cuda = str(cfg.device).startswith("cuda")
+
+    def _run_single_prompt(self, img: Image.Image, prompt_labels: List[str],
+                           raw_out: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Chạy phát hiện cho 1 nhóm nhãn. Mapping label:
+          - Nếu post_process trả về 'text_labels' -> dùng trực tiếp.
+          - Nếu chỉ trả 'labels' (index) -> map theo chỉ số vào prompt_labels.
+        raw_out (tuỳ chọn): nhận output thô chưa lọc ngưỡng của chunk này (cho RawDetectionStore).
+        """
+        prompt_text = ". ".join([x.strip() for x in prompt_labels if x.strip()]) + "."
+        with PROFILER.stage("gdino.preprocess"):
+            inputs = self.processor(images=img, text=prompt_text, return_tensors="pt").to(self.cfg.device)
+        with PROFILER.stage("gdino.forward"), torch.no_grad():
+            outputs = self.model(**inputs)
+            if self._cuda and PROFILER.enabled:
+                # kernel CUDA chạy bất đồng bộ -> chờ xong trong stage, không thì thời gian forward bị tính cho post_process;
+                # tắt profile -> không đồng bộ, đường chạy thường giữ nguyên
+                torch.cuda.synchronize()
+        PROFILER.count("gdino.forward_passes")
+
+        if raw_out is not None:
+            raw_out.append(self._raw_chunk(outputs, inputs.input_ids, img.size, prompt_labels))
+
+        with PROFILER.stage("gdino.post_process"):
+            results = self.processor.post_process_grounded_object_detection(
+                outputs,
+                inputs.input_ids,
+                threshold=self.cfg.box_threshold,
+                text_threshold=self.cfg.text_threshold,
+                target_sizes=[img.size[::-1]]
+            )[0]
+
+        dets = []
+        # Kịch bản 1: có text_labels (phiên bản mới)
+        text_labels = results.get("text_labels", None)
+        # Kịch bản 2: chỉ có labels (số)
+        labels = results.get("labels", [])
+
+        for i, (score, box) in enumerate(zip(results["scores"], results["boxes"])):
+            score_f = float(score)
+            if score_f < self.cfg.score_threshold:
+                continue
+            if text_labels is not None:
+                label_raw = str(text_labels[i]).strip().lower()
+            else:
+                # labels[i] là index vào danh sách từ prompt
+                try:
+                    idx = int(labels[i])
+                    label_raw = prompt_labels[idx].strip().lower()
+                except Exception:
+                    # fallback: chuỗi hóa labels[i]
+                    label_raw = str(labels[i]).strip().lower()
+
+            label_canon = choose_best_label(label_raw, prompt_labels)
+
+            x0, y0, x1, y1 = [float(x) for x in box.tolist()]
+            dets.append({
+                "label": label_canon,
+                "score": score_f,
+                "bbox": [x0, y0, x1, y1]
+            })
+        return dets
+
+    def _raw_chunk(self, outputs, input_ids, img_size: Tuple[int, int], prompt_labels: List[str]) -> Dict[str, Any]:
+        """
+        Output thô của 1 chunk: box (xyxy, pixel) + xác suất theo từng token prompt của các query
+        có max prob >= raw_store_min_score (bỏ phần đuôi gần 0 cho gọn).
+        """
+        ids = input_ids[0].tolist()
+        all_probs = outputs.logits[0].sigmoid().float().cpu()
+        scores = all_probs.max(dim=-1).values
+        keep = scores >= self.cfg.raw_store_min_score
+        probs = all_probs[:, :len(ids)]
+        cx, cy, bw, bh = outputs.pred_boxes[0][keep].float().cpu().unbind(-1)
+        w, h = img_size
+        boxes = torch.stack([(cx - bw / 2) * w, (cy - bh / 2) * h, (cx + bw / 2) * w, (cy + bh / 2) * h], dim=-1)
+        return {
+            "labels": list(prompt_labels),
+            "tokens": self.processor.tokenizer.convert_ids_to_tokens(ids),
+            "boxes": boxes.numpy().astype(np.float32),
+            "scores": scores[keep].numpy().astype(np.float32),
+            "probs": probs[keep].numpy().astype(np.float32),
+        }
+
+    def _run_group(self, img: Image.Image, labels: List[str],
+                   raw_out: Optional[List[Dict[str, Any]]] = None,
+                   chunk_filter=None,
+                   done: Optional[Dict[int, List[Dict[str, Any]]]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Chạy 1 nhóm nhãn (có chunk nếu quá dài).
+        chunk_filter(chunk) -> False: bỏ qua chunk đó. Trả về (dets, complete) với complete=False nếu có chunk bị bỏ.
+        done (tuỳ chọn): chỉ số chunk -> dets đã chạy trên ảnh này; chunk có sẵn thì dùng lại, chunk mới chạy thì ghi vào.
+        """
+        all_dets = []
+        L = labels[:]
+        if not L:
+            return all_dets, True
+        # chunk theo group_chunk_size
+        C = max(1, self.cfg.group_chunk_size)
+        chunks = [L[i:i+C] for i in range(0, len(L), C)]
+        complete = True
+        for k, ch in enumerate(chunks):
+            if done is not None and k in done:
+                all_dets.extend(done[k])
+                continue
+            if chunk_filter is not None and not chunk_filter(ch):
+                complete = False
+                continue
+            dets = self._run_single_prompt(img, ch, raw_out)
+            if done is not None:
+                done[k] = dets
+            all_dets.extend(dets)
+        return all_dets, complete
+
+    def _collect_group_dets(self, img: Image.Image, digest: Optional[str],
+                            raw_out: Optional[Dict[str, List[Dict[str, Any]]]], adaptive: bool,
+                            chunk_dets: Optional[Dict[str, Dict[int, List[Dict[str, Any]]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Chạy (hoặc lấy từ cache) các group; adaptive=True -> group đầu trước, group sau theo scheduler.
+        chunk_dets (tuỳ chọn): group -> {chunk -> dets} đã chạy trên ảnh này, dùng chung giữa lượt thích ứng
+        và lượt đầy đủ khi đo recall -> lượt đầy đủ chỉ chạy các chunk bị bỏ.
+        """
+        order = list(self.cfg.group_order)
+        if adaptive:
+            order = [g for g in order if self.scheduler.is_first(g)] + [g for g in order if not self.scheduler.is_first(g)]
+        by_group: Dict[str, List[Dict[str, Any]]] = {}
+        for gname in order:
+            glabels = self.cfg.label_groups.get(gname, [])
+            if not glabels:
+                continue
+            key = None
+            if self.group_cache is not None:
+                key = GroupDetectionCache.key(digest, gname, glabels, self.cfg)
+                cached = self.group_cache.get(key) if raw_out is None else None
+                if cached is not None:
+                    self.group_passes_skipped += 1
+                    PROFILER.count("group_cache.hits")
+                    by_group[gname] = cached
+                    continue
+            chunk_filter = None
+            if adaptive and not self.scheduler.is_first(gname):
+                observed = {d["label"] for dets in by_group.values() for d in dets}
+                chunk_filter = lambda ch: self.scheduler.should_run(ch, observed)
+            done = None if chunk_dets is None else chunk_dets.setdefault(gname, {})
+            n_done = 0 if done is None else len(done)
+            logger.debug(f"[GDINO] Group {gname}: {glabels}")
+            with PROFILER.stage(f"group.{gname}"):
+                group_dets, complete = self._run_group(
+                    img, glabels, None if raw_out is None else raw_out.setdefault(gname, []), chunk_filter, done
+                )
+            if done is None or len(done) > n_done:
+                self.group_passes_run += 1
+            if key is not None and complete:
+                # group chạy thiếu chunk -> không cache dưới khoá của group đầy đủ
+                self.group_cache.set(key, group_dets)
+            by_group[gname] = group_dets
+        # ghép theo group_order (giữ thứ tự như lịch đầy đủ)
+        return [d for gname in self.cfg.group_order for d in by_group.get(gname, [])]
+
+    def detect_by_groups(self, img: Image.Image,
+                         raw_out: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+        """
+        1) Chạy lần lượt theo group_order
+        2) NMS theo label
+        3) Hậu xử lý: merge người, co-occurrence, contextual, lọc giày
+        raw_out (tuỳ chọn): dict group -> list output thô theo chunk (để lưu RawDetectionStore).
+        Group có trong group_cache (cùng ảnh/labels/model/ngưỡng) -> dùng lại, không chạy GDINO
+        (trừ khi cần raw_out).
+        """
+        digest = image_digest(img) if self.group_cache is not None else None
+        adaptive = self.scheduler is not None and raw_out is None
+        chunk_dets: Dict[str, Dict[int, List[Dict[str, Any]]]] = {}
+        dets_all = self._collect_group_dets(img, digest, raw_out, adaptive, chunk_dets if adaptive else None)
+        merged = postprocess_detections(dets_all, img.size, self.cfg)
+
+        if adaptive and self.scheduler.eval_due():
+            # đo recall: so với lịch đầy đủ; chunk lượt thích ứng đã chạy dùng lại, chỉ chạy chunk bị bỏ
+            full_dets = self._collect_group_dets(img, digest, None, False, chunk_dets)
+            full = postprocess_detections(full_dets, img.size, self.cfg)
+            self.scheduler.record_eval(merged, full)
+
+        logger.debug(f"Detections after groups: {len(merged)} | labels={sorted(set(d['label'] for d in merged))}")
+        return merged
+
+
+# =========================
+# Raw detection store (threshold sweeps)
+# =========================
+GDINO_MAX_TEXT_LEN = 256
+
+
+def _decode_tokens(tokens: List[str]) -> str:
+    """Giống tokenizer.decode (BERT wordpiece): ghép '##', dọn khoảng trắng trước dấu câu."""
+    text = " ".join(tokens).replace(" ##", "").strip()
+    for a, b in ((" .", "."), (" ?", "?"), (" !", "!"), (" ,", ","), (" ' ", "'"),
+                 (" n't", "n't"), (" 'm", "'m"), (" 's", "'s"), (" 've", "'ve"), (" 're", "'re")):
+        text = text.replace(a, b)
+    return text
+
+
+def dets_from_raw(chunk: Dict[str, Any], cfg: Config) -> List[Dict[str, Any]]:
+    """
+    Lọc ngưỡng 1 chunk output thô giống post_process_grounded_object_detection + _run_single_prompt:
+    score = max prob theo token; nhãn = các token có prob > text_threshold (bỏ token đầu/cuối).
+    """
+    scores = chunk["scores"]
+    if len(scores) == 0:
+        return []
+    probs = chunk["probs"].astype(np.float32)
+    mask = probs > cfg.text_threshold
+    mask[:, 0] = False
+    mask[:, GDINO_MAX_TEXT_LEN - 1:] = False
+    tokens = chunk["tokens"]
+
+    dets = []
+    keep = np.nonzero((scores > cfg.box_threshold) & (scores >= cfg.score_threshold))[0]
+    for i in keep:
+        label_raw = _decode_tokens([tokens[j] for j in np.nonzero(mask[i])[0]]).strip().lower()
+        dets.append({
+            "label": choose_best_label(label_raw, chunk["labels"]),
+            "score": float(scores[i]),
+            "bbox": [float(x) for x in chunk["boxes"][i]],
+        })
+    return dets
+
+
+def replay_detections(record: Dict[str, Any], cfg: Config) -> List[Dict[str, Any]]:
+    """Chạy lại ngưỡng + NMS + hậu xử lý của detect_by_groups chỉ từ output thô đã lưu."""
+    by_group: Dict[str, List[Dict[str, Any]]] = {}
+    for ch in record["chunks"]:
+        by_group.setdefault(ch["group"], []).append(ch)
+    dets_all: List[Dict[str, Any]] = []
+    for gname in cfg.group_order:
+        for ch in by_group.get(gname, []):
+            dets_all.extend(dets_from_raw(ch, cfg))
+    return postprocess_detections(dets_all, tuple(record["img_size"]), cfg)
+
+
+class RawDetectionStore:
+    """
+    Output thô của GDINO theo ảnh: mỗi ảnh 1 file .npz (nén), gồm meta (json: kích thước ảnh,
+    group/labels/tokens của từng chunk) và các cột boxes (Q,4) f32, scores (Q,) f32, probs (Q,T) f32.
+    probs giữ f32: so sánh `> text_threshold` phải khớp đúng đường post_process_grounded_object_detection
+    (f16 làm tròn ~2.4e-4 quanh 0.25 -> nhãn replay có thể lệch).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, fname: str) -> str:
+        return os.path.join(self.root, fname + ".npz")
+
+    def has(self, fname: str) -> bool:
+        return os.path.exists(self._path(fname))
+
+    def list(self) -> List[str]:
+        return sorted(f[:-4] for f in os.listdir(self.root) if f.endswith(".npz"))
+
+    def save(self, fname: str, img_size: Tuple[int, int], raw_out: Dict[str, List[Dict[str, Any]]]):
+        meta: Dict[str, Any] = {"img_size": list(img_size), "chunks": []}
+        arrays: Dict[str, np.ndarray] = {}
+        for gname, chunks in raw_out.items():
+            for ch in chunks:
+                k = len(meta["chunks"])
+                meta["chunks"].append({"group": gname, "labels": ch["labels"], "tokens": ch["tokens"]})
+                arrays[f"boxes_{k}"] = ch["boxes"]
+                arrays[f"scores_{k}"] = ch["scores"]
+                arrays[f"probs_{k}"] = ch["probs"]
+        path = self._path(fname)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+        os.replace(tmp_path, path)
+
+    def load(self, fname: str) -> Dict[str, Any]:
+        with np.load(self._path(fname)) as z:
+            meta = json.loads(str(z["meta"]))
+            for k, ch in enumerate(meta["chunks"]):
+                ch["boxes"] = z[f"boxes_{k}"]
+                ch["scores"] = z[f"scores_{k}"]
+                ch["probs"] = z[f"probs_{k}"]
+        return meta
+
+
+def sweep_thresholds(cfg: Config, grid: List[Dict[str, Any]], img_files: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Quét nhiều bộ tham số (box_threshold, text_threshold, score_threshold, nms_iou_threshold, people_merge_iou,
+    shoes_min_ratio, shoes_max_keep) chỉ từ raw store, không chạy GDINO.
+    box_threshold / score_threshold thấp hơn raw_store_min_score không lấy lại được các query đã bị bỏ khi lưu.
+    grid: list các dict ghi đè Config, vd. [{"score_threshold": 0.3}, {"score_threshold": 0.4}].
+    """
+    store = RawDetectionStore(cfg.raw_store_dir)
+    records = {f: store.load(f) for f in (img_files or store.list()) if store.has(f)}
+    results = []
+    for overrides in grid:
+        scfg = dataclasses.replace(cfg, **overrides)
+        t0 = time.perf_counter()
+        det_results = {f: replay_detections(rec, scfg) for f, rec in records.items()}
+        seconds = time.perf_counter() - t0
+        n = sum(len(v) for v in det_results.values())
+        logger.info(f"Sweep {overrides}: {n} dets / {len(det_results)} images in {seconds:.2f}s")
+        results.append({"params": overrides, "detections": det_results, "seconds": seconds})
+    return results
+
+
+# =========================
+# Relationship Extractor with Structured Output
+# =========================
+# Tăng khi sửa system/user prompt hoặc schema tool -> vô hiệu hoá cache quan hệ cũ
+RELATION_PROMPT_VERSION = "v1"
+
+
+# Trường Config ảnh hưởng kết quả từng pha (fingerprint checkpoint); đường dẫn / resume / profile / shard không tính
+DET_RESULT_FIELDS = (
+    "gd_model_id", "box_threshold", "text_threshold", "score_threshold", "nms_iou_threshold",
+    "people_merge_iou", "shoes_min_ratio", "shoes_max_keep", "group_chunk_size", "label_groups", "group_order",
+    "adaptive_schedule", "schedule_first_groups", "schedule_min_prob", "detector_backend", "fake_detector_boxes",
+)
+REL_RESULT_FIELDS = DET_RESULT_FIELDS + (
+    "gpt_model_vision", "gpt_model_text", "openai_backend", "max_relations", "payload_format", "payload_quality",
+    "payload_max_side", "payload_max_pixels", "payload_reuse_source", "predicate_map_en_vi", "object_dict_en_vi",
+)
+
+
+def checkpoint_fingerprint(cfg: Config, fields: Tuple[str, ...], **extra: Any) -> str:
+    payload = {f: getattr(cfg, f) for f in fields}
+    payload.update(extra)
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RelationshipExtractor:
+    def __init__(self, cfg: Config, client: "OpenAI", translator: Translator, cache: Optional[SimpleCache] = None):
+        self.cfg = cfg
+        self.client = client
+        self.translator = translator
+        self.cache = cache
+        self.encoder = ImagePayloadEncoder(cfg)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _relations_cache_key(self, img: Image.Image, obj_brief: List[Dict[str, Any]]) -> str:
+        """Khoá cache theo nội dung: hash ảnh + objects (đã chuẩn hoá) + model + max_relations + phiên bản prompt."""
+        payload = {
+            "prompt_version": RELATION_PROMPT_VERSION,
+            "model": self.cfg.gpt_model_vision,
+            "max_relations": self.cfg.max_relations,
+            "payload": self.encoder.signature(),
+            "image": image_digest(img),
+            "objects": obj_brief,
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return "relations::" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _box_to_brief(o: Dict[str, Any], scale: float = 1.0) -> Dict[str, Any]:
+        # Thêm thông tin không gian (center, area) để GPT dễ hiểu
+        # scale: toạ độ được đổi theo ảnh đã thu nhỏ gửi lên GPT
+        if scale != 1.0:
+            x, y = round(o["x"] * scale), round(o["y"] * scale)
+            w, h = round(o["w"] * scale), round(o["h"] * scale)
+        else:
+            x, y, w, h = o["x"], o["y"], o["w"], o["h"]
+        cx = x + w / 2
+        cy = y + h / 2
+        area = w * h
+        return {
+            "object_id": o["object_id"],
+            "name": o["names"][0],
+            "x": x, "y": y, "w": w, "h": h,
+            "cx": cx, "cy": cy, "area": area
+        }
+
+    def caption(self, img: Image.Image, img_path: Optional[str] = None) -> str:
+        """Mô tả ngắn gọn các đối tượng thể thao chính (không tả nền)"""
+        data_url = self.encoder.encode(img, img_path).data_url
+        messages = [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text":
+                    "Describe briefly only the main sports objects (players, balls, nets, referees, rackets...). "
+                    "No background description. One sentence."},
+                {"type": "image_url", "image_url": {"url": data_url}}
+            ]
+        }]
+        try:
+            with PROFILER.stage("gpt.caption"):
+                resp = self.client.chat.completions.create(
+                    model=self.cfg.gpt_model_vision,
+                    messages=messages,
+                    max_tokens=100,
+                    temperature=0.2
+                )
+            cap = (resp.choices[0].message.content or "").strip()
+            return cap
+        except Exception as e:
+            logger.warning(f"Caption error: {e}")
+            return ""
+
+    def extract_relations(self, img: Image.Image, vg_objects: List[Dict[str, Any]],
+                          img_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Dùng Structured Output / Function Calling để buộc JSON đúng schema.
+        img_path (tuỳ chọn): cho phép gửi lại nguyên bytes JPEG gốc nếu vừa ngân sách.
+        """
+        if not vg_objects:
+            return []
+
+        # Toạ độ gửi GPT phải khớp với ảnh (có thể đã thu nhỏ) gửi kèm
+        scale = self.encoder.scale_for(img.size)
+        obj_brief = [self._box_to_brief(o, scale) for o in vg_objects]
+
+        # Cache theo nội dung: cùng ảnh + cùng objects + cùng model/prompt -> không gọi lại API
+        cache_key = None
+        relationships_en: Optional[List[Dict[str, Any]]] = None
+        if self.cache is not None and self.cfg.cache_relations:
+            cache_key = self._relations_cache_key(img, obj_brief)
+            relationships_en = self.cache.get(cache_key)
+            if relationships_en is not None:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+        if relationships_en is None:
+            relationships_en = self._request_relations(img, obj_brief, img_path)
+            if relationships_en is None:
+                return []
+            if cache_key is not None:
+                # lưu output thô (EN) của tool call -> đổi luật hậu kiểm/dịch không cần gọi lại API
+                self.cache.set(cache_key, relationships_en)
+
+        return self._postprocess_relations(relationships_en, vg_objects)
+
+    def _request_relations(self, img: Image.Image, obj_brief: List[Dict[str, Any]],
+                           img_path: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Gọi GPT vision (function calling); trả về list quan hệ thô (EN) hoặc None nếu lỗi."""
+        data_url = self.encoder.encode(img, img_path).data_url
+
+        # tools schema cho function-calling
+        tools = [{
+            "type": "function",
+            "function": {
+                "name": "emit_relationships",
+                "description": "Return scene graph relationships between objects.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "relationships": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "predicate": {"type": "string"},
+                                    "subject_id": {"type": "integer"},
+                                    "object_id": {"type": "integer"},
+                                },
+                                "required": ["predicate", "subject_id", "object_id"],
+                                "additionalProperties": False
+                            }
+                        }
+                    },
+                    "required": ["relationships"],
+                    "additionalProperties": False
+                },
+                "strict": True
+            }
+        }]
+
+        system_prompt = (
+            "You are a vision relationship extractor. "
+            "Given the image and the object list (with positions), return at most "
+            f"{self.cfg.max_relations} relationships as JSON via the tool function only. "
+            "Use concise English predicates (1–2 words). "
+            "If uncertain, return an empty list."
+        )
+
+        user_prompt = (
+            "Objects list (use object_id when referencing):\n"
+            + json.dumps(obj_brief, ensure_ascii=False, indent=2) +
+            "\n\nTips:\n"
+            "- Spatial hints: objects with larger 'area' are often fields/courts.\n"
+            "- 'standing on' if a person is on a field/court.\n"
+            "- Common actions: holding, kicking, throwing, catching, passing, blocking, dribbling.\n"
+            "- Return ONLY via the provided tool/function."
+        )
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": [
+                {"type": "text", "text": user_prompt},
+                {"type": "image_url", "image_url": {"url": data_url}}
+            ]}
+        ]
+
+        try:
+            with PROFILER.stage("gpt.relations"):
+                resp = self.client.chat.completions.create(
+                    model=self.cfg.gpt_model_vision,
+                    messages=messages,
+                    tools=tools,
+                    tool_choice={"type": "function", "function": {"name": "emit_relationships"}},
+                    temperature=0.2,
+                    max_tokens=600
+                )
+            # Bóc tool_calls
+            tool_calls = resp.choices[0].message.tool_calls or []
+            relationships_en: List[Dict[str, Any]] = []
+            for call in tool_calls:
+                if call.function.name == "emit_relationships":
+                    args = json.loads(call.function.arguments)
+                    relationships_en.extend(args.get("relationships", []))
+
+        except Exception as e:
+            logger.warning(f"Structured relation error: {e}")
+            PROFILER.count("gpt.relations_errors")
+            return None
+
+        return relationships_en
+
+    def _postprocess_relations(self, relationships_en: List[Dict[str, Any]], vg_objects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Hậu kiểm id, khử trùng, cắt về max_relations và dịch predicate sang tiếng Việt."""
+        # Hậu kiểm + cắt về max_relations
+        valid_ids = {o["object_id"] for o in vg_objects}
+        cleaned: List[Tuple[int, str, int]] = []
+        seen = set()
+        for it in relationships_en:
+            try:
+                pred_en = (it.get("predicate") or "").strip().lower()
+                sid = int(it.get("subject_id"))
+                oid = int(it.get("object_id"))
+                if not pred_en or sid == oid or sid not in valid_ids or oid not in valid_ids:
+                    continue
+                key = (sid, pred_en, oid)
+                if key not in seen:
+                    cleaned.append(key)
+                    seen.add(key)
+            except Exception:
+                continue
+
+        cleaned = cleaned[: self.cfg.max_relations]
+
+        # Dịch predicate: ưu tiên map tĩnh, sau đó GPT (cache)
+        preds_en = [p for (_, p, _) in cleaned]
+        preds_vi: List[str] = []
+        to_translate: List[str] = []
+
+        for p in preds_en:
+            if p in self.cfg.predicate_map_en_vi:
+                preds_vi.append(self.cfg.predicate_map_en_vi[p])
+            else:
+                preds_vi.append(None)
+                to_translate.append(p)
+
+        if to_translate:
+            # Cache batch
+            # dùng Translator cho tiện, dù là hành động; có thể tạo translator riêng cho predicate
+            translated = self.translator.translate_terms(to_translate)
+            j = 0
+            for i in range(len(preds_vi)):
+                if preds_vi[i] is None:
+                    preds_vi[i] = translated[j] if j < len(translated) else to_translate[j]
+                    j += 1
+
+        # Kết quả cuối
+        relationships: List[Dict[str, Any]] = []
+        rid = 1
+        for (sid, p_en, oid), p_vi in zip(cleaned, preds_vi):
+            relationships.append({
+                "relationship_id": rid,
+                "predicate": p_vi,  # tiếng Việt
+                "subject_id": sid,
+                "object_id": oid
+            })
+            rid += 1
+
+        return relationships
+
+
+# =========================
+# Offline backends (benchmark / CI)
+# =========================
+
+
+class FakeObjectDetector:
+    """
+    Thay ObjectDetector khi detector_backend="fake": sinh box tổng hợp, xác định theo nội dung ảnh,
+    ngủ fake_detector_latency_ms mỗi ảnh (giả lập GDINO) rồi đi qua đúng chuỗi hậu xử lý.
+    """
+
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        self.group_cache = None
+        self.scheduler = None
+        self.group_passes_run = 0
+        self.group_passes_skipped = 0
+        self.labels = [l for g in cfg.group_order for l in cfg.label_groups.get(g, [])]
+
+    def detect_by_groups(self, img: Image.Image,
+                         raw_out: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+        w, h = img.size
+        rng = random.Random(f"{w}x{h}:{img.resize((8, 8)).tobytes().hex()}")
+        if self.cfg.fake_detector_latency_ms > 0:
+            time.sleep(self.cfg.fake_detector_latency_ms / 1000.0)
+        self.group_passes_run += len(self.cfg.group_order)
+        dets = []
+        for _ in range(self.cfg.fake_detector_boxes):
+            x0, y0 = rng.uniform(0, w * 0.7), rng.uniform(0, h * 0.7)
+            x1, y1 = x0 + rng.uniform(0.1, 0.3) * w, y0 + rng.uniform(0.1, 0.3) * h
+            dets.append({"label": rng.choice(self.labels), "score": round(rng.uniform(0.35, 0.95), 4),
+                         "bbox": [x0, y0, min(x1, w), min(y1, h)]})
+        return postprocess_detections(dets, img.size, self.cfg)
+
+
+class StubAPIError(RuntimeError):
+    pass
+
+
+class StubCompletions:
+    """
+    Sinh response chat.completions hợp lệ (dạng JSON của OpenAI) cho 3 loại request của pipeline:
+    dịch (JSON translations), emit_relationships (tool call), caption (text). Kết quả xác định theo nội dung request;
+    lỗi được rút ngẫu nhiên (seed cố định) theo error_rate.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def respond(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        if fail:
+            raise StubAPIError("stub: injected error")
+
+        texts = []
+        for m in req.get("messages", []):
+            content = m.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+            elif isinstance(content, list):
+                texts.extend(p.get("text", "") for p in content if p.get("type") == "text")
+        rng = random.Random("\n".join(texts))
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+
+        if req.get("tools"):
+            ids = [int(x) for x in re.findall(r'"object_id":\s*(\d+)', texts[-1] if texts else "")]
+            rels = []
+            if len(ids) >= 2:
+                preds = ["holding", "kicking", "standing on", "next to", "looking at", "near"]
+                for _ in range(min(len(ids), 3)):
+                    s, o = rng.sample(ids, 2)
+                    rels.append({"predicate": rng.choice(preds), "subject_id": s, "object_id": o})
+            message["tool_calls"] = [{
+                "id": "call_stub", "type": "function",
+                "function": {"name": "emit_relationships",
+                             "arguments": json.dumps({"relationships": rels})},
+            }]
+            finish = "tool_calls"
+        elif texts and "{\"translations\"" in texts[0]:
+            terms = json.loads(texts[0].split("\n\n", 1)[1])
+            message["content"] = json.dumps({"translations": [f"{t} (vi)" for t in terms]}, ensure_ascii=False)
+            finish = "stop"
+        else:
+            message["content"] = "A player on a sports field."
+            finish = "stop"
+
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+            "model": req.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def create(self, **kwargs):
+        return _to_namespace(self.respond(kwargs))
+
+
+def _to_namespace(obj):
+    if isinstance(obj, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return [_to_namespace(v) for v in obj]
+    return obj
+
+
+class StubOpenAI:
+    """Client in-process thay OpenAI(...): chỉ cần client.chat.completions.create(**kwargs)."""
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.chat = SimpleNamespace(completions=StubCompletions(latency_ms, error_rate, seed))
+
+
+class StubOpenAIServer:
+    """
+    Server HTTP localhost tương thích OpenAI (POST /v1/chat/completions) dùng StubCompletions
+    -> đo cả chi phí HTTP/serialize của client openai thật (cfg.openai_base_url = server.base_url).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.completions = StubCompletions(latency_ms, error_rate, seed)
+        completions = self.completions
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # tránh trễ ~40ms do delayed ACK giữa header và body
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                try:
+                    self._send(200, completions.respond(json.loads(body or b"{}")))
+                except StubAPIError as e:
+                    self._send(500, {"error": {"message": str(e), "type": "server_error"}})
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def make_openai_client(cfg: Config):
+    if cfg.openai_backend == "stub":
+        return StubOpenAI(cfg.stub_latency_ms, cfg.stub_error_rate)
+    from openai import OpenAI
+
+    # self.client = OpenAI(api_key=os.environ.get(cfg.openai_api_key_env))
+    return OpenAI(api_key="API Key", base_url=cfg.openai_base_url or None)
+
+
+def make_detector(cfg: Config):
+    if cfg.detector_backend == "fake":
+        return FakeObjectDetector(cfg)
+    return ObjectDetector(cfg)
+
+
+def _make_bench_images(img_dir: str, n: int, size: Tuple[int, int] = (640, 480), seed: int = 0):
+    os.makedirs(img_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        path = os.path.join(img_dir, f"{i:012d}.jpg")
+        if not os.path.exists(path):
+            arr = rng.integers(0, 256, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+            Image.fromarray(arr).resize(size).save(path, quality=85)
+
+
+def benchmark_offline(cfg: Config, num_images: int = 50, concurrency: List[int] = (1, 2, 4),
+                      latencies_ms: List[float] = (0.0, 50.0), error_rate: float = 0.0,
+                      http: bool = False, work_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Đo throughput (ảnh/s) và độ trễ đuôi của toàn bộ run() với backend giả lập.
+    concurrency = số shard chạy song song (thread) qua shard_config; latency áp cho cả detector giả và stub GPT.
+    http=True -> stub chạy qua StubOpenAIServer + client openai thật.
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix="vietsgg_bench_")
+    img_dir = os.path.join(work_dir, "images")
+    _make_bench_images(img_dir, num_images)
+    rows = []
+    level = logger.level
+    for lat in latencies_ms:
+        for conc in concurrency:
+            run_dir = os.path.join(work_dir, f"lat{lat:g}_c{conc}{'_http' if http else ''}")
+            os.makedirs(run_dir, exist_ok=True)
+            server = StubOpenAIServer(lat, error_rate).start() if http else None
+            base = dataclasses.replace(
+                cfg, img_dir=img_dir,
+                output_rel_path=os.path.join(run_dir, "rel.json"),
+                output_det_path=os.path.join(run_dir, "det.json"),
+                cache_path=os.path.join(run_dir, "cache.json"), cache_seed_path="",
+                det_checkpoint_path=os.path.join(run_dir, "det_ckpt.jsonl"),
+                rel_checkpoint_path=os.path.join(run_dir, "rel_ckpt.jsonl"),
+                group_cache_path="", raw_store_dir="", resume=False, force_redetect=True,
+                detector_backend="fake", fake_detector_latency_ms=lat,
+                openai_backend="openai" if http else "stub",
+                openai_base_url=server.base_url if http else "",
+                stub_latency_ms=lat, stub_error_rate=error_rate,
+                profile=True, profile_summary_path="", profile_trace_path="",
+            )
+            cfgs = [base] if conc == 1 else [shard_config(base, i, conc) for i in range(conc)]
+            pipelines = [SGGPipeline(c) for c in cfgs]
+            PROFILER.reset(True)  # mỗi SGGPipeline() reset profiler -> reset lại 1 lần cho cả lượt đo
+            logger.setLevel(logging.WARNING)
+            t0 = time.perf_counter()
+            try:
+                threads = [threading.Thread(target=p.run) for p in pipelines]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            finally:
+                wall = time.perf_counter() - t0
+                logger.setLevel(level)
+                if server is not None:
+                    server.stop()
+
+            stages = PROFILER.summary()["stages"]
+            row = {
+                "latency_ms": lat, "concurrency": conc, "http": http, "images": num_images,
+                "wall_s": round(wall, 3), "images_per_s": round(num_images / wall, 2),
+                "gpt_errors": PROFILER.counters.get("gpt.relations_errors", 0),
+            }
+            for name in ("detect_image", "extract_relations"):
+                st = stages.get(name, {})
+                row[f"{name}_p50_ms"] = st.get("p50_ms")
+                row[f"{name}_p99_ms"] = st.get("p99_ms")
+            rows.append(row)
+            logger.info(
+                f"[bench] lat={lat:g}ms conc={conc} -> {row['images_per_s']} img/s | "
+                f"detect p50/p99={row['detect_image_p50_ms']}/{row['detect_image_p99_ms']}ms | "
+                f"relations p50/p99={row['extract_relations_p50_ms']}/{row['extract_relations_p99_ms']}ms | "
+                f"errors={row['gpt_errors']}"
+            )
+    PROFILER.reset(cfg.profile, trace=bool(cfg.profile_trace_path))
+    return rows
+
+
+# =========================
+# Pipeline
+# =========================
+class SGGPipeline:
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        PROFILER.reset(cfg.profile, trace=bool(cfg.profile_trace_path))
+        # OpenAI (hoặc stub offline theo cfg.openai_backend)
+        self.client = make_openai_client(cfg)
+        # cache (shard: cache riêng, khởi tạo từ cache chung nếu có)
+        self.cache = SimpleCache(cfg.cache_path, seed_path=cfg.cache_seed_path or None)
+        # modules
+        self.detector = make_detector(cfg)
+        self.translator = Translator(cfg, self.client, self.cache)
+        self.relation_extractor = RelationshipExtractor(cfg, self.client, self.translator, self.cache)
+
+    def _build_vg_objects(self, dets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        - Tách chuẩn nhãn (giữ nguyên cụm đầy đủ từ mapping).
+        - Dịch sang tiếng Việt (ưu tiên từ điển cố định + cache).
+        """
+        if not dets:
+            return []
+
+        raw_labels = [d["label"].strip().lower() for d in dets]
+        vi_labels = self.translator.translate_terms(raw_labels)
+
+        objects = []
+        for idx, (det, vi_name) in enumerate(zip(dets, vi_labels), start=1):
+            x0, y0, x1, y1 = det["bbox"]
+            w, h = max(0, int(x1 - x0)), max(0, int(y1 - y0))
+            objects.append({
+                "object_id": idx,
+                "names": [vi_name],
+                "x": int(x0),
+                "y": int(y0),
+                "w": w,
+                "h": h
+            })
+        return objects
+
+    def detect_and_save(self, img_files: List[str]) -> Dict[str, Any]:
+        """
+        Chạy phát hiện theo nhóm prompt, mapping nhãn -> tên thực.
+        Lưu cache phát hiện vào file để tái sử dụng.
+        Mỗi ảnh xong được ghi nối vào checkpoint -> chạy lại chỉ phát hiện ảnh còn thiếu.
+        """
+        ckpt, det_results = self._open_checkpoint(
+            self.cfg.det_checkpoint_path, "detections", checkpoint_fingerprint(self.cfg, DET_RESULT_FIELDS)
+        )
+        raw_store = RawDetectionStore(self.cfg.raw_store_dir) if self.cfg.raw_store_dir else None
+        todo = [f for f in img_files if f not in det_results]
+        for fname in tqdm(todo, desc="Detecting"):
+            try:
+                if raw_store is not None and self.cfg.detect_from_raw_store and raw_store.has(fname):
+                    # chỉ chạy lại ngưỡng + hậu xử lý từ output thô đã lưu (không gọi GDINO)
+                    dets = replay_detections(raw_store.load(fname), self.cfg)
+                    det_results[fname] = dets
+                    ckpt.append(fname, dets)
+                    continue
+
+                img_path = os.path.join(self.cfg.img_dir, fname)
+                with PROFILER.stage("image_decode"), Image.open(img_path) as im:
+                    img = im.convert("RGB")
+
+                raw_out = {} if raw_store is not None else None
+                with PROFILER.stage("detect_image"):
+                    dets = self.detector.detect_by_groups(img, raw_out)
+                if raw_store is not None:
+                    raw_store.save(fname, img.size, raw_out)
+                det_results[fname] = dets
+                ckpt.append(fname, dets)
+                logger.debug(f"{fname}: {len(dets)} dets")
+            except Exception as e:
+                logger.error(f"Detect error {fname}: {e}")
+        ckpt.close()
+        if self.detector.group_cache is not None:
+            self.detector.group_cache.close()
+        logger.info(
+            f"Detector group passes: run={self.detector.group_passes_run} "
+            f"skipped={self.detector.group_passes_skipped} (group cache)"
+        )
+        if self.detector.scheduler is not None:
+            logger.info(self.detector.scheduler.summary())
+
+        # Lưu ra file (theo thứ tự img_files)
+        det_results = {f: det_results[f] for f in img_files if f in det_results}
+        with open(self.cfg.output_det_path, "w", encoding="utf-8") as f:
+            json.dump(det_results, f, ensure_ascii=False, indent=2)
+        logger.info(f"Saved detections cache -> {self.cfg.output_det_path}")
+        return det_results
+
+    def _prefetch_translations(self, det_results: Dict[str, Any]):
+        """Gom nhãn canonical từ detections + vị từ EN đã gặp (cache quan hệ) rồi dịch 1 lần."""
+        labels = {d["label"].strip().lower() for dets in det_results.values() for d in dets}
+        predicates = set()
+        for key, rels in self.cache.data.items():
+            if key.startswith("relations::") and isinstance(rels, list):
+                for r in rels:
+                    p = (r.get("predicate") or "").strip().lower() if isinstance(r, dict) else ""
+                    if p and p not in self.cfg.predicate_map_en_vi:
+                        predicates.add(p)
+        self.translator.prefetch(sorted(labels) + sorted(predicates))
+
+    def _open_checkpoint(self, path: str, desc: str, fingerprint: str) -> Tuple[JsonlCheckpoint, Dict[str, Any]]:
+        """
+        Mở checkpoint JSONL; trả về (checkpoint, các ảnh đã xong). resume=False -> bắt đầu lại từ đầu.
+        fingerprint: checkpoint_fingerprint của pha; checkpoint ghi với cấu hình khác -> bỏ, chạy lại từ đầu.
+        """
+        ckpt = JsonlCheckpoint(path, self.cfg.checkpoint_fsync_every, fingerprint)
+        if not self.cfg.resume:
+            ckpt.remove()
+            return ckpt, {}
+        done = ckpt.load()
+        if done:
+            logger.info(f"Resume {desc}: {len(done)} images already in {path}")
+        return ckpt, done
+
+    def run(self):
+        # 1) Danh sách ảnh
+        img_files = list_images(self.cfg.img_dir)
+        if self.cfg.shard_count > 1:
+            img_files = [f for f in img_files if shard_of(f, self.cfg.shard_count) == self.cfg.shard_index]
+            logger.info(f"Shard {self.cfg.shard_index}/{self.cfg.shard_count}: {len(img_files)} images")
+
+        # 2) Phát hiện + lưu cache + kiểm tra force_redetect (nếu có cache rồi và force_redetect == false thì load)
+        if (not self.cfg.force_redetect) and os.path.exists(self.cfg.output_det_path):
+            try:
+                with open(self.cfg.output_det_path, "r", encoding="utf-8") as f:
+                    det_results = json.load(f)
+                logger.info(f"Loaded detections cache from {self.cfg.output_det_path}")
+            except Exception:
+                det_results = self.detect_and_save(img_files)
+        else:
+            det_results = self.detect_and_save(img_files)
+
+        # 2b) Dịch trước toàn bộ từ vựng -> không gọi GPT dịch theo từng ảnh
+        if self.cfg.translate_prefetch:
+            self._prefetch_translations(det_results)
+
+        # 3) Trích xuất quan hệ (dùng Structured Output + hậu kiểm); ảnh đã có trong checkpoint -> bỏ qua
+        rel_ckpt, rel_done = self._open_checkpoint(
+            self.cfg.rel_checkpoint_path, "relations",
+            checkpoint_fingerprint(self.cfg, REL_RESULT_FIELDS, prompt_version=RELATION_PROMPT_VERSION),
+        )
+        todo = [f for f in img_files if f not in rel_done]
+        for i, fname in enumerate(tqdm(todo, desc="Relations"), start=1):
+            try:
+                img_path = os.path.join(self.cfg.img_dir, fname)
+                with PROFILER.stage("image_decode"), Image.open(img_path) as im:
+                    img = im.convert("RGB")
+
+                dets = det_results.get(fname, [])
+                with PROFILER.stage("build_vg_objects"):
+                    vg_objects = self._build_vg_objects(dets)
+
+                # đảm bảo nhãn đối tượng đúng và đầy đủ: nếu thiếu các đối tượng quan trọng → đã xử lý từ bước detect_batched
+                # Caption (có thể dùng hoặc bỏ; structured có thể đủ). Ở đây vẫn sinh để tăng ngữ cảnh nếu muốn dùng sau.
+                # cap = self.relation_extractor.caption(img, img_path)  # hiện không bắt buộc dùng
+
+                with PROFILER.stage("extract_relations"):
+                    relationships = self.relation_extractor.extract_relations(img, vg_objects, img_path)
+
+                result = {
+                    "image_id": parse_image_id_from_name(fname),
+                    "objects": vg_objects,
+                    "relationships": relationships
+                }
+                rel_done[fname] = result
+                rel_ckpt.append(fname, result)
+            except Exception as e:
+                logger.error(f"Relation error {fname}: {e}")
+
+            if self.cfg.cache_save_every > 0 and i % self.cfg.cache_save_every == 0:
+                rel_ckpt.flush()
+                self.cache.save()
+        rel_ckpt.close()
+
+        # 4) Lưu kết quả cuối (ghép từ checkpoint theo thứ tự img_files) + cache GPT
+        all_results = [rel_done[f] for f in img_files if f in rel_done]
+        with open(self.cfg.output_rel_path, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, ensure_ascii=False, indent=2)
+        logger.info(f"Saved relationships -> {self.cfg.output_rel_path}")
+
+        self.cache.save()
+        if not self.cfg.keep_checkpoints:
+            # run() hoàn tất -> lần chạy sau bắt đầu mới (theo force_redetect)
+            JsonlCheckpoint(self.cfg.det_checkpoint_path).remove()
+            rel_ckpt.remove()
+        logger.info(
+            f"Relation cache: hits={self.relation_extractor.cache_hits} "
+            f"misses={self.relation_extractor.cache_misses}"
+        )
+        logger.info(self.relation_extractor.encoder.summary())
+        logger.info(f"Translation requests: {self.translator.api_calls}")
+        logger.info(f"Label resolver: {label_resolver_stats()}")
+        PROFILER.write(self.cfg.profile_summary_path, self.cfg.profile_trace_path)
+        logger.info("All done.")
+
+
+# =========================
+# Sharding (multi-node)
+# =========================
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """'i/N' -> (i, N) với 0 <= i < N."""
+    try:
+        i_str, n_str = spec.split("/")
+        i, n = int(i_str), int(n_str)
+    except ValueError:
+        raise ValueError(f"Invalid shard spec '{spec}', expected i/N")
+    if n < 1 or not (0 <= i < n):
+        raise ValueError(f"Invalid shard spec '{spec}', need 0 <= i < N")
+    return i, n
+
+
+def shard_path(path: str, shard_index: int, shard_count: int) -> str:
+    """relationships.json -> relationships.shard-00001-of-00004.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard_index:05d}-of-{shard_count:05d}{ext}"
+
+
+def shard_config(cfg: Config, shard_index: int, shard_count: int) -> Config:
+    """Config cho 1 shard: output/cache/checkpoint riêng -> các shard chạy độc lập, không tranh chấp file."""
+    sp = lambda p: shard_path(p, shard_index, shard_count)
+    return dataclasses.replace(
+        cfg,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        output_rel_path=sp(cfg.output_rel_path),
+        output_det_path=sp(cfg.output_det_path),
+        cache_path=sp(cfg.cache_path),
+        cache_seed_path=cfg.cache_path,
+        det_checkpoint_path=sp(cfg.det_checkpoint_path),
+        rel_checkpoint_path=sp(cfg.rel_checkpoint_path),
+        group_cache_path=sp(cfg.group_cache_path) if cfg.group_cache_path else "",
+        profile_summary_path=sp(cfg.profile_summary_path) if cfg.profile_summary_path else "",
+        profile_trace_path=sp(cfg.profile_trace_path) if cfg.profile_trace_path else "",
+    )
+
+
+def _image_sort_key(image_id: Any) -> Tuple[int, Any]:
+    # image_id có thể là int hoặc chuỗi (tên file không có số) -> vẫn sắp xếp ổn định
+    return (0, image_id) if isinstance(image_id, int) else (1, str(image_id))
+
+
+def _rel_order(cfg: Config, det_results: Dict[str, Any]) -> Dict[Any, int]:
+    """
+    image_id -> vị trí theo tên file như run() (img_files.sort()), không theo số: "10.jpg" đứng trước "2.jpg".
+    Tên file lấy từ key det.json của các shard, bổ sung từ img_dir nếu có (ảnh lỗi detect vẫn có quan hệ).
+    """
+    names = set(det_results)
+    if os.path.isdir(cfg.img_dir):
+        names.update(list_images(cfg.img_dir))
+    order: Dict[Any, int] = {}
+    for pos, fname in enumerate(sorted(names)):
+        order.setdefault(parse_image_id_from_name(fname), pos)
+    return order
+
+
+def merge_shards(cfg: Config, shard_count: int) -> Dict[str, int]:
+    """
+    Ghép output của shard_count shard về output_rel_path / output_det_path (thứ tự ổn định)
+    và hợp nhất cache GPT của các shard vào cache_path.
+    """
+    det_results: Dict[str, Any] = {}
+    rel_results: List[Dict[str, Any]] = []
+    cache = SimpleCache(cfg.cache_path)
+    group_cache = GroupDetectionCache(cfg.group_cache_path) if cfg.group_cache_path else None
+    missing = []
+    for i in range(shard_count):
+        scfg = shard_config(cfg, i, shard_count)
+        if not (os.path.exists(scfg.output_rel_path) and os.path.exists(scfg.output_det_path)):
+            missing.append(i)
+            continue
+        with open(scfg.output_det_path, "r", encoding="utf-8") as f:
+            det_results.update(json.load(f))
+        with open(scfg.output_rel_path, "r", encoding="utf-8") as f:
+            rel_results.extend(json.load(f))
+        shard_cache = SimpleCache(scfg.cache_path)
+        for k, v in shard_cache.data.items():
+            # giữ giá trị đã có (cache chung/shard trước) -> kết quả không phụ thuộc thứ tự ghép
+            if cache.get(k) is None:
+                cache.set(k, v)
+        if group_cache is not None and os.path.exists(scfg.group_cache_path):
+            for k, v in JsonlCheckpoint(scfg.group_cache_path).load().items():
+                if k not in group_cache.data:
+                    group_cache.set(k, v)
+    if missing:
+        raise FileNotFoundError(f"Missing outputs for shards: {missing}")
+
+    det_results = {k: det_results[k] for k in sorted(det_results)}
+    order = _rel_order(cfg, det_results)
+    rel_results.sort(key=lambda r: (order.get(r.get("image_id"), len(order)), _image_sort_key(r.get("image_id"))))
+
+    with open(cfg.output_det_path, "w", encoding="utf-8") as f:
+        json.dump(det_results, f, ensure_ascii=False, indent=2)
+    with open(cfg.output_rel_path, "w", encoding="utf-8") as f:
+        json.dump(rel_results, f, ensure_ascii=False, indent=2)
+    cache.save()
+    if group_cache is not None:
+        group_cache.close()
+    logger.info(
+        f"Merged {shard_count} shards -> {cfg.output_rel_path} ({len(rel_results)} images), "
+        f"{cfg.output_det_path} ({len(det_results)} images), cache={len(cache.data)} entries"
+    )
+    return {"images": len(rel_results), "detections": len(det_results), "cache_entries": len(cache.data)}
+
+
+# =========================
+# Main
+# =========================
+def _parse_value(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def build_config(config_path: str = "", overrides: Optional[List[str]] = None) -> Config:
+    """Config mặc định, ghi đè bởi file JSON (config_path) rồi tới các cặp KEY=VALUE."""
+    values: Dict[str, Any] = {}
+    if config_path:
+        with open(config_path, "r", encoding="utf-8") as f:
+            values.update(json.load(f))
+    for item in overrides or []:
+        key, sep, raw = item.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid --set '{item}', expected KEY=VALUE")
+        values[key.strip()] = _parse_value(raw)
+    known = {f.name for f in dataclasses.fields(Config)}
+    unknown = sorted(set(values) - known)
+    if unknown:
+        raise ValueError(f"Unknown Config fields: {unknown}")
+    return Config(**values)
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="VietSGG annotation pipeline (GroundingDINO + GPT).")
+    ap.add_argument("--config", default="", help="File JSON ghi đè các trường của Config")
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                    help="Ghi đè 1 trường Config (lặp lại được), vd. --set detector_backend=fake")
+    ap.add_argument("--log-dir", default="./logs", help="Thư mục ghi pipeline_debug.log")
+    ap.add_argument("--shard", default=None, help="Chỉ chạy 1 shard: i/N (vd. 0/4)")
+    ap.add_argument("--merge-shards", type=int, default=0, metavar="N",
+                    help="Ghép output + cache của N shard về file cuối rồi thoát")
+    ap.add_argument("--bench-offline", action="store_true",
+                    help="Benchmark run() với detector giả + stub GPT (không cần GPU/mạng)")
+    ap.add_argument("--bench-images", type=int, default=50)
+    ap.add_argument("--bench-concurrency", default="1,2,4", help="Số shard chạy song song, vd. 1,2,4")
+    ap.add_argument("--bench-latency-ms", default="0,50", help="Độ trễ giả lập mỗi lần gọi, vd. 0,50,200")
+    ap.add_argument("--bench-error-rate", type=float, default=0.0)
+    ap.add_argument("--bench-http", action="store_true", help="Stub GPT qua server HTTP localhost")
+    ap.add_argument("--bench-out", default="offline_bench.json")
+    args = ap.parse_args(argv)
+
+    setup_logging(args.log_dir)
+    cfg = build_config(args.config, args.set)
+    if args.bench_offline:
+        rows = benchmark_offline(
+            cfg, args.bench_images,
+            concurrency=[int(x) for x in args.bench_concurrency.split(",")],
+            latencies_ms=[float(x) for x in args.bench_latency_ms.split(",")],
+            error_rate=args.bench_error_rate, http=args.bench_http,
+        )
+        with open(args.bench_out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        logger.info(f"Saved benchmark -> {args.bench_out}")
+    elif args.merge_shards:
+        merge_shards(cfg, args.merge_shards)
+    else:
+        if args.shard:
+            cfg = shard_config(cfg, *parse_shard_spec(args.shard))
+        pipeline = SGGPipeline(cfg)
+        pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
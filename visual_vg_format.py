@@ -1,146 +1,199 @@
+"""
+visual_vg_format.py
+--------------------
+Vẽ bbox + quan hệ từ COCO <split>.json + file quan hệ, hỗ trợ 2 bố cục:
+- rel.json dạng split: {"train": {"<image_id>": [[s_idx, o_idx, pred_id], ...]}, ..., "rel_categories": [...]}
+- dạng VG: list (hoặc dict chứa list) các bản ghi {"image_id", "relationships": [{subject_id, predicate, object_id}]}
+Index image_id -> quan hệ và image_id -> annotation dựng 1 lần (tuyến tính theo số ảnh); mỗi quan hệ vẽ đúng 1 lần
+bằng draw_entry của data-cleaning/draw_vi_coco_relations.py (1 lượt trên buffer BGR, sprite chữ dùng lại).
+
+Sử dụng:
+  python visual_vg_format.py --images coco_uitvic_train --annot train.json --rel rel.json --split train --out outputs_train
+  python visual_vg_format.py --split val --annot datasets/val.json --rel datasets/rel.json --workers 0
+"""
 import os
+import sys
 import json
+import argparse
+from typing import Any, Dict, List, Tuple
+
 import cv2
-from PIL import ImageFont, ImageDraw, Image
-import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "data-cleaning"))
+from draw_vi_coco_relations import draw_entry, get_vietnamese_font, render_settings  # noqa: E402
+from render_manifest import RenderManifest, digest, plan, source_sig  # noqa: E402
 
 # === ĐƯỜNG DẪN ===
 IMG_DIR = "coco_uitvic_train"
 ANNOT_FILE = "train.json"
 REL_FILE = "rel.json"
 OUTPUT_DIR = "outputs_train"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# === ĐỌC ANNOTATION ===
-with open(ANNOT_FILE, "r", encoding="utf-8") as f:
-    ann_data = json.load(f)
-
-with open(REL_FILE, "r", encoding="utf-8") as f:
-    rel_data = json.load(f)
-
-# === MAPPING category_id → label ===
-catid2label = {
-    cat["id"]: cat["supercategory"] for cat in ann_data.get("categories", [])
-}
-
-# === TẠO MAPPING ảnh → annotation ===
-imgid2anns = {}
-for ann in ann_data["annotations"]:
-    img_id = ann["image_id"]
-    imgid2anns.setdefault(img_id, []).append(ann)
-
-imgid2file = {img["id"]: img["file_name"] for img in ann_data["images"]}
+FONT_SIZE = 20
+
+
+# === INDEX QUAN HỆ ===
+def build_rel_index(rel_data: Any, rel_split: str) -> Dict[int, List[Any]]:
+    """
+    image_id -> danh sách quan hệ, duyệt file quan hệ đúng 1 lần.
+    Phần tử là triplet [s_idx, o_idx, pred_id] (bố cục split) hoặc dict {subject_id, predicate, object_id} (bố cục VG).
+    """
+    index: Dict[int, List[Any]] = {}
+    if isinstance(rel_data, dict) and isinstance(rel_data.get(rel_split), dict):
+        for key, rels in rel_data[rel_split].items():
+            try:
+                index[int(key)] = rels
+            except ValueError:
+                continue
+        return index
+    lists = [rel_data] if isinstance(rel_data, list) else [v for v in (rel_data or {}).values() if isinstance(v, list)]
+    for items in lists:
+        for item in items:
+            if isinstance(item, dict) and item.get("image_id") is not None:
+                index.setdefault(int(item["image_id"]), []).extend(item.get("relationships", []) or [])
+    return index
+
+
+def build_entries(ann_data: Dict[str, Any], rel_index: Dict[int, List[Any]], rel_categories: List[str]):
+    """[(image_id, file_name, entry VG-like cho draw_entry)] cho mọi ảnh có quan hệ trong rel_index."""
+    catid2label = {cat["id"]: cat["supercategory"] for cat in ann_data.get("categories", [])}
+    imgid2anns: Dict[int, List[dict]] = {}
+    for ann in ann_data["annotations"]:
+        imgid2anns.setdefault(ann["image_id"], []).append(ann)
+    imgid2file = {img["id"]: img["file_name"] for img in ann_data["images"]}
+
+    def pred_name(p):
+        if isinstance(p, int):
+            return rel_categories[p] if 0 <= p < len(rel_categories) else str(p)
+        return str(p)
+
+    out = []
+    for image_id, rels in rel_index.items():
+        image_name = imgid2file.get(image_id)
+        if not image_name:
+            continue
+        anns = imgid2anns.get(image_id, [])
+        # object_id = chỉ số local (khớp triplet của rel.json); quan hệ kiểu VG tham chiếu id annotation gốc
+        ann_id2idx = {ann["id"]: k for k, ann in enumerate(anns)}
+        objects = [
+            {"object_id": k, "names": [catid2label.get(ann["category_id"], "unknown")],
+             "x": ann["bbox"][0], "y": ann["bbox"][1], "w": ann["bbox"][2], "h": ann["bbox"][3]}
+            for k, ann in enumerate(anns)
+        ]
+        relationships = []
+        for rel in rels:
+            if isinstance(rel, dict):
+                s, o = rel.get("subject_id"), rel.get("object_id")
+                s, o = ann_id2idx.get(s, s), ann_id2idx.get(o, o)
+                p = rel.get("predicate")
+            elif isinstance(rel, (list, tuple)) and len(rel) >= 3:
+                s, o, p = rel[0], rel[1], rel[2]
+            else:
+                print(f"⚠️ Bỏ qua quan hệ không hợp lệ của ảnh {image_id}: {rel}")
+                continue
+            relationships.append({"subject_id": s, "predicate": pred_name(p), "object_id": o})
+        out.append((image_id, image_name, {"image_id": image_id, "objects": objects, "relationships": relationships}))
+    return out
 
 
 # === VẼ ===
-def draw_visual_genome(img_path, objects, relationships, save_path=None):
+def render_one(img_path: str, entry: dict, save_path: str, font) -> bool:
     img = cv2.imread(img_path)
     if img is None:
         print(f"❌ Không tìm thấy ảnh: {img_path}")
-        return
-    img_pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    draw = ImageDraw.Draw(img_pil)
-
-    try:
-        font = ImageFont.truetype("arial.ttf", 20)
-    except:
-        font = ImageFont.load_default()
-
-    object_centers = {}
-
-    for obj in objects:
-        x, y, w, h = obj["x"], obj["y"], obj["w"], obj["h"]
-        label = obj["names"][0]
-        draw.rectangle([x, y, x + w, y + h], outline="red", width=3)
-        draw.text((x, max(y - 25, 0)), label, font=font, fill="yellow")
-        object_centers[obj["object_id"]] = (x + w // 2, y + h // 2)
-
-    rel_categories = rel_data.get("rel_categories", [])
-
-    for rel in relationships:
-        try:
-            sid = rel[0]
-            oid = rel[1]
-            pred_id = rel[2]
-            pred = rel_categories[pred_id] if pred_id < len(rel_categories) else str(pred_id)
-
-            subj = objects[sid]
-            obj = objects[oid]
-
-            x1, y1 = subj["x"] + subj["w"] // 2, subj["y"] + subj["h"] // 2
-            x2, y2 = obj["x"] + obj["w"] // 2, obj["y"] + obj["h"] // 2
-
-            draw.line([x1, y1, x2, y2], fill="blue", width=2)
-            mid = ((x1 + x2) // 2, (y1 + y2) // 2)
-            draw.text(mid, pred, font=font, fill="blue")
-        except Exception as e:
-            print(f"Lỗi khi vẽ quan hệ: {rel}, lỗi: {e}")
-
-        if sid in object_centers and oid in object_centers:
-            x1, y1 = object_centers[sid]
-            x2, y2 = object_centers[oid]
-            draw.line([x1, y1, x2, y2], fill="blue", width=2)
-            mid = ((x1 + x2) // 2, (y1 + y2) // 2)
-            draw.text(mid, pred, font=font, fill="blue")
-
-    img_result = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
-    if save_path:
-        cv2.imwrite(save_path, img_result)
-    else:
-        cv2.imshow("Image", img_result)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
-
-
-rel_split = "train"  # hoặc "val"
-rel_image_ids = list(rel_data[rel_split].keys())#[:5]
-
-# === CHẠY TRỰC QUAN CHO 5 ẢNH ===
-for image_id_str in rel_image_ids:
-    image_id = int(image_id_str)
-    # test trước 5 ảnh
-    if image_id_str == "rel_categories":
-        continue
-
-    image_id = int(image_id_str)
-    image_name = imgid2file.get(image_id)
-    if not image_name:
-        continue
-
-    img_path = os.path.join(IMG_DIR, image_name)
-    save_path = os.path.join(OUTPUT_DIR, image_name)
-
-    # Lấy annotation gốc
-    anns = imgid2anns.get(image_id, [])
-    objects = []
-    for ann in anns:
-        bbox = ann["bbox"]
-        cat_id = ann["category_id"]
-        label = catid2label.get(cat_id, "unknown")
-        objects.append(
-            {
-                "object_id": ann["id"],  # ID gốc trong annotation
-                "names": [label],
-                "x": bbox[0],
-                "y": bbox[1],
-                "w": bbox[2],
-                "h": bbox[3],
-            }
-        )
-
-    # Lấy quan hệ từ rel_test.json nếu có
-    rel_ann = next(
-        (
-            x
-            for x in rel_data.values()
-            if isinstance(x, list)
-            and any(isinstance(i, dict) and i.get("image_id") == image_id for i in x)
-        ),
-        None,
-    )
-    if isinstance(rel_ann, list):
-        relationships = rel_ann
-    else:
-        relationships = rel_data[rel_split].get(image_id_str, [])
-
-    draw_visual_genome(img_path, objects, relationships, save_path)
+        return False
+    cv2.imwrite(save_path, draw_entry(img, entry, font))
+    return True
+
+
+# === SONG SONG: mỗi worker nạp font 1 lần ===
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker():
+    _WORKER["font"] = get_vietnamese_font(size=FONT_SIZE)
+
+
+def _render_chunk(jobs: List[Tuple[str, dict, str]]) -> List[bool]:
+    return [render_one(img_path, entry, save_path, _WORKER["font"]) for img_path, entry, save_path in jobs]
+
+
+def run(jobs: List[Tuple[str, dict, str]], workers: int = 1) -> List[bool]:
+    """Vẽ jobs (img_path, entry, save_path); workers > 1 -> process pool (0 = số CPU). Trả về [đã lưu?] theo thứ tự."""
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        _init_worker()
+        return _render_chunk(jobs)
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from tqdm import tqdm
+
+    size = max(1, min(64, -(-len(jobs) // (workers * 8))))
+    chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    results: List[List[bool]] = [[] for _ in chunks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as ex:
+        futures = {ex.submit(_render_chunk, c): k for k, c in enumerate(chunks)}
+        with tqdm(total=len(jobs), desc="Vẽ ảnh", unit="ảnh") as bar:
+            for fut in as_completed(futures):
+                k = futures[fut]
+                results[k] = fut.result()
+                bar.update(len(chunks[k]))
+    return [ok for chunk in results for ok in chunk]
+
+
+def run_incremental(jobs: List[Tuple[str, dict, str]], output_dir: str, workers: int = 1,
+                    force: bool = False, limit: int = 0) -> Tuple[int, int, int]:
+    """
+    Như run, nhưng qua manifest trong output_dir: bỏ qua ảnh có annotation, ảnh nguồn và cấu hình vẽ không đổi;
+    xoá ảnh đầu ra của ảnh không còn trong dữ liệu. Trả về (số ảnh đầu ra hiện có, bỏ qua, xoá).
+    limit > 0: chỉ vẽ N job đầu; ảnh đầu ra của các job còn lại vẫn được giữ (không bị prune).
+    force: vẽ lại mọi job (không xét manifest) nhưng vẫn cập nhật manifest và xoá ảnh cũ.
+    """
+    manifest = RenderManifest(output_dir, render_settings(get_vietnamese_font(size=FONT_SIZE)))
+    items = [(os.path.basename(job[2]), digest(job[1]), source_sig(job[0]), job) for job in jobs]
+    todo, skipped, keep = plan(manifest, items[:limit] if limit > 0 else items, force)
+    keep = [it[0] for it in items]
+    results = run([it[3] for it in todo], workers)
+    failed = {it[0] for it, ok in zip(todo, results) if not ok}
+    for it, ok in zip(todo, results):
+        if ok:
+            manifest.record(it[0], it[1], it[2])
+    removed = manifest.prune(n for n in keep if n not in failed)
+    manifest.save()
+    return sum(results) + skipped, skipped, removed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Vẽ bbox + quan hệ từ COCO <split>.json + rel.json (hoặc quan hệ kiểu VG).")
+    ap.add_argument("--images", default=IMG_DIR, help="Thư mục ảnh")
+    ap.add_argument("--annot", default=ANNOT_FILE, help="File COCO (<split>.json)")
+    ap.add_argument("--rel", default=REL_FILE, help="rel.json (bố cục split) hoặc file quan hệ kiểu VG")
+    ap.add_argument("--split", default="train", help='Split trong rel.json ("train" hoặc "val")')
+    ap.add_argument("--out", default=OUTPUT_DIR, help="Thư mục lưu ảnh")
+    ap.add_argument("--limit", type=int, default=0, help="Chỉ vẽ N ảnh đầu (0 = tất cả)")
+    ap.add_argument("--workers", type=int, default=1, help="Số process vẽ song song (1 = tuần tự; 0 = số CPU)")
+    ap.add_argument("--force", action="store_true", help="Vẽ lại mọi ảnh (không xét manifest trong --out, vẫn cập nhật manifest)")
+    args = ap.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    # === ĐỌC ANNOTATION ===
+    with open(args.annot, "r", encoding="utf-8") as f:
+        ann_data = json.load(f)
+    with open(args.rel, "r", encoding="utf-8") as f:
+        rel_data = json.load(f)
+
+    rel_categories = rel_data.get("rel_categories", []) if isinstance(rel_data, dict) else []
+    entries = build_entries(ann_data, build_rel_index(rel_data, args.split), rel_categories)
+    jobs = [(os.path.join(args.images, name), entry, os.path.join(args.out, name)) for _, name, entry in entries]
+
+    n, skipped, removed = run_incremental(jobs, args.out, args.workers, args.force, args.limit)
+    total = min(args.limit, len(jobs)) if args.limit > 0 else len(jobs)
+    print(f"⏭️ Bỏ qua {skipped} ảnh đã cập nhật, xoá {removed} ảnh cũ")
+    print(f"✅ Đã lưu {n}/{total} ảnh vào: {args.out}")
+
+
+if __name__ == "__main__":
+    main()